@@ -50,6 +50,7 @@ def ParseCmdline(arglist:list[str]|None = None, *, debug_mode=False, ignore_inpu
     #group_system.add_argument("--autodelete", dest="autodelete", action="store_true", default=True, help="wipe the (temp) working directory after processing")
     group_system.add_argument("--noclean", dest="autodelete", action="store_false", help="preserve temp-files (deleted by default - ignore the following 'default' message)")
     group_system.add_argument('--nowrite', action="store_true", help="disables relocation of outputs to their final destinations")
+    group_system.add_argument('--nocache', dest="node_cache", action="store_false", help="don't reuse (or store) preprocessing results from earlier runs (see 'NodeCache.py')")
     # TODO: fix the display of '--noclean'/autodelete's default message
     
     # alternative non-positional form of 'output_dir' (useful when using '--rendertext' without an input-image)
@@ -76,6 +77,7 @@ def ParseCmdline(arglist:list[str]|None = None, *, debug_mode=False, ignore_inpu
     grp_transform.add_argument("--gravity", choices=("Center",*gravities), default="Center", help="anchoring of crop operation")
     grp_transform.add_argument("--scale", nargs=1, dest="scales", action="extend", metavar="{int[%]|float[x]}")
     grp_transform.add_argument("--scales", nargs='+', action="extend", default=[], metavar="{int[%]|float[x]}", help=scale_help)
+    grp_transform.add_argument("--late-scale", action="store_true", help="preprocess at full-size (even when every scale is below 100%%), and generate every scale's frames instead of downscaling them (bit-exact with earlier versions; slower)")
     
     group_recolor.description = textwrap.dedent("""\
         keep in mind that each library interprets Alpha-channel values differently.
@@ -118,13 +120,28 @@ def ParseCmdline(arglist:list[str]|None = None, *, debug_mode=False, ignore_inpu
     maxframesargs.add_argument("--framecap", type=int, metavar='(int)', help="limit the number of frames in output")
     maxframesargs.add_argument("--duration", type=int, metavar='(int)', help="specifies number of frames in output")
     
-    valid_fileformats = FormatList("GIF", "MP4", "APNG", "WEBP", "ALL")
+    valid_fileformats = FormatList("GIF", "MP4", "APNG", "WEBP", "ALL", "SHEET") # 'ALL' is every animated format
     group_output.add_argument("--format", dest="output_formats", metavar="fmt",
         choices=valid_fileformats, nargs='+', action='append', default=["GIF"],
         help=f"list of output formats: {valid_fileformats}\n"
         +"names can be in lowercase and may have a leading dot ('.gif')\n"
         +"animated WebP specifically requires ImageMagick (--magick=IM)\n"
-        +"MP4 and APNG outputs require ffmpeg"
+        +"MP4 and APNG outputs require ffmpeg\n"
+        +"SHEET is a spritesheet (PNG) of every frame, with a json frame-index"
+    )
+    group_output.add_argument("--render-preset", choices=("fast", "balanced", "max"), default="balanced",
+        help="encoder-effort for every output format (WebP, MP4, APNG) and PNG intermediates;\n"
+        +"'fast' trades file-size (and lossless WebP) for latency. see the table in 'Presets.py'"
+    )
+    group_output.add_argument("--preview", action="store_true",
+        help="quickly render a small, low-color GIF (or SHEET) with the same options (longest side: 320px, 12 evenly spaced rotations of the full cycle)"
+    )
+    group_output.add_argument("--gif-writer", action="store_true",
+        help="encode the palette-mapped GIF frames in one magick process per core, then splice them (GifWriter.py; requires numpy).\n"
+        +"each frame gets a local color-table (up to 768 bytes)"
+    )
+    group_output.add_argument("--webp-effort", type=int, choices=range(0, 7), metavar="{0..6}",
+        help="compression-effort for animated WebP (libwebp 'method'); lower is faster, with larger files. overrides the render-preset"
     )
     
     valid_frameformats = FormatList('MPC','MIFF')
@@ -141,6 +158,27 @@ def ParseCmdline(arglist:list[str]|None = None, *, debug_mode=False, ignore_inpu
             for MPC, I recommended allocating at least 32GB RAM for your tmpfs; 24GB minimum!
             \b""") # prevents an annoying space being inserted before (default: )
     )
+    parser.add_argument("--tempcompress",
+        choices=("auto", "on", "off"), nargs='?', const="on", default="auto",
+        help=textwrap.dedent("""\
+            write intermediate frame-sets as zlib-compressed MIFF (lossless).
+            'auto' measures disk throughput against idle CPU and decides;
+            never enabled on tmpfs. implies '--tempformat MIFF'.
+            \b""")
+    )
+    parser.add_argument("--no-kernels", dest="kernels", action="store_false",
+        help=textwrap.dedent("""\
+            always preprocess with magick-command chains, even when numpy is available
+            (the numpy kernels in 'Kernels.py' reimplement them; results may differ slightly).
+            \b""")
+    )
+    parser.add_argument("--tile-size", type=int, metavar="PX",
+        help=textwrap.dedent("""\
+            process still images in overlapping PXxPX tiles (numpy kernels only),
+            so memory-usage is bounded by the tile-size instead of the image.
+            default: 1024 for images above 64 megapixels; 0 disables tiling.
+            \b""")
+    )
     
     rendertext_help = textwrap.dedent("""\
         string to render (should be single-quoted)
@@ -230,6 +268,11 @@ def ParseCmdline(arglist:list[str]|None = None, *, debug_mode=False, ignore_inpu
     if ("ALL" in parsed_args.output_formats):
         lastindex = (3 if (parsed_args.magick == "GM") else 4) # GM won't include 'WEBP'
         parsed_args.output_formats = [fmt.upper() for fmt in valid_fileformats[:lastindex]]
+    if (parsed_args.preview and any([(F not in ("GIF", "SHEET")) for F in parsed_args.output_formats])): # GIF and/or spritesheet (see 'Presets.PREVIEW_MAX_DIMENSION')
+        print(f"[PREVIEW] only GIF or SHEET; ignoring: {[F for F in parsed_args.output_formats if (F not in ('GIF', 'SHEET'))]}")
+        parsed_args.output_formats = ([F for F in parsed_args.output_formats if (F in ("GIF", "SHEET"))] or ["GIF"])
+    if parsed_args.preview: # low-latency; no disk-probe ('--tempcompress auto') or node-cache hashing for a throwaway render
+        (parsed_args.tempcompress, parsed_args.node_cache) = ("off", False)
     print(f"selected output-filetypes: {parsed_args.output_formats}")
     
     if (("WEBP" in (formats := parsed_args.output_formats)) and (parsed_args.magick == "GM")):
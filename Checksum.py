@@ -0,0 +1,73 @@
+import pathlib
+import hashlib
+import mmap
+import json
+import os
+
+import Globals
+
+# maps (path, size, mtime, inode) -> digest; lets unchanged inputs skip rehashing on every run
+DIGEST_CACHE_PATH = Globals.PROGRAM_DIR / "digest_cache.json"
+DIGEST_CACHE_LIMIT = 512 # oldest entries are dropped past this count
+CHUNK_SIZE = (16 * 1024 * 1024) # bytes hashed per 'update'
+
+# workdir names only carry a prefix of the digest (readability); the full digest is kept in 'Globals.INPUT_DIGEST'
+# 16 hex-chars (64 bits) is wide enough that collisions between inputs aren't a practical concern (8 was not)
+WORKDIR_PREFIX_LENGTH = 16
+
+
+def NewDigest(): return hashlib.blake2b(digest_size=32); # BLAKE2b: faster than md5/sha256 on 64-bit hardware
+
+
+def HashBytes(data:bytes) -> str:
+    digest = NewDigest(); digest.update(data)
+    return digest.hexdigest()
+
+
+def HashFile(filepath:pathlib.Path, chunk_size:int=CHUNK_SIZE) -> str:
+    """ hashes file in-process over a memory-map (no 'md5sum' subprocess, no copies of the file-contents) """
+    digest = NewDigest()
+    with filepath.open(mode='rb') as file:
+        if ((filesize := os.fstat(file.fileno()).st_size) == 0): return digest.hexdigest(); # empty files can't be mapped
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view: # slicing a memoryview does not copy; slicing the mmap would
+                for offset in range(0, filesize, chunk_size): digest.update(view[offset:offset+chunk_size]);
+    return digest.hexdigest()
+
+
+def FileKey(filepath:pathlib.Path) -> tuple[str, list[int]]:
+    """ :return: cache-key (resolved path) and the stat-fields that must match for a cached digest to be valid """
+    stat = filepath.stat()
+    return (str(filepath.resolve()), [stat.st_size, stat.st_mtime_ns, stat.st_ino])
+
+
+def LoadDigestCache(cache_path:pathlib.Path=DIGEST_CACHE_PATH) -> dict:
+    if not cache_path.exists(): return {};
+    try:
+        with cache_path.open(mode='r', encoding='utf-8') as cache_file: return json.load(cache_file);
+    except (json.JSONDecodeError, OSError) as E: print(f"[WARNING] discarding unreadable digest-cache ({E})"); return {};
+
+
+def SaveDigestCache(cache:dict, cache_path:pathlib.Path=DIGEST_CACHE_PATH):
+    if (len(cache) > DIGEST_CACHE_LIMIT): # dicts preserve insertion order; the most recently refreshed entries are last
+        cache = dict([*cache.items()][-DIGEST_CACHE_LIMIT:])
+    temp_path = cache_path.with_name(f"{cache_path.name}.tmp")
+    with temp_path.open(mode='w', encoding='utf-8') as cache_file: json.dump(cache, cache_file, indent=1);
+    temp_path.replace(cache_path) # atomic; concurrent runs never see a partially written cache
+    return
+
+
+def CachedDigest(filepath:pathlib.Path, cache_path:pathlib.Path=DIGEST_CACHE_PATH) -> str:
+    """ returns full-width digest of file, reusing the cached value if path/size/mtime/inode are unchanged """
+    (key, fingerprint) = FileKey(filepath)
+    cache = LoadDigestCache(cache_path)
+    if ((entry := cache.pop(key, None)) is not None) and (entry.get("stat") == fingerprint):
+        print(f"digest-cache hit: '{filepath.name}'")
+        digest = entry["digest"]
+    else:
+        print(f"hashing input: '{filepath.name}' ({fingerprint[0]} bytes)")
+        digest = HashFile(filepath)
+    cache[key] = {"stat": fingerprint, "digest": digest} # re-inserted at the end (most recent)
+    SaveDigestCache(cache, cache_path)
+    return digest
@@ -17,6 +17,11 @@ example_config = {
     
     "MAIN_OPTIONS": {
         "log_limit": 2, # rotations until deletion
+        "spill_dir": None, # disk-backed directory for frame-directories that don't fit on tmpfs (default: 'RGB_TOPLEVEL_SPILL' under program-directory)
+        "gc_budget": "32GB", # total size of workdirs under RGB_TOPLEVEL; least-recently-used are evicted (null: unlimited)
+        "gc_max_age_days": 7, # workdirs unused for longer are always evicted (null: never)
+        "node_cache_dir": None, # persistent cache of preprocessing results, shared by every workdir (default: 'RGB_NODE_CACHE' under program-directory)
+        "node_cache_budget": "8GB", # least-recently-used node-cache entries are evicted past this size (null: unlimited)
     },
     
     # these values are set if var is not already defined in env
@@ -116,8 +121,9 @@ def ApplyConfig(config:dict) -> (bool, tuple):
     cmdline_args = config.get("CMDLINE_ARGS", [])
     debug_flags  = config.get("DEBUG_FLAGS",  [])
     
-    if ("log_limit" not in main_options.keys()):
-        main_options["log_limit"] = example_config["MAIN_OPTIONS"]["log_limit"]
+    for option in ("log_limit", "spill_dir", "gc_budget", "gc_max_age_days", "node_cache_dir", "node_cache_budget"):
+        if (option not in main_options.keys()):
+            main_options[option] = example_config["MAIN_OPTIONS"][option]
     
     try: Globals.ApplyDebugFlags(debug_flags);
     except NameError as FAILURE: success = False; print(FAILURE);
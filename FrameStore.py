@@ -0,0 +1,110 @@
+import pathlib
+import subprocess
+import mmap
+import json
+import sys
+
+import Kernels
+
+# headerless raw-RGBA frame store: every frame of a frame-set in one memory-mapped file (8-bit RGBA, frames back-to-back)
+# a small sidecar ('<store>.json') describes the geometry. Replaces the 'png_frames' directories that fed ffmpeg;
+# magick writes the store in a single command (RGBA with '-adjoin'), and ffmpeg reads it back as rawvideo through a pipe.
+
+CHANNELS = 4 # RGBA, one byte each ('-depth 8')
+
+
+class FrameStoreT():
+    def __init__(self, store_path:pathlib.Path):
+        self.path = store_path
+        self.sidecar = store_path.with_name(f"{store_path.name}.json")
+        self.width = 0
+        self.height = 0
+        self.frame_count = 0
+        self._file = None
+        self._mmap = None
+        if self.sidecar.exists(): self.LoadSidecar();
+        return
+    
+    @property
+    def frame_size(self) -> int: return (self.width * self.height * CHANNELS);
+    
+    def LoadSidecar(self):
+        with self.sidecar.open(mode='r', encoding='utf-8') as sidecar_file: info = json.load(sidecar_file);
+        (self.width, self.height, self.frame_count) = (info["width"], info["height"], info["frame_count"])
+        assert(info.get("pix_fmt", "rgba") == "rgba"), f"unsupported pix_fmt in '{self.sidecar.name}'";
+        return
+    
+    def WriteSidecar(self):
+        info = {"width": self.width, "height": self.height, "frame_count": self.frame_count, "pix_fmt": "rgba"}
+        with self.sidecar.open(mode='w', encoding='utf-8') as sidecar_file: json.dump(info, sidecar_file, indent=2);
+        return
+    
+    def Describe(self, library:str, probe_frame:str):
+        """ writes sidecar for a store produced by magick ('-adjoin RGBA:...'), which can't describe itself; the store is rewritten every run, so this is too.
+        :param library: magick that wrote the probe-frame; an IM-written MPC can't be read by GraphicsMagick
+        :param probe_frame: any (format-prefixed) frame of the source frame-set; only its geometry is read """
+        (self.width, self.height) = Kernels.Geometry(library, probe_frame.strip("'"))
+        (self.frame_count, remainder) = divmod(self.path.stat().st_size, self.frame_size)
+        assert(remainder == 0), f"store size is not a multiple of {self.width}x{self.height} RGBA frames: '{self.path}'";
+        self.WriteSidecar()
+        return
+    
+    def Open(self) -> mmap.mmap:
+        if (self._mmap is not None): return self._mmap;
+        self._file = self.path.open(mode='rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+    
+    def Close(self):
+        if (self._mmap is not None): self._mmap.close(); self._mmap = None;
+        if (self._file is not None): self._file.close(); self._file = None;
+        return
+    
+    def __enter__(self): return self;
+    def __exit__(self, *_): self.Close();
+    
+    def Frame(self, index:int) -> memoryview:
+        """ zero-copy view of a single frame (release the view before calling 'Close') """
+        assert((index >= 0) and (index < self.frame_count)), f"frame index out of range: {index}";
+        offset = (index * self.frame_size)
+        return memoryview(self.Open())[offset:offset+self.frame_size]
+
+
+def WriteCommand(frame_glob:str, store_path:pathlib.Path) -> str:
+    """ magick command converting a frame-set (quoted glob with format-prefix) into a raw store """
+    return f"convert {frame_glob} -depth 8 -adjoin 'RGBA:{store_path}'"
+
+
+def EncodeCommand(library:str, store_path:pathlib.Path, probe_frame:str, framerate:int, output_args:str) -> str:
+    """ shell command piping a store into ffmpeg as rawvideo (see 'PipeToEncoder')
+    :param probe_frame: quoted path of a frame with matching geometry (from 'QuoteSource') """
+    return f"'{sys.executable}' '{pathlib.Path(__file__).absolute()}' {library} '{store_path}' {probe_frame} {framerate} -- {output_args}"
+
+
+def PipeToEncoder(store:FrameStoreT, framerate:int, output_args:list[str]) -> int:
+    """ streams every frame of the store into ffmpeg's stdin straight from the memory-map """
+    ffmpeg_cmd = [
+        "ffmpeg", "-hide_banner", "-nostdin", "-y",
+        "-f", "rawvideo", "-pix_fmt", "rgba",
+        "-video_size", f"{store.width}x{store.height}",
+        "-framerate", str(framerate), "-thread_queue_size", "1024", "-i", "-", *output_args,
+    ]
+    print(f"encoding {store.frame_count} frames from: '{store.path.name}'\n  {' '.join(ffmpeg_cmd)}")
+    with subprocess.Popen(ffmpeg_cmd, stdin=subprocess.PIPE) as encoder:
+        try:
+            with store:
+                for index in range(store.frame_count):
+                    with store.Frame(index) as frame: encoder.stdin.write(frame);
+        except BrokenPipeError: print("[ERROR] encoder closed its input early");
+        finally: encoder.stdin.close();
+    return encoder.returncode
+
+
+if __name__ == "__main__":
+    # usage: FrameStore.py {IM,GM} STORE PROBE_FRAME FRAMERATE -- [ffmpeg output args]
+    (library, store_arg, probe_frame, framerate) = sys.argv[1:5]
+    assert(library in ("IM", "GM")), f"invalid library: {library}";
+    assert(sys.argv[5] == "--"), "expected '--' before ffmpeg output args";
+    store = FrameStoreT(pathlib.Path(store_arg))
+    store.Describe(library, probe_frame) # always; a reused workdir ('--noclean') may hold the sidecar of a store with other geometry/frame-count
+    exit(PipeToEncoder(store, int(framerate), sys.argv[6:]))
@@ -0,0 +1,122 @@
+import pathlib
+import subprocess
+import struct
+import time
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import Kernels
+
+# animated-GIF writer for frames already mapped to the global palette ('Palette.py map')
+# magick's GIF coder LZW-compresses every frame on a single core (inside 'convert ... -adjoin'); GIF frames are independent LZW streams,
+# so the frames are split into one contiguous chunk per core, each chunk is encoded by its own magick process (its LZW-encoder is C),
+# and the encoded frames are spliced in order into a single GIF. Each frame keeps the color-table magick wrote for it (as a local table);
+# every chunk was remapped to the same palette, so the colors agree across chunks.
+# the settings match 'RGB.argstr_GIF': '-dispose None', no dithering, the task's '-delay', and infinite looping (magick's default)
+# invoked from the rendering commands: 'GifWriter.py LIBRARY PALETTE DELAY FRAMES OUTPUT'
+
+DISPOSAL_NONE = 1 # '-dispose None'; each frame is drawn over the previous one (transparent pixels show it through, as with magick)
+LOOP_FOREVER = 0 # NETSCAPE2.0 loop-count
+EXTENSION, IMAGE, TRAILER = (0x21, 0x2C, 0x3B)
+GRAPHIC_CONTROL = 0xF9
+
+
+class FrameT():
+    """ one encoded image of a GIF: its descriptor, color-table, and LZW-data (code-size byte and sub-blocks, terminator included) """
+    def __init__(self, left:int, top:int, width:int, height:int, interlaced:bool, color_table:bytes, lzw_data:bytes, transparent:int|None):
+        (self.left, self.top, self.width, self.height, self.interlaced) = (left, top, width, height, interlaced)
+        self.color_table = color_table
+        self.lzw_data = lzw_data
+        self.transparent = transparent
+        return
+    
+    def Block(self, delay:int) -> bytes:
+        """ graphic-control extension (delay/disposal/transparency) and the image-descriptor, with the color-table as a local table """
+        flags = ((DISPOSAL_NONE << 2) | (1 if (self.transparent is not None) else 0))
+        control = b"\x21\xF9\x04" + struct.pack("<BHB", flags, delay, (self.transparent or 0)) + b"\x00"
+        table_bits = max(1, ((len(self.color_table) // 3) - 1).bit_length())
+        descriptor = struct.pack("<BHHHHB", IMAGE, self.left, self.top, self.width, self.height, (0x80 | (0x40 if self.interlaced else 0) | (table_bits - 1)))
+        return control + descriptor + self.color_table.ljust(3 * (1 << table_bits), b'\x00') + self.lzw_data
+
+
+def SubBlocks(data:bytes, position:int) -> tuple[bytes,int]:
+    """ :return: the concatenated contents of the sub-blocks starting at position, and the position after their terminator """
+    contents = bytearray()
+    while (size := data[position]): contents += data[(position + 1):(position + 1 + size)]; position += (1 + size);
+    return (bytes(contents), (position + 1))
+
+
+def ParseGIF(data:bytes) -> tuple[tuple[int,int],list[FrameT]]:
+    """ :return: logical-screen size, and every image (frames without a local table get the global table) """
+    assert(data[:6] in (b"GIF87a", b"GIF89a")), "not a GIF";
+    (width, height, flags) = struct.unpack_from("<HHB", data, 6)
+    position = 13; global_table = b''
+    if (flags & 0x80): global_table = data[position:(position + 3 * (2 << (flags & 0x07)))]; position += len(global_table);
+    frames = []; transparent = None
+    while ((block := data[position]) != TRAILER):
+        if (block == EXTENSION):
+            (contents, end) = SubBlocks(data, (position + 2))
+            if ((data[position + 1] == GRAPHIC_CONTROL) and (contents[0] & 0x01)): transparent = contents[3];
+            position = end; continue
+        assert(block == IMAGE), f"unexpected GIF block: {block:#04x}";
+        (left, top, frame_width, frame_height, frame_flags) = struct.unpack_from("<HHHHB", data, (position + 1))
+        position += 10; color_table = global_table
+        if (frame_flags & 0x80): color_table = data[position:(position + 3 * (2 << (frame_flags & 0x07)))]; position += len(color_table);
+        (_, end) = SubBlocks(data, (position + 1))
+        frames.append(FrameT(left, top, frame_width, frame_height, bool(frame_flags & 0x40), color_table, data[position:end], transparent))
+        (position, transparent) = (end, None)
+    return ((width, height), frames)
+
+
+def Chunks(frames:list[pathlib.Path], count:int) -> list[list[pathlib.Path]]:
+    """ splits frames into (at most) count contiguous, similarly-sized chunks """
+    count = max(1, min(count, len(frames)))
+    return [frames[((I * len(frames)) // count):(((I + 1) * len(frames)) // count)] for I in range(count)]
+
+
+def EncodeChunk(library:str, palette_path:pathlib.Path, frame_format:str, frames:list[pathlib.Path]) -> bytes:
+    """ :return: the GIF written by magick for these frames (remapped to the palette-image; every color is an exact match) """
+    remap = (["-remap", str(palette_path)] if (library == "IM") else ["-map", str(palette_path)])
+    encoded = subprocess.run([*Kernels.MagickCommand(library, "convert"), *[f"{frame_format}:{F}" for F in frames], "+dither", *remap, "-adjoin", "GIF:-"],
+        check=True, capture_output=True)
+    return encoded.stdout
+
+
+def Assemble(chunks, delay:int, output_path:pathlib.Path) -> int:
+    """ splices the frames of every encoded chunk (in order) into one looping GIF; written to a temporary name, then renamed
+    :param chunks: iterable of encoded GIFs
+    :return: frame-count """
+    temp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}")
+    frame_count = 0
+    with temp_path.open(mode='wb') as gif_file:
+        for ((width, height), frames) in map(ParseGIF, chunks):
+            if (frame_count == 0): gif_file.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0, 0, 0) + b"\x21\xFF\x0BNETSCAPE2.0\x03\x01" + struct.pack("<H", LOOP_FOREVER) + b"\x00");
+            for frame in frames: gif_file.write(frame.Block(delay));
+            frame_count += len(frames)
+        gif_file.write(bytes([TRAILER]))
+    temp_path.replace(output_path)
+    return frame_count
+
+
+def WriteGIF(library:str, palette_path:pathlib.Path, delay:int, frames_spec:str, output_path:pathlib.Path):
+    (frame_format, frame_glob) = Kernels.ParseSpec(frames_spec)
+    frames = sorted(frame_glob.parent.glob(frame_glob.name))
+    assert(len(frames) > 0), f"no frames matching '{frames_spec}'";
+    started = time.perf_counter()
+    chunks = Chunks(frames, (os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool: # the work is in the magick subprocesses
+        frame_count = Assemble(pool.map(EncodeChunk, [library] * len(chunks), [palette_path] * len(chunks), [frame_format] * len(chunks), chunks), delay, output_path)
+    print(f"[GifWriter] {frame_count} frames ({len(chunks)} chunks) in {time.perf_counter() - started:.2f}s -> {output_path.name}")
+    return
+
+
+def EncodeCommand(library:str, palette_path:pathlib.Path, delay:int, frames_spec:str, output_path:pathlib.Path) -> str:
+    return f"'{sys.executable}' '{pathlib.Path(__file__).absolute()}' {library} '{palette_path}' {delay} {frames_spec} '{output_path}'"
+
+
+if __name__ == "__main__":
+    # usage: GifWriter.py {IM,GM} PALETTE DELAY FRAMES OUTPUT
+    (library, palette_path, delay, frames_spec, output_path) = sys.argv[1:6]
+    assert(library in ("IM", "GM")), f"invalid library: {library}";
+    WriteGIF(library, pathlib.Path(palette_path), int(delay), frames_spec, pathlib.Path(output_path))
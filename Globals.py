@@ -12,9 +12,11 @@ MAGICKLIBRARY = "GM" # GM/IM
 WORKING_DIR:Path|None = None
 SRCIMG_PATH:Path|None = None
 LOGGING_DIR:Path|None = None
+INPUT_DIGEST:str|None = None # full-width hash of input-image (see 'Checksum.py'); workdir-name only has a prefix
 
 # global reference to prevent tempdir from deleting itself instantly
 TEMPDIR_REF:TemporaryDirectory|Path|None = None
+WORKDIR_LOCK = None # open lockfile marking WORKING_DIR as in-use (see 'Storage.LockWorkdir')
 
 # these flags may be set by 'ApplyDebugFlags' or 'ApplyConfig' (Config.py)
 # once a flag has been set (True), 'ApplyDebugFlags' will never disable it
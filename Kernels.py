@@ -0,0 +1,459 @@
+import pathlib
+import subprocess
+import json
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# in-process (numpy) replacements for chains of magick commands in 'Task.ImagePreprocess' (color-remap, edge-highlight)
+# and for the per-frame modulation of separately-rotated layers in 'Task.GenerateFrames' (alternate stepsizes)
+# each chain normally writes and re-reads a full-size intermediate per command; a kernel decodes its source once,
+# computes the whole chain in a single vectorized pass, and encodes the result once. Magick is only used for (de)coding.
+# invoked as an external command from the preprocessing pipeline: 'Kernels.py KERNEL LIBRARY [args] SOURCE SINK'
+# SOURCE/SINK are quoted-format specs ('MIFF:path'); a multisource spec is a frame-glob ('MIFF:dir/frame*.miff')
+# tiled mode ('tile=SIZE', see 'TileSize'): huge images are decoded once into a memory-mapped raw file, processed in overlapping tiles
+# on the thread-pool, and stitched into a second raw file that is encoded once; peak memory is set by the tile-size instead of the image.
+# the raw files go to the scratch-directory (disk-backed, when the workdir is tmpfs; see 'SCRATCH_VARIABLE'), and magick's pixel-cache
+# (which holds the whole image while decoding/encoding) is limited to the size of the tiles in flight; the rest of it is a file there too
+
+try: import numpy # optional: without it, Task falls back to the magick-command chains
+except ImportError: numpy = None;
+
+AVAILABLE = (numpy is not None)
+QUANTUM = 65535 # raw samples are exchanged with magick at '-depth 16'
+RAW_FORMAT = ["-depth", "16", "-endian", "MSB"]
+DEFAULT_TILE_SIZE = 1024 # pixels (edge-length); every worker holds a few float32 copies of one tile (~16MB each)
+TILED_MIN_PIXELS = (64 * 1024 * 1024) # images above this are tiled automatically; a whole-image float32 copy is 1GB
+SCRATCH_VARIABLE = "RGB_SCRATCH_DIR" # environment; directory for the raw files of tiled mode (default: the sink's directory)
+PIXEL_CACHE_MINIMUM = (64 << 20) # bytes; lower bound of magick's memory-limit in tiled mode
+
+
+def MagickCommand(library:str, name:str) -> list[str]:
+    return (["gm", name] if (library == "GM") else [f"{name}-im6.q16"])
+
+
+def ParseSpec(spec:str) -> tuple[str,pathlib.Path]:
+    (image_format, path) = spec.strip("'").split(':', maxsplit=1)
+    return (image_format, pathlib.Path(path))
+
+
+def ExpandFrames(source_spec:str, sink_spec:str) -> list[tuple[str,str]]:
+    """ pairs every frame matching the source-glob with the frame of the same name in the sink-directory
+    (duplicate frames were never written for either side, so both sets line up) """
+    ((source_fmt, source_glob), (sink_fmt, sink_glob)) = (ParseSpec(source_spec), ParseSpec(sink_spec))
+    if ('*' not in source_glob.name): return [(f"{source_fmt}:{source_glob}", f"{sink_fmt}:{sink_glob}")];
+    sink_suffix = sink_glob.suffix
+    return [
+        (f"{source_fmt}:{frame}", f"{sink_fmt}:{sink_glob.parent / frame.with_suffix(sink_suffix).name}")
+        for frame in sorted(source_glob.parent.glob(source_glob.name))
+    ]
+
+
+def Geometry(library:str, spec:str) -> tuple[int,int]:
+    """ :return: (width, height) """
+    identify = subprocess.run([*MagickCommand(library, "identify"), "-ping", "-format", "%w %h\n", spec], check=True, capture_output=True, encoding="utf-8")
+    (width, height) = [int(D) for D in identify.stdout.splitlines()[0].split()]
+    return (width, height)
+
+
+def Quantize(pixels): return numpy.rint(numpy.clip(pixels, 0, 1) * QUANTUM).astype('>u2');
+
+
+def ReadRGBA(library:str, spec:str):
+    """ :return: float32 array (height, width, 4) normalized to [0,1]; straight (non-premultiplied) alpha """
+    (width, height) = Geometry(library, spec)
+    decoded = subprocess.run([*MagickCommand(library, "convert"), spec, "-matte", *RAW_FORMAT, "RGBA:-"], check=True, capture_output=True)
+    pixels = numpy.frombuffer(decoded.stdout, dtype='>u2').reshape(height, width, 4)
+    return (pixels.astype(numpy.float32) / QUANTUM)
+
+
+def WriteRGBA(library:str, pixels, spec:str, options:list[str]=()):
+    (height, width) = pixels.shape[:2]
+    subprocess.run([*MagickCommand(library, "convert"), "-size", f"{width}x{height}", *RAW_FORMAT, "RGBA:-", *options, spec], check=True, input=Quantize(pixels).tobytes())
+    return
+
+
+def TileSize(pixels:int, requested:int|None) -> int|None:
+    """ :param requested: '--tile-size'; 0 disables tiling, None decides by image size
+    :return: tile edge-length, or None for whole-image kernels """
+    if (requested is not None): return (requested or None);
+    return (DEFAULT_TILE_SIZE if (pixels > TILED_MIN_PIXELS) else None)
+
+
+def TileArg(tile_size:int|None) -> str: return (f" tile={tile_size}" if tile_size else '');
+def WriteArg(options:list[str]) -> str: return (f" write={','.join(options)}" if options else ''); # magick-options for writing the sink ('--tempcompress')
+
+
+def ScratchDirectory(sink_path:pathlib.Path) -> pathlib.Path:
+    return (pathlib.Path(scratch) if (scratch := os.environ.get(SCRATCH_VARIABLE)) else sink_path.parent)
+
+
+def PixelCacheEnvironment(tile_size:int, scratch_dir:pathlib.Path) -> dict[str,str]:
+    """ environment for magick (de)coding a whole tiled image: its pixel-cache is limited to about one tile per worker,
+    and the remainder is cached on disk in scratch_dir (IM/GM-style variables, see 'main.SetupENV') """
+    limit = f"{max(PIXEL_CACHE_MINIMUM, (tile_size * tile_size * 8 * (os.cpu_count() or 1))) >> 20}MB"
+    return {
+        **os.environ, **{V: limit for V in ("MAGICK_MEMORY_LIMIT", "MAGICK_LIMIT_MEMORY", "MAGICK_MAP_LIMIT", "MAGICK_LIMIT_MAP")},
+        "MAGICK_TEMPORARY_PATH": str(scratch_dir), "MAGICK_TMPDIR": str(scratch_dir),
+    }
+
+
+class RasterT():
+    """ 16-bit RGBA image in a raw file, memory-mapped; only the pages of the tiles being processed are resident """
+    def __init__(self, path:pathlib.Path, width:int, height:int, mode:str='r'):
+        (self.path, self.width, self.height) = (path, width, height)
+        self.pixels = numpy.memmap(path, dtype='>u2', mode=mode, shape=(height, width, 4))
+        return
+    
+    @classmethod
+    def Decode(cls, library:str, spec:str, path:pathlib.Path, tile_size:int):
+        (width, height) = Geometry(library, spec)
+        subprocess.run([*MagickCommand(library, "convert"), spec, "-matte", *RAW_FORMAT, f"RGBA:{path}"], check=True, env=PixelCacheEnvironment(tile_size, path.parent))
+        return cls(path, width, height)
+    
+    def Read(self, rows:slice, columns:slice): return (self.pixels[rows, columns].astype(numpy.float32) / QUANTUM);
+    
+    def Encode(self, library:str, spec:str, tile_size:int, options:list[str]=()):
+        self.pixels.flush()
+        subprocess.run([*MagickCommand(library, "convert"), "-size", f"{self.width}x{self.height}", *RAW_FORMAT, f"RGBA:{self.path}", *options, spec],
+            check=True, env=PixelCacheEnvironment(tile_size, self.path.parent))
+        return
+    
+    def Release(self):
+        del self.pixels
+        self.path.unlink(missing_ok=True)
+        return
+
+
+def TileGrid(width:int, height:int, tile_size:int, overlap:int) -> list[tuple[tuple[slice,slice],tuple[slice,slice]]]:
+    """ :return: for every tile; the (rows, columns) read, including 'overlap' pixels of context on each side (clipped to the image),
+    and the (rows, columns) written """
+    tiles = []
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            (bottom, right) = (min(height, top + tile_size), min(width, left + tile_size))
+            region = (slice(max(0, top - overlap), min(height, bottom + overlap)), slice(max(0, left - overlap), min(width, right + overlap)))
+            tiles.append((region, (slice(top, bottom), slice(left, right))))
+    return tiles
+
+
+def RenderTiles(render, sink:RasterT, tile_size:int, overlap:int, pool:ThreadPoolExecutor):
+    """ fills sink tile-by-tile; render(rows, columns) returns the (float) pixels of that region """
+    def RenderTile(tile:tuple[tuple[slice,slice],tuple[slice,slice]]):
+        ((rows, columns), (tile_rows, tile_columns)) = tile
+        rendered = render(rows, columns)
+        sink.pixels[tile_rows, tile_columns] = Quantize(rendered[
+            (tile_rows.start - rows.start):(tile_rows.stop - rows.start), (tile_columns.start - columns.start):(tile_columns.stop - columns.start)])
+        return
+    [*pool.map(RenderTile, TileGrid(sink.width, sink.height, tile_size, overlap))]
+    return
+
+
+def ScratchPath(sink_path:pathlib.Path, name:str) -> pathlib.Path: return ScratchDirectory(sink_path) / f".{name}.{os.getpid()}.rgba";
+
+
+def ParseColor(hexcolor:str|int, library:str):
+    """ '0xRRGGBBAA' (as produced by CLI; already in the library's alpha-convention) -> normalized RGBA
+    GraphicsMagick's 'AA' is opacity (00: opaque), ImageMagick's is alpha (FF: opaque) """
+    value = (hexcolor if isinstance(hexcolor, int) else int(hexcolor, 16))
+    channels = numpy.array([((value >> shift) & 0xFF) for shift in (24, 16, 8, 0)], dtype=numpy.float32) / 255
+    if (library == "GM"): channels[3] = (1 - channels[3]);
+    return channels
+
+
+IM_FUZZ_MINIMUM = (0.5 ** 0.5) / QUANTUM # 'MagickSQ1_2'; IM6 never compares with less fuzz than half a quantum
+
+def ColorMatch(pixels, target, fuzz:float, library:str):
+    """ '-fuzz N% -opaque COLOR' matching (target is opaque). GM compares RGB only.
+    IM6 ('IsMagickColorSimilar'): rejects an alpha-difference above fuzz, then compares 3x the squared alpha-difference,
+    plus the squared RGB-distance weighted by alpha, against 3x fuzz squared; a fully transparent pixel matches on alpha alone """
+    if (library == "IM"):
+        fuzz_squared = numpy.square(max(fuzz, IM_FUZZ_MINIMUM))
+        alpha_distance = numpy.square(target[3] - pixels[..., 3])
+        distance = (3 * alpha_distance) + (pixels[..., 3] * numpy.sum(numpy.square(pixels[..., :3] - target[:3]), axis=-1))
+        return ((alpha_distance <= fuzz_squared) & ((pixels[..., 3] <= 0) | (distance <= (3 * fuzz_squared))))
+    if (fuzz <= 0): return numpy.all(pixels[..., :3] == target[:3], axis=-1);
+    distance = numpy.sum(numpy.square(pixels[..., :3] - target[:3]), axis=-1)
+    return (distance <= (fuzz * fuzz))
+
+
+def Over(source, destination):
+    """ '-compose Over' on straight-alpha layers """
+    (Sa, Da) = (source[..., 3:], destination[..., 3:])
+    Ra = Sa + Da * (1 - Sa)
+    Rc = numpy.divide(source[..., :3] * Sa + destination[..., :3] * Da * (1 - Sa), Ra, out=numpy.zeros_like(source[..., :3]), where=(Ra > 0))
+    return numpy.concatenate((Rc, Ra), axis=-1)
+
+
+IM_OPACITY_MASK_CUTOFF = (1 - 0.99) # '-alpha Extract' then '-fuzz 99% -transparent white': opaque gray, so 3x the channel-distance against 3x fuzz squared
+
+def RecolorLayer(base, new_color, fuzz:float, threshold:float|None, colorname:str, library:str):
+    """ the recolor-chain of a single color (ImagePreprocess): threshold + fuzz-recolor, black's opacity-mask (Out),
+    the Difference composite against the original, the transparent-black mask, and the 'In' composite.
+    :return: straight-alpha layer containing only the pixels that actually changed """
+    recolor = base.copy()
+    if threshold is not None: # '-white-threshold' / 'Threshold-White': per-channel; RGB only
+        rgb = recolor[..., :3]
+        if (colorname == 'white'): rgb[rgb > threshold] = 1;
+        else: rgb[rgb < threshold] = 0;
+    target = numpy.array(([1, 1, 1, 1] if (colorname == 'white') else [0, 0, 0, 1]), dtype=numpy.float32)
+    recolor[ColorMatch(recolor, target, fuzz, library)] = ParseColor(new_color, library)
+    
+    if (colorname == 'black'): # black's fill also covers transparent regions; 'Out' against the inverted opacity discards them
+        keep = (base[..., 3] if (library == "GM") else (base[..., 3] >= IM_OPACITY_MASK_CUTOFF))
+        recolor[..., 3] *= keep
+    
+    # 'composite baseimg recolor -compose Difference'
+    (Sa, Da) = (base[..., 3:], recolor[..., 3:])
+    (Sca, Dca) = (base[..., :3] * Sa, recolor[..., :3] * Da)
+    Ra = Sa + Da - Sa * Da
+    Rca = Sca + Dca - 2 * numpy.minimum(Sca * Da, Dca * Sa)
+    difference = numpy.divide(Rca, Ra, out=numpy.zeros_like(Rca), where=(Ra > 0))
+    
+    # unchanged pixels (black difference) become transparent; IM's variant first forces dark values to black ('-black-threshold 10%')
+    if (library == "IM"): unchanged = (numpy.all(difference < 0.10, axis=-1) & (Ra[..., 0] >= 1 - (1 / QUANTUM)));
+    else: unchanged = numpy.all(difference < (0.5 / QUANTUM), axis=-1);
+    mask_alpha = numpy.where(unchanged, 0, Ra[..., 0])
+    
+    recolor[..., 3] *= mask_alpha # 'composite recolor mask -compose In'
+    return recolor
+
+
+def Atop(source, destination):
+    """ '-compose Atop': source over destination, clipped to destination's alpha """
+    (Sa, Da) = (source[..., 3:], destination[..., 3:])
+    Rc = (source[..., :3] * Sa + destination[..., :3] * (1 - Sa))
+    return numpy.concatenate((Rc, Da), axis=-1)
+
+
+def RemapKernel(base, remaps:list[tuple], library:str, atop:bool=False):
+    """ replaces the entire white/black remap-chain of ImagePreprocess; each recolor-layer is composited 'Over' the previous result
+    :param remaps: (colorname, new_color, fuzz_fraction, threshold_fraction|None) in GetRemapWB order
+    :param atop: also apply ImagePreprocess's final 'Atop' composite against base (replaces that separate command) """
+    composite = base
+    for (colorname, new_color, fuzz, threshold) in remaps:
+        composite = Over(RecolorLayer(base, new_color, fuzz, threshold, colorname, library), composite)
+    return (Atop(composite, base) if atop else composite)
+
+
+def RemapCommand(source:str, remaps:list[tuple], library:str, atop:bool=False, tile_size:int|None=None) -> str:
+    """ pipeline-command (sink is appended by ImagePreprocess like any other transform)
+    :param remaps: (colorname, new_color, fuzz_percent, threshold_percent|None) """
+    remap_args = ' '.join([f"{name}={color},{fuzz},{threshold or 0}" for (name, color, fuzz, threshold) in remaps])
+    return f"'{sys.executable}' '{pathlib.Path(__file__).absolute()}' remap {library}{TileArg(tile_size)} {remap_args}{' atop' if atop else ''} {source}"
+
+
+def ParseRemapArgs(remap_args:list[str]) -> list[tuple]:
+    remaps = []
+    for arg in remap_args:
+        if (arg == "atop"): continue;
+        (colorname, values) = arg.split('=')
+        (new_color, fuzz, threshold) = values.split(',')
+        remaps.append((colorname, new_color, (float(fuzz) / 100), ((float(threshold) / 100) if float(threshold) else None)))
+    return remaps
+
+
+def Contrast(pixels, passes:int=1):
+    """ '-contrast' (identical in IM/GM): HSB-brightness pushed along a sine-curve; hue and saturation are preserved,
+    so RGB scales proportionally with brightness """
+    rgb = pixels[..., :3]
+    for _ in range(passes):
+        brightness = numpy.max(rgb, axis=-1, keepdims=True)
+        enhanced = numpy.clip(brightness + 0.5 * (0.5 * (numpy.sin(numpy.pi * (brightness - 0.5)) + 1) - brightness), 0, 1)
+        rgb = numpy.divide(rgb * enhanced, brightness, out=numpy.zeros_like(rgb), where=(brightness > 0))
+    return numpy.concatenate((rgb, pixels[..., 3:]), axis=-1)
+
+
+def BoxSum(plane, radius:int):
+    """ sum over the (2R+1)x(2R+1) neighborhood of every pixel (summed-area table; cost is independent of radius)
+    edges are replicated like magick's default virtual-pixel method. Operates on the last two axes (frames may be stacked) """
+    width = (2 * radius) + 1
+    padding = [(0, 0)] * (plane.ndim - 2) + [(radius + 1, radius), (radius + 1, radius)]
+    table = numpy.pad(plane.astype(numpy.float64), padding, mode='edge')
+    table[..., 0, :] = 0; table[..., :, 0] = 0
+    table = table.cumsum(axis=-2).cumsum(axis=-1)
+    return (table[..., width:, width:] - table[..., :-width, width:] - table[..., width:, :-width] + table[..., :-width, :-width])
+
+
+def EdgeKernel(pixels, edge_color:str, radius:int, library:str):
+    """ replaces 'RGB.EdgeHighlightCMD': contrast x2, grayscale (IM: bilevel at 25% intensity, GM: 10% lightness),
+    '-edge R' (kernel: every weight -1, center (2R+1)^2 - 1), then the fuzz-recolors: near-black -> transparent, near-white -> edge-color
+    :return: straight-alpha edge-layer """
+    contrasted = Contrast(pixels, passes=2)
+    rgb = contrasted[..., :3]
+    if (library == "IM"): # '-threshold 25%' (Rec709 intensity) then '-modulate 100,0'
+        gray = ((rgb @ numpy.array([0.212656, 0.715158, 0.072186], dtype=numpy.float32)) > 0.25).astype(numpy.float32)
+    else: gray = (0.10 * (numpy.max(rgb, axis=-1) + numpy.min(rgb, axis=-1)) / 2); # '-modulate 10,0'; HSL lightness at 10%
+    width = (2 * radius) + 1
+    edges = numpy.clip((width * width) * gray - BoxSum(gray, radius), 0, 1).astype(numpy.float32)
+    
+    edge_layer = numpy.concatenate((numpy.repeat(edges[..., None], 3, axis=-1), pixels[..., 3:]), axis=-1) # alpha isn't convolved
+    fuzz = (0.99 if (library == "IM") else 1.0) # IM can't use 100%
+    black = ColorMatch(edge_layer, numpy.array([0, 0, 0, 1], dtype=numpy.float32), fuzz, library)
+    white = (ColorMatch(edge_layer, numpy.array([1, 1, 1, 1], dtype=numpy.float32), fuzz, library) & ~black)
+    edge_layer[black] = 0
+    edge_layer[white] = ParseColor(edge_color, library)
+    return edge_layer
+
+
+def EdgeCommand(source:str, edge_color:str, radius:int, library:str, tile_size:int|None=None) -> str:
+    return f"'{sys.executable}' '{pathlib.Path(__file__).absolute()}' edge {library}{TileArg(tile_size)} {edge_color} {radius} {source}"
+
+
+def RGBtoHSL(rgb):
+    """ :return: hue (turns), saturation, lightness; each shaped like a single channel """
+    (high, low) = (numpy.max(rgb, axis=-1), numpy.min(rgb, axis=-1))
+    (lightness, delta) = (((high + low) / 2), (high - low))
+    spread = numpy.where((lightness <= 0.5), (high + low), (2 - high - low))
+    saturation = numpy.divide(delta, spread, out=numpy.zeros_like(delta), where=(delta > 0))
+    (R, G, B) = (rgb[..., 0], rgb[..., 1], rgb[..., 2])
+    safe_delta = numpy.where((delta > 0), delta, 1)
+    hue = numpy.where((high == R), ((G - B) / safe_delta), numpy.where((high == G), ((B - R) / safe_delta) + 2, ((R - G) / safe_delta) + 4))
+    hue = numpy.where((delta > 0), ((hue / 6) % 1), 0)
+    return (hue, saturation, lightness)
+
+
+def HSLtoRGB(hue, saturation, lightness):
+    chroma = saturation * numpy.minimum(lightness, (1 - lightness))
+    channels = []
+    for offset in (0, 8, 4): # R, G, B
+        k = ((offset + hue * 12) % 12)
+        channels.append(lightness - chroma * numpy.clip(numpy.minimum(k - 3, 9 - k), -1, 1))
+    return numpy.stack(channels, axis=-1)
+
+
+def ModulationTurns(rotation:str|float) -> float:
+    """ '-modulate 100,100,R' hue-argument (100: unchanged, 300: full cycle) -> fraction of a full hue-rotation """
+    return ((float(rotation) - 100) / 200)
+
+
+class LayerStackT():
+    """ static layers of a single output-frame (or one tile of it); each one's hue is rotated by its own schedule before compositing (bottom to top)
+    the HSL decomposition is computed once per layer, so rendering a frame is only the inverse conversion and the composites """
+    def __init__(self, layers:list[tuple[str,str,object]]):
+        """ :param layers: (compose-method, stepsize-key, pixels) bottom to top; the first is the base ('Base', '-') """
+        self.stack = [(compose, key, RGBtoHSL(pixels[..., :3]), pixels) for (compose, key, pixels) in layers] # (compose, key, hsl, rgba)
+        return
+    
+    def Render(self, turns:dict[str,float]):
+        """ :param turns: hue-rotation (fractions of a full turn) for each stepsize-key, '-' being the main stepsize """
+        result = None
+        for (compose, key, hsl, pixels) in self.stack:
+            if ((rotation := (turns['-'] + (turns[key] if (key != '-') else 0)) % 1) == 0): layer = pixels;
+            else: layer = numpy.concatenate((HSLtoRGB((hsl[0] + rotation) % 1, hsl[1], hsl[2]), pixels[..., 3:]), axis=-1);
+            if (result is None): result = layer;
+            else: result = (Over(layer, result) if (compose == "Over") else Atop(layer, result));
+        return result
+
+
+def LayerCommand(schedule:pathlib.Path, base:str, layers:list[tuple[str,str,str]], sink:str, library:str, tile_size:int|None=None) -> str:
+    """ frame-generation command rendering every frame of sink from a stack of static layers (without layers: just the main modulation)
+    :param schedule: json written by 'WriteLayerSchedule'
+    :param layers: (compose-method, stepsize-key or '-', quoted spec) above base, bottom to top """
+    layer_args = ''.join([f" {compose} {key} {spec}" for (compose, key, spec) in layers])
+    return f"'{sys.executable}' '{pathlib.Path(__file__).absolute()}' layers {library}{TileArg(tile_size)} '{schedule}'{layer_args} {base} {sink}"
+
+
+def WriteLayerSchedule(schedule:pathlib.Path, frame_names:list[str], enumRotations:list[tuple[str,str]], layer_rotations:dict[str,list[str]], write_options:list[str]):
+    """ :param frame_names: output filename of each frame (matching enumRotations)
+    :param layer_rotations: per stepsize-key; the rotation-delta relative to the main stepsize, for each frame (cycled if shorter)
+    :param write_options: magick-options for encoding each frame ('--tempcompress') """
+    frames = [[name, index, rotation] for (name, (index, rotation)) in zip(frame_names, enumRotations, strict=True)]
+    with schedule.open(mode='w', encoding='utf-8') as schedule_file:
+        json.dump({"frames": frames, "rotations": layer_rotations, "write_options": write_options}, schedule_file)
+    return
+
+
+def RunLayers(library:str, schedule_path:str, layers:list[tuple[str,str,str]], base_spec:str, sink_spec:str, tile_size:int|None=None):
+    with open(schedule_path, mode='r', encoding='utf-8') as schedule_file: schedule = json.load(schedule_file);
+    (sink_format, sink_glob) = ParseSpec(sink_spec)
+    stack_specs = [("Base", "-", base_spec), *layers]
+    rotations = {key: [ModulationTurns(R) for R in values] for (key, values) in schedule["rotations"].items()}
+    def FrameTurns(number:int) -> dict[str,float]:
+        rotation = schedule["frames"][number][2]
+        return {'-': ModulationTurns(rotation), **{key: values[number % len(values)] for (key, values) in rotations.items()}}
+    def FrameSpec(number:int) -> tuple[str,list[str]]:
+        (name, index, _) = schedule["frames"][number]
+        return (f"{sink_format}:{sink_glob.parent / name}", ["-scene", str(int(index)), *schedule["write_options"]])
+    
+    with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1)) as pool:
+        if not tile_size: # whole frames in parallel
+            stack = LayerStackT([(compose, key, ReadRGBA(library, spec)) for (compose, key, spec) in stack_specs])
+            def RenderFrame(number:int): WriteRGBA(library, stack.Render(FrameTurns(number)), *FrameSpec(number));
+            [*pool.map(RenderFrame, range(len(schedule["frames"])))]
+        else: # one frame at a time, tiles in parallel; the HSL decomposition is per-tile (recomputed each frame) to keep memory bounded
+            rasters = [(compose, key, RasterT.Decode(library, spec, ScratchPath(sink_glob, f"layer{index}"), tile_size)) for (index, (compose, key, spec)) in enumerate(stack_specs)]
+            for number in range(len(schedule["frames"])):
+                turns = FrameTurns(number)
+                frame = RasterT(ScratchPath(sink_glob, "frame"), rasters[0][2].width, rasters[0][2].height, mode='w+')
+                def Render(rows:slice, columns:slice): return LayerStackT([(compose, key, raster.Read(rows, columns)) for (compose, key, raster) in rasters]).Render(turns);
+                RenderTiles(Render, frame, tile_size, 0, pool)
+                (frame_spec, frame_options) = FrameSpec(number)
+                frame.Encode(library, frame_spec, tile_size, frame_options); frame.Release()
+            for (_, _, raster) in rasters: raster.Release();
+    print(f"[LayerStack] {len(schedule['frames'])} frames from {len(stack_specs)} layers{f' (tiles: {tile_size}px)' if tile_size else ''} -> {sink_spec}")
+    return
+
+
+BATCH_FRAMES = 16 # upper limit of frames stacked into one kernel-call
+
+def RunKernel(kernel, library:str, source_spec:str, sink_spec:str, write_options:list[str]=()):
+    """ applies kernel (array -> array, any leading dimensions) to every frame. Frames are stacked into batches (one vectorized call per batch),
+    and batches run on a thread-pool; numpy and the (de)coding subprocesses release the GIL, so every core stays busy """
+    frame_pairs = ExpandFrames(source_spec, sink_spec)
+    workers = (os.cpu_count() or 1)
+    batch_size = max(1, min(BATCH_FRAMES, -(-len(frame_pairs) // workers)))
+    def ProcessBatch(batch:list[tuple[str,str]]):
+        frames = [ReadRGBA(library, source) for (source, _) in batch]
+        if (len(set(F.shape for F in frames)) == 1): results = kernel(numpy.stack(frames));
+        else: results = [kernel(F) for F in frames]; # mixed geometry; can't stack
+        for (result, (_, sink)) in zip(results, batch, strict=True): WriteRGBA(library, result, sink, write_options);
+        return
+    batches = [frame_pairs[I:I+batch_size] for I in range(0, len(frame_pairs), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool: [*pool.map(ProcessBatch, batches)];
+    print(f"[{kernel.__name__}] {len(frame_pairs)} frame{'s' if (len(frame_pairs) > 1) else ''} ({len(batches)} batches) -> {sink_spec}")
+    return
+
+
+def RunTiled(kernel, library:str, source_spec:str, sink_spec:str, tile_size:int, overlap:int=0, write_options:list[str]=()):
+    """ 'RunKernel' for huge images; one frame at a time, split into tiles on the thread-pool (see 'RasterT')
+    :param overlap: context the kernel needs around each pixel (edge-radius); the stitched result matches the whole-image result """
+    frame_pairs = ExpandFrames(source_spec, sink_spec)
+    with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1)) as pool:
+        for (source, sink) in frame_pairs:
+            sink_path = ParseSpec(sink)[1]
+            pixels = RasterT.Decode(library, source, ScratchPath(sink_path, f"{sink_path.name}.source"), tile_size)
+            result = RasterT(ScratchPath(sink_path, sink_path.name), pixels.width, pixels.height, mode='w+')
+            RenderTiles((lambda rows, columns: kernel(pixels.Read(rows, columns))), result, tile_size, overlap, pool)
+            result.Encode(library, sink, tile_size, write_options); result.Release(); pixels.Release()
+    print(f"[{kernel.__name__}] {len(frame_pairs)} frame{'s' if (len(frame_pairs) > 1) else ''} (tiles: {tile_size}px, overlap: {overlap}) -> {sink_spec}")
+    return
+
+
+if __name__ == "__main__":
+    # usage: Kernels.py remap {IM,GM} [tile=SIZE] COLOR=HEX,FUZZ,THRESHOLD [...] [atop] SOURCE [write=OPTION,...] SINK
+    #        Kernels.py edge  {IM,GM} [tile=SIZE] HEX RADIUS SOURCE [write=OPTION,...] SINK
+    #        Kernels.py layers {IM,GM} [tile=SIZE] SCHEDULE [COMPOSE KEY LAYER ...] BASE SINK
+    assert(AVAILABLE), "numpy is required to run kernels";
+    (kernel_name, library) = sys.argv[1:3]
+    arguments = sys.argv[3:]; write_options = []
+    if ((len(arguments) > 2) and arguments[-2].startswith("write=")): write_options = arguments.pop(-2).removeprefix("write=").split(','); # appended by ImagePreprocess
+    (kernel_args, (source_spec, sink_spec)) = (arguments[:-2], arguments[-2:])
+    assert(library in ("IM", "GM")), f"invalid library: {library}";
+    tile_size = None
+    if ((len(kernel_args) > 0) and kernel_args[0].startswith("tile=")): (tile_size, kernel_args) = (int(kernel_args[0].removeprefix("tile=")), kernel_args[1:]);
+    def Run(kernel, overlap:int=0):
+        if tile_size: RunTiled(kernel, library, source_spec, sink_spec, tile_size, overlap, write_options);
+        else: RunKernel(kernel, library, source_spec, sink_spec, write_options);
+    if (kernel_name == "remap"):
+        (remaps, atop) = (ParseRemapArgs(kernel_args), ("atop" in kernel_args))
+        def Remap(pixels): return RemapKernel(pixels, remaps, library, atop);
+        Run(Remap)
+    elif (kernel_name == "edge"):
+        (edge_color, radius) = (kernel_args[0], int(kernel_args[1]))
+        def Edge(pixels): return EdgeKernel(pixels, edge_color, radius, library);
+        Run(Edge, overlap=radius)
+    elif (kernel_name == "layers"):
+        layer_args = kernel_args[1:]
+        RunLayers(library, kernel_args[0], [tuple(layer_args[I:I+3]) for I in range(0, len(layer_args), 3)], source_spec, sink_spec, tile_size)
+    else: assert(False), f"unknown kernel: {kernel_name}";
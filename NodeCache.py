@@ -0,0 +1,190 @@
+import pathlib
+import shutil
+import json
+import time
+import sys
+import os
+
+import Globals
+import Checksum
+
+# persistent cache of 'ImagePreprocess' results, shared by every workdir (both magick-libraries; the library is part of every key)
+# each sink is keyed by a hash of its command and the keys of its sources, rooted at the input's digest ('Globals.INPUT_DIGEST');
+# unchanged subgraphs (crop, remap, edge-layer...) are restored instead of recomputed when only later options changed.
+# an entry is a directory named by its key; single images are stored as 'image.<ext>' (renamed on restore), frame-sets keep their frame-names
+CACHE_VERSION = 1 # bump whenever command-generation changes in ways the command-strings themselves don't capture
+CACHE_DIRNAME = "RGB_NODE_CACHE"
+DEFAULT_CACHE_BUDGET = "8GB"
+ENTRY_FRACTION = 4 # sinks larger than (budget / 4) are never stored; one huge frame-set would evict everything else
+KEY_LENGTH = 32 # hex-chars
+
+
+def CacheDirectory(configured:str|None) -> pathlib.Path:
+    if (configured is None): return Globals.PROGRAM_DIR / CACHE_DIRNAME;
+    return pathlib.Path(configured).expanduser().absolute()
+
+
+def Digest(*parts) -> str: return Checksum.HashBytes(json.dumps(parts).encode('utf-8'))[:KEY_LENGTH];
+
+
+def CompanionFiles(path:pathlib.Path) -> list[pathlib.Path]:
+    """ the image itself and its MPC pixel-cache, if any """
+    return [path, *([cache_file] if (cache_file := path.with_suffix('.cache')).exists() and (cache_file != path) else [])]
+
+
+def Place(source:pathlib.Path, destination:pathlib.Path):
+    """ hardlinks where possible; MPC is always copied (magick memory-maps the pixel-cache, so a shared inode isn't safe) """
+    destination.unlink(missing_ok=True)
+    if (source.suffix not in ('.mpc', '.cache')):
+        try: os.link(source, destination); return;
+        except OSError: pass; # different filesystem
+    shutil.copy2(source, destination)
+    return
+
+
+def ParseSpec(spec:str) -> tuple[pathlib.Path,bool]:
+    """ quoted sink-spec ('FMT:path' or a 'FMT:dir/frame*.fmt' glob) -> (path, is_multisource) """
+    path = pathlib.Path(spec.strip("'").split(':', maxsplit=1)[-1])
+    if ('*' in path.name): return (path.parent, True);
+    return (path, False)
+
+
+class NodeCacheT():
+    def __init__(self, root:pathlib.Path, budget:int|None):
+        self.root = root
+        self.budget = budget
+        self.entry_limit = ((budget // ENTRY_FRACTION) if budget else None)
+        root.mkdir(parents=True, exist_ok=True)
+        return
+    
+    def Entry(self, key:str) -> pathlib.Path: return self.root / key;
+    def Contains(self, key:str) -> bool: return self.Entry(key).is_dir();
+    
+    def Restore(self, key:str, sink) -> int:
+        """ copies (links) a cached entry into the sink's location
+        :return: number of files restored """
+        entry = self.Entry(key); restored = 0
+        for cached in sorted(entry.iterdir()):
+            if sink.multisource: destination = sink.srcpath / cached.name;
+            else: destination = sink.srcpath.with_suffix(cached.suffix) if (cached.suffix == '.cache') else sink.srcpath;
+            Place(cached, destination); restored += 1
+        os.utime(entry) # most-recently-used (see 'Prune')
+        return restored
+    
+    def StoreCommand(self, key:str, sink) -> str:
+        """ shell command storing a finished sink; runs as part of the preprocessing commands (the sink's path keeps it referenced until then) """
+        return f"'{sys.executable}' '{pathlib.Path(__file__).absolute()}' store '{self.root}' {self.entry_limit or 0} {key} {sink.QuoteAll()}"
+    
+    def Store(self, key:str, spec:str) -> bool:
+        (path, is_multisource) = ParseSpec(spec)
+        if self.Contains(key): return False; # another run got here first
+        files = (sorted(F for F in path.iterdir() if F.is_file()) if is_multisource else CompanionFiles(path))
+        size = sum(F.stat().st_size for F in files)
+        if (self.entry_limit and (size > self.entry_limit)): print(f"[NODE-CACHE] not storing '{path.name}' ({size} bytes; limit: {self.entry_limit})"); return False;
+        staging = self.root / f".{key}.{os.getpid()}"
+        staging.mkdir()
+        for F in files: Place(F, staging / (F.name if is_multisource else f"image{F.suffix}"));
+        try: staging.rename(self.Entry(key)); # atomic; readers never see a partial entry
+        except OSError: shutil.rmtree(staging, ignore_errors=True); return False;
+        print(f"[NODE-CACHE] stored '{path.name}' as {key} ({len(files)} files)")
+        return True
+    
+    def Prune(self, max_age_days:float|None) -> int:
+        """ evicts least-recently-used entries past the budget, and any older than max_age
+        :return: number of entries removed """
+        now = time.time(); max_age = ((max_age_days * 86400) if (max_age_days is not None) else None)
+        entries = [(E.stat().st_mtime, sum(F.stat().st_size for F in E.iterdir()), E) for E in self.root.iterdir() if E.is_dir()]
+        total = sum(size for (_, size, _) in entries); evicted = 0
+        for (last_used, size, entry) in sorted(entries, key=lambda item: item[0]): # oldest first
+            staging = (entry.name.startswith('.') and ((now - last_used) > 3600)) # a store that never finished (crashed run)
+            expired = ((max_age is not None) and ((now - last_used) > max_age))
+            if not (staging or expired or (self.budget and (total > self.budget))): continue;
+            shutil.rmtree(entry, ignore_errors=True); total -= size; evicted += 1
+        if evicted: print(f"[NODE-CACHE] evicted {evicted} entries from '{self.root}'");
+        return evicted
+
+
+def PlanMemoization(task, cache:NodeCacheT, transform_queue:list[tuple], magic_map:dict, sink_count:dict, transform_hooks:dict, parent_map:dict, expanded_commands:dict) -> dict[int,list[str]]:
+    """ keys every sink of the (optimized) transform_queue, restores cached sinks, and drops every transform that only fed them (in-place).
+    Sinks involved in modulation-hooks or parent-sinks are never cached; their commands are emitted outside of the queue.
+    :return: store-commands to append after the transform at each (new) queue-index """
+    if (Globals.INPUT_DIGEST is None): return {};
+    library = task.working_path.name[-2:]
+    salt = Digest(CACHE_VERSION, library, Checksum.HashFile(Globals.PROGRAM_DIR / "Kernels.py"))
+    def Shape(S) -> list: return [S.image_format, S.multisource, S.scale, *([S.frame_count, sorted(S.duplicate_frames.items())] if S.multisource else [])];
+    
+    producers : dict[str,list[int]] = {}
+    for (index, T) in enumerate(transform_queue): producers.setdefault(T[0], []).append(index);
+    modulated = {modsink: source for (source, modsink) in transform_hooks.items()}
+    by_path = {magic_map[M].srcpath: M for M in producers}
+    def Canonical(magic:str) -> str: # identity-sinks (see 'OptimizeQueue') alias their source's path
+        return (magic if (magic in producers) else by_path.get(magic_map[magic].srcpath, magic))
+    
+    def Cacheable(magic:str) -> bool:
+        if ((magic not in producers) or (magic in transform_hooks) or (magic in modulated)
+            or (magic in parent_map) or (magic in parent_map.values())): return False;
+        last = producers[magic][-1] # an intermediate state read by another sink can't be skipped
+        return not any([(magic in T[2]) and (T[0] != magic) for T in transform_queue[:last]])
+    
+    keys : dict[str,str] = {}
+    def Key(magic:str) -> str:
+        if (magic in keys): return keys[magic];
+        source = magic_map[magic]
+        if (source is task.image_source): key = Digest(salt, "input", Globals.INPUT_DIGEST, Shape(source));
+        elif (magic in modulated):
+            commands = [C.replace(str(task.working_path), '') for C in expanded_commands[magic]]
+            key = Digest(salt, "modulation", Key(modulated[magic]), commands)
+        elif ((alias := Canonical(magic)) != magic): key = Key(alias);
+        else: key = Digest(salt, "file", Checksum.HashFile(CompanionFiles(source.srcpath)[-1]), Shape(source)); # rendered text; exists beforehand
+        keys[magic] = key
+        return key
+    
+    for (sink_magic, command, source_magics, whole_sink) in transform_queue: # keys evolve with each write to a sink (in-place commands)
+        keys[sink_magic] = Digest(salt, keys.get(sink_magic), command, [Key(M) for M in source_magics], whole_sink, Shape(magic_map[sink_magic]))
+    
+    hits = {M for M in producers if Cacheable(M) and cache.Contains(keys[M])}
+    needed : set[int] = set(); live : set[str] = set(); visited : set[str] = set()
+    def Demand(magic:str):
+        if (magic in visited): return;
+        visited.add(magic); live.add(magic)
+        if (magic in modulated): Demand(modulated[magic]); return;
+        if ((alias := Canonical(magic)) != magic): Demand(alias); return;
+        if (magic in hits): return;
+        for index in producers.get(magic, []):
+            needed.add(index)
+            for source_magic in transform_queue[index][2]: Demand(source_magic);
+    for S in task.PinnedSinks(): Demand(S.magic);
+    
+    restored = [M for M in hits if (M in live)]
+    if (len(restored) == 0): needed = set(range(len(transform_queue)));
+    for M in restored: cache.Restore(keys[M], magic_map[M]);
+    
+    stores : dict[int,list[str]] = {}
+    kept = [index for index in range(len(transform_queue)) if (index in needed)]
+    for (new_index, index) in enumerate(kept):
+        sink_magic = transform_queue[index][0]
+        if (Cacheable(sink_magic) and (producers[sink_magic][-1] == index) and not cache.Contains(keys[sink_magic])):
+            stores[new_index] = [cache.StoreCommand(keys[sink_magic], magic_map[sink_magic])]
+    
+    skipped = (len(transform_queue) - len(kept))
+    transform_queue[:] = [transform_queue[index] for index in kept]
+    sink_count.clear()
+    for T in transform_queue: sink_count[T[0]] = 1 + sink_count.get(T[0], 0);
+    
+    if (len(restored) > 0): # sinks that were only needed to compute restored ones are never written
+        for (name, sink) in [*task.intermediates.items()]:
+            if (sink.magic in live): continue;
+            task.intermediates.pop(name)
+            if sink.multisource and sink.srcpath.is_dir() and not any(sink.srcpath.iterdir()): sink.srcpath.rmdir();
+    
+    print(f"\n[NODE-CACHE] restored: {len(restored)} sinks ({', '.join(magic_map[M].safe_filename for M in restored) or 'none'}) | skipped transforms: {skipped} | storing: {len(stores)}")
+    return stores
+
+
+if __name__ == "__main__":
+    # usage: NodeCache.py store CACHE_DIR ENTRY_LIMIT KEY SPEC
+    assert(sys.argv[1] == "store"), f"unknown command: '{sys.argv[1]}'";
+    (root, entry_limit, key, spec) = sys.argv[2:6]
+    cache = NodeCacheT(pathlib.Path(root), None)
+    cache.entry_limit = (int(entry_limit) or None)
+    cache.Store(key, spec)
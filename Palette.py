@@ -0,0 +1,208 @@
+import pathlib
+import json
+import time
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import Checksum
+import Kernels
+
+# global GIF palette: one palette computed from a sample of the frames (instead of magick quantizing every frame, then '+remap'-ing them together)
+# the palette of a frame-set is cached by the contents of its sampled frames and the color-count; every scale of a task shares the palette
+# of its smallest frame-set (scaling doesn't change the color distribution). Frames are then mapped to it in parallel ('Palette.py map'),
+# and magick only has to assemble them ('-remap'/'-map' to the palette-image finds an exact match for every pixel).
+# with '--gif-writer', the mapped frames are encoded in parallel chunks instead, and spliced into the final GIF ('GifWriter.py').
+# invoked from the rendering commands: 'Palette.py palette LIBRARY COLORS CACHE_DIR PALETTE FRAMES...', 'Palette.py map LIBRARY PALETTE SOURCE SINK'
+
+try: import numpy # optional: without it, GIFs are quantized by magick ('RGB.argstr_GIF')
+except ImportError: numpy = None;
+
+AVAILABLE = (numpy is not None)
+MAX_COLORS = 256 # GIF limit; includes the transparent entry
+SAMPLE_FRAMES = 16 # evenly spaced over the frame-set
+SAMPLE_PIXELS = (1 << 20) # per frame; larger frames are strided
+BIN_BITS = 6 # per channel; colors are histogrammed (and mapped) on a 2^18 grid
+REFINE_PASSES = 4 # k-means iterations after the median-cut
+CACHE_DIRNAME = "palettes" # under 'RGB_TOPLEVEL'; tiny json files, shared by every workdir
+CACHE_MAX_AGE_DAYS = 30 # palettes unused for this long are removed whenever a new one is stored
+ALPHA_CUTOFF = 0.5 # GIF transparency is binary
+
+
+def SampleFrames(frames:list[pathlib.Path], count:int=SAMPLE_FRAMES) -> list[pathlib.Path]:
+    if (len(frames) <= count): return frames;
+    return [frames[(I * len(frames)) // count] for I in range(count)]
+
+
+def Bins(rgb):
+    """ :return: grid-index of every color ('BIN_BITS' per channel) """
+    levels = numpy.minimum((rgb * (1 << BIN_BITS)).astype(numpy.int32), (1 << BIN_BITS) - 1)
+    return ((levels[..., 0] << (2 * BIN_BITS)) | (levels[..., 1] << BIN_BITS) | levels[..., 2])
+
+
+def BinCenters():
+    grid = numpy.arange(1 << (3 * BIN_BITS))
+    mask = ((1 << BIN_BITS) - 1)
+    return ((numpy.stack([(grid >> (2 * BIN_BITS)) & mask, (grid >> BIN_BITS) & mask, grid & mask], axis=-1) + 0.5) / (1 << BIN_BITS)).astype(numpy.float32)
+
+
+def Nearest(colors, palette, chunk:int=(1 << 15)):
+    """ index of the nearest palette-entry for every color (euclidean RGB); chunked to bound the distance-matrix """
+    nearest = numpy.empty(len(colors), dtype=numpy.int32)
+    palette_norms = (palette * palette).sum(axis=-1)
+    for start in range(0, len(colors), chunk):
+        block = colors[start:start+chunk]
+        nearest[start:start+chunk] = numpy.argmin(palette_norms[None, :] - 2 * (block @ palette.T), axis=-1)
+    return nearest
+
+
+def MedianCut(colors, weights, count:int):
+    """ splits the (weighted) colors into 'count' boxes; each split halves the weight of the box with the largest weighted range """
+    boxes = [numpy.arange(len(colors))]
+    while (len(boxes) < count):
+        spans = [((colors[B].max(axis=0) - colors[B].min(axis=0)) if (len(B) > 1) else numpy.zeros(3)) for B in boxes]
+        scores = [(span.max() * weights[B].sum()) for (span, B) in zip(spans, boxes)]
+        if (max(scores) <= 0): break; # fewer distinct colors than requested
+        index = int(numpy.argmax(scores)); box = boxes.pop(index)
+        axis = int(numpy.argmax(spans[index]))
+        order = box[numpy.argsort(colors[box, axis], kind='stable')]
+        cumulative = numpy.cumsum(weights[order])
+        split = int(numpy.clip(numpy.searchsorted(cumulative, cumulative[-1] / 2), 1, len(order) - 1))
+        boxes.extend([order[:split], order[split:]])
+    return numpy.array([numpy.average(colors[B], axis=0, weights=weights[B]) for B in boxes], dtype=numpy.float32)
+
+
+def Quantize(samples, count:int):
+    """ :param samples: opaque RGB samples (N, 3) in [0,1]
+    :return: palette (count or fewer colors, float) from a median-cut over the color-histogram, refined by weighted k-means """
+    bins = Bins(samples)
+    weights = numpy.bincount(bins, minlength=(1 << (3 * BIN_BITS))).astype(numpy.float64)
+    occupied = numpy.nonzero(weights)[0]
+    colors = numpy.stack([numpy.bincount(bins, weights=samples[:, C], minlength=len(weights))[occupied] for C in range(3)], axis=-1) / weights[occupied, None]
+    (colors, weights) = (colors.astype(numpy.float32), weights[occupied])
+    palette = MedianCut(colors, weights, count)
+    for _ in range(REFINE_PASSES):
+        assigned = Nearest(colors, palette)
+        totals = numpy.bincount(assigned, weights=weights, minlength=len(palette))
+        sums = numpy.stack([numpy.bincount(assigned, weights=(weights * colors[:, C]), minlength=len(palette)) for C in range(3)], axis=-1)
+        palette = numpy.where((totals[:, None] > 0), (sums / numpy.maximum(totals, 1)[:, None]), palette).astype(numpy.float32)
+    return palette
+
+
+class PaletteT():
+    def __init__(self, colors:list[list[int]], transparent:int|None):
+        """ :param colors: 8-bit RGB entries; the transparent entry (if any) included """
+        self.colors = colors
+        self.transparent = transparent
+        return
+    
+    @classmethod
+    def Load(cls, path:pathlib.Path):
+        with path.open(mode='r', encoding='utf-8') as palette_file: info = json.load(palette_file);
+        return cls(info["colors"], info["transparent"])
+    
+    def Save(self, path:pathlib.Path):
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with temp_path.open(mode='w', encoding='utf-8') as palette_file: json.dump({"colors": self.colors, "transparent": self.transparent}, palette_file);
+        temp_path.replace(path) # atomic; concurrent runs may store the same palette
+        return
+    
+    def RGBA(self):
+        """ :return: (1, N, 4) float image of the palette (for magick's '-remap'/'-map') """
+        pixels = numpy.concatenate((numpy.array(self.colors, dtype=numpy.float32) / 255, numpy.ones((len(self.colors), 1), dtype=numpy.float32)), axis=-1)
+        if (self.transparent is not None): pixels[self.transparent] = 0;
+        return pixels[None, ...]
+    
+    def Lookup(self):
+        """ :return: nearest opaque entry for every grid-bin (see 'Bins') """
+        opaque = [I for I in range(len(self.colors)) if (I != self.transparent)]
+        entries = (numpy.array(self.colors, dtype=numpy.float32)[opaque] / 255)
+        return numpy.array(opaque, dtype=numpy.uint8)[Nearest(BinCenters(), entries)]
+    
+    def Map(self, pixels, lookup):
+        """ :return: palette-index of every pixel (uint8) """
+        indices = lookup[Bins(pixels[..., :3])]
+        if (self.transparent is not None): indices[pixels[..., 3] < ALPHA_CUTOFF] = self.transparent;
+        return indices
+
+
+def ComputePalette(library:str, frames:list[pathlib.Path], frame_format:str, colors:int) -> PaletteT:
+    samples = []; has_transparency = False
+    for frame in SampleFrames(frames):
+        pixels = Kernels.ReadRGBA(library, f"{frame_format}:{frame}").reshape(-1, 4)
+        pixels = pixels[::max(1, (len(pixels) // SAMPLE_PIXELS))]
+        opaque = (pixels[:, 3] >= ALPHA_CUTOFF)
+        has_transparency |= (not opaque.all())
+        samples.append(pixels[opaque, :3])
+    samples = numpy.concatenate(samples)
+    count = (colors - (1 if has_transparency else 0))
+    entries = (numpy.rint(Quantize(samples, count) * 255).astype(int).tolist() if (len(samples) > 0) else [[0, 0, 0]])
+    if has_transparency: entries.append([0, 0, 0]);
+    return PaletteT(entries, ((len(entries) - 1) if has_transparency else None))
+
+
+def PruneCache(cache_dir:pathlib.Path, max_age_days:float=CACHE_MAX_AGE_DAYS):
+    cutoff = (time.time() - (max_age_days * 86400))
+    for cached in cache_dir.glob("*.json"):
+        if (cached.stat().st_mtime < cutoff): cached.unlink(missing_ok=True);
+    return
+
+
+def EntriesPath(palette_path:pathlib.Path) -> pathlib.Path: return palette_path.with_name(f"{palette_path.name}.json");
+
+
+def RunPalette(library:str, colors:int, cache_dir:pathlib.Path, palette_path:pathlib.Path, frame_globs:list[str]):
+    """ writes the palette-image to palette_path, and its entries to 'EntriesPath' (read by 'RunMap') """
+    frames = []
+    for spec in frame_globs:
+        (frame_format, frame_glob) = Kernels.ParseSpec(spec)
+        frames.extend(sorted(frame_glob.parent.glob(frame_glob.name)))
+    sampled = SampleFrames(frames)
+    contents = [Checksum.HashFile(C) for F in sampled for C in (F, F.with_suffix('.cache')) if C.exists()] # MPC pixels are in the '.cache'
+    key = Checksum.HashBytes(json.dumps([colors, BIN_BITS, REFINE_PASSES, contents]).encode('utf-8'))[:32]
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    if (cached := (cache_dir / f"{key}.json")).exists():
+        palette = PaletteT.Load(cached); os.utime(cached); status = "cached"
+    else:
+        started = time.perf_counter()
+        palette = ComputePalette(library, frames, frame_format, colors); palette.Save(cached); PruneCache(cache_dir)
+        status = f"computed in {time.perf_counter() - started:.2f}s"
+    palette.Save(EntriesPath(palette_path))
+    Kernels.WriteRGBA(library, palette.RGBA(), f"PNG:{palette_path}")
+    print(f"[PALETTE] {len(palette.colors)} colors from {len(sampled)}/{len(frames)} frames ({status}) -> {palette_path.name}")
+    return
+
+
+def RunMap(library:str, palette_path:pathlib.Path, source_spec:str, sink_spec:str):
+    """ replaces every pixel with its palette-entry (no dithering, like '+dither'); frames in parallel """
+    palette = PaletteT.Load(EntriesPath(palette_path))
+    (lookup, entries) = (palette.Lookup(), palette.RGBA()[0])
+    frame_pairs = Kernels.ExpandFrames(source_spec, sink_spec)
+    def MapFrame(pair:tuple[str,str]):
+        (source, sink) = pair
+        Kernels.WriteRGBA(library, entries[palette.Map(Kernels.ReadRGBA(library, source), lookup)], sink)
+        return
+    with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1)) as pool: [*pool.map(MapFrame, frame_pairs)];
+    print(f"[PALETTE] mapped {len(frame_pairs)} frames -> {sink_spec}")
+    return
+
+
+def PaletteCommand(frame_globs:list[str], palette_path:pathlib.Path, colors:int, cache_dir:pathlib.Path, library:str) -> str:
+    return f"'{sys.executable}' '{pathlib.Path(__file__).absolute()}' palette {library} {colors} '{cache_dir}' '{palette_path}' {' '.join(frame_globs)}"
+
+
+def MapCommand(palette_path:pathlib.Path, source:str, sink:str, library:str) -> str:
+    return f"'{sys.executable}' '{pathlib.Path(__file__).absolute()}' map {library} '{palette_path}' {source} {sink}"
+
+
+if __name__ == "__main__":
+    # usage: Palette.py palette {IM,GM} COLORS CACHE_DIR PALETTE FRAMES [FRAMES ...]
+    #        Palette.py map {IM,GM} PALETTE SOURCE SINK
+    assert(AVAILABLE), "numpy is required to compute palettes";
+    (command, library) = sys.argv[1:3]
+    assert(library in ("IM", "GM")), f"invalid library: {library}";
+    if (command == "palette"):
+        (colors, cache_dir, palette_path) = (int(sys.argv[3]), pathlib.Path(sys.argv[4]), pathlib.Path(sys.argv[5]))
+        RunPalette(library, colors, cache_dir, palette_path, sys.argv[6:])
+    elif (command == "map"): RunMap(library, pathlib.Path(sys.argv[3]), *sys.argv[4:6]);
+    else: assert(False), f"unknown command: {command}";
@@ -0,0 +1,50 @@
+# '--render-preset': encoder-effort for every output format, traded against encoding-time
+# GIF has no effort-knob (LZW is lossless and fixed-cost; see 'GifWriter.py'), so it's the same under every preset.
+#
+# | preset   | WebP                   | MP4 (libx264)        | APNG    | PNG intermediates | encode-time* | output-size* |
+# |----------|------------------------|----------------------|---------|-------------------|--------------|--------------|
+# | fast     | lossy q90, method 0    | ultrafast, crf 28    | zlib 1  | zlib 1            | ~0.1-0.3x    | ~1.2-2x (WebP lossy: ~0.3x) |
+# | balanced | lossless, method 4     | medium, crf 23       | zlib 6  | zlib 3            | 1x           | 1x           |
+# | max      | lossless, method 6     | veryslow, crf 18     | zlib 9  | zlib 6            | ~2-4x        | ~0.9x (MP4: ~1.5x, higher quality) |
+#
+# *unmeasured estimates, relative to 'balanced'; expectations from the encoders' documented settings, not benchmarks of this program.
+# the run-report ('Telemetry.py') records the actual encode-time of every command.
+# 'balanced' matches the previous defaults for MP4/APNG (ffmpeg's own); WebP was previously 'max'.
+# 'PNG intermediates' are the decoded video-frames and converted stills; they're read once, so only their write-time matters.
+
+DEFAULT_PRESET = "balanced"
+
+
+class RenderPresetT():
+    def __init__(self, webp_method:int, webp_lossless:bool, x264_preset:str, x264_crf:int, x264_threads:int, apng_level:int, png_level:int):
+        self.webp_method = webp_method # libwebp 'method' (0-6)
+        self.webp_lossless = webp_lossless
+        self.x264_preset = x264_preset
+        self.x264_crf = x264_crf
+        self.x264_threads = x264_threads # 0: ffmpeg picks (every core)
+        self.apng_level = apng_level # zlib-level of the APNG output
+        self.png_level = png_level # zlib-level of PNG intermediates
+        return
+    
+    def MP4Args(self) -> str: return f"-c:v libx264 -preset {self.x264_preset} -crf {self.x264_crf} -threads {self.x264_threads}";
+    def APNGArgs(self) -> str: return f"-compression_level {self.apng_level}";
+    def FFmpegPNGArgs(self) -> str: return f"-compression_level {self.png_level}";
+    def MagickPNGArgs(self) -> str: return f"-quality {(self.png_level * 10) + 5}"; # magick's PNG '-quality': zlib-level (tens), filter (ones; 5: adaptive)
+
+
+RENDER_PRESETS = {
+    "fast":     RenderPresetT(webp_method=0, webp_lossless=False, x264_preset="ultrafast", x264_crf=28, x264_threads=0, apng_level=1, png_level=1),
+    "balanced": RenderPresetT(webp_method=4, webp_lossless=True,  x264_preset="medium",    x264_crf=23, x264_threads=0, apng_level=6, png_level=3),
+    "max":      RenderPresetT(webp_method=6, webp_lossless=True,  x264_preset="veryslow",  x264_crf=18, x264_threads=0, apng_level=9, png_level=6),
+}
+
+
+# '--preview': a small, fast version of the final output; every other option applies unchanged, so it matches the full render
+PREVIEW_MAX_DIMENSION = 320 # pixels; longest side of the preview
+PREVIEW_FRAMES = 12 # rotations, evenly spaced over the full cycle (video: the first frames)
+PREVIEW_COLORS = 32 # GIF palette-size
+
+
+def PreviewScale(dimensions:tuple[int,int], max_dimension:int=PREVIEW_MAX_DIMENSION) -> int:
+    """ percent fitting the longest side within max_dimension; never upscales """
+    return max(1, min(100, ((max_dimension * 100) // max(dimensions))))
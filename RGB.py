@@ -88,6 +88,13 @@ def EnumRotations(stepsize:float, length:int=0, useHSB=False) -> list[tuple[str,
     return enumRotations
 
 
+def SampleRotations(enumRotations:list[tuple[str,str]], count:int) -> list[tuple[str,str]]:
+    """ 'count' evenly spaced entries of a rotation-cycle (from 'EnumRotations'), re-indexed from zero; used by previews """
+    if (count >= len(enumRotations)): return enumRotations;
+    padding = 1 + int(log10(max(1, count - 1)))
+    return [(str(index).zfill(padding), enumRotations[(index * len(enumRotations)) // count][1]) for index in range(count)]
+
+
 def SaveCommand(filename: str, command:str|list[str], append:bool=False) -> pathlib.Path:
     """ writes/appends commands to file; returns written filepath"""
     cmdlist = (command if(isinstance(command, list)) else [command]); del command;
@@ -229,11 +236,13 @@ def EdgeHighlightCMD(edge_color:int|str, edge_radius) -> str:
         recolor_mid = f"-modulate 10,0 -edge {edge_radius} -fuzz '100%' {recolor_str}"
     return "convert {0} -contrast -contrast " + recolor_mid
 
-def argstr_GIF(delay:int) -> tuple[str,str]:
-    """:returns: arg-string before and after input"""
+def argstr_GIF(delay:int, colors:int=256, palette:pathlib.Path|None=None) -> tuple[str,str]:
+    """:param palette: image holding a precomputed global palette (see 'Palette.py'); frames are remapped to it instead of quantized
+    :returns: arg-string before and after input"""
     # frames generated for GIF output need preprocessing to reduced (255) color-palette
     # 'fuzz' and 'treedepth' options have no effect (IM and GM), regardless of value and remap/morph options. (output has identical checksum)
     remap_arg = ("+remap" if (Globals.MAGICKLIBRARY == "IM") else ' ') # IM-only; GM does not recognize 'remap'
+    if (palette is not None): remap_arg = (f"-remap '{palette}'" if (Globals.MAGICKLIBRARY == "IM") else f"-map '{palette}'");
     use_morph = False; morph_arg = ("-morph 10" if use_morph else ' ')
     
     # delay must be specified BEFORE INPUT when using ImageMagick
@@ -248,9 +257,11 @@ def argstr_GIF(delay:int) -> tuple[str,str]:
     useDither = False; dithering = ' ' if useDither else "+dither" # '+dither' disables dithering
     # dithering prevents color-banding but causes visual static, increases filesize by 50%, and cripples '+remap' operation
     
+    colors_arg = (f"-colors {colors}" if ((colors < 256) and (palette is None)) else ' ') # reduced palette (previews); a global palette is already reduced
+    
     maybe_arg = ' '.join((disposing, delay_arg)) if (not isIM) else ' '
     argstrOne = f"{disposing} {delay_arg}".replace('  ','').strip() if isIM else None
-    argstrTwo = f"{dithering} {morph_arg} {maybe_arg} {remap_arg}".replace('  ','').strip()
+    argstrTwo = f"{dithering} {morph_arg} {colors_arg} {maybe_arg} {remap_arg}".replace('  ','').strip()
     return (argstrOne, argstrTwo)
 
 
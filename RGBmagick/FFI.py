@@ -106,6 +106,16 @@ def EpicFunction():
     return retval
 
 
+def SpriteSheet(frame_directory:pathlib.Path, columns:int, output:str) -> int:
+    """ int SpriteSheet(const char directory[], int columns, const char outpath[])
+    :param output: format-prefixed path ('PNG:...')
+    :return: number of frames in the sheet; -1 on failure """
+    spritesheet = rgblib["SpriteSheet"]
+    spritesheet.argtypes = [c_char_p, c_int, c_char_p]
+    spritesheet.restype = c_int
+    return spritesheet(ASCIIenc(str(frame_directory)), c_int(columns), ASCIIenc(output))
+
+
 if __name__ == "__main__":
     div = [f"{'_'*150}\n", f"\n{'_'*150}"]
     print(f"{div[0]}PythonStrPlz{div[1]}"); PythonStrPlz();
@@ -2,6 +2,7 @@
 #include <format>
 #include <vector>
 #include <filesystem>
+#include <algorithm>
 
 #include <Magick++.h>
 //#include <magick/MagickCore.h>
@@ -42,36 +43,46 @@ const char* GetImageSize(const char imagepath[]) {
 
 
 // Magick::readImages doesn't accept format-specifiers ("frame%03d.png"); image sequences must be loaded manually
-std::vector<Magick::Image> LoadImageDirectory(std::string directory) {
+std::vector<Magick::Image> LoadImageDirectory(std::string directory, bool trim = true) {
 	std::vector<Magick::Image> imageList{}; imageList.reserve(360);
-	// this iterates the directory in REVERSE order!?
+	// directory_iterator has no defined order; frames are sorted by filename
+	std::vector<std::filesystem::path> framepaths{};
 	for(std::filesystem::directory_entry const& file: 
 		std::filesystem::directory_iterator{directory}) {
-		Magick::Image& newimg{imageList.emplace_back(file.path())}; newimg.trim( );
+		if (file.path().extension() == ".cache") continue; // MPC pixel-cache; read through its '.mpc'
+		framepaths.push_back(file.path());
+	}
+	std::sort(framepaths.begin(), framepaths.end());
+	for (std::filesystem::path const& framepath: framepaths) {
+		Magick::Image& newimg{imageList.emplace_back(framepath)}; if (trim) newimg.trim( );
 		std::string info = std::format("[{}x{}]", newimg.columns(), newimg.rows());
-		std::cout << "loading: " << file.path().filename() << ": " << info << '\n'; // TODO: debug toggle
+		std::cout << "loading: " << framepath.filename() << ": " << info << '\n'; // TODO: debug toggle
 	}
 	std::cout << std::format("loaded '{}' [{} images]", directory, imageList.size()) << '\n';
 	return imageList;
 }
-// TODO: need to filter out the '.cache' files when loading MPC-frames
-// if (file.path().extension() == ".mpc")
 
-void ImageGrid(std::vector<Magick::Image>& imagelist, int stacklength, bool vert, std::string pfixstr)
-{   // vertical image ordering stacks columns first, each stacklength-tall, then combines horizontally
+// vertical image ordering stacks columns first, each stacklength-tall, then combines horizontally
+// an incomplete last stack is either padded with transparent frames or dropped (appending uneven stacks segfaults)
+Magick::Image BuildGrid(std::vector<Magick::Image>& imagelist, std::size_t stacklength, bool vert, bool pad)
+{
 	std::vector<Magick::Image> stacks{}; stacks.reserve(64);
-	// segfaults if framestacks aren't all the same length
-	if ((imagelist.size() % stacklength) != 0) {
+	if (const auto remainder{imagelist.size() % stacklength}; remainder != 0) {
 		std::cout << std::format(
 			"[WARNING] imagelist[{}] is not divisible by stacksize: {}[+{}]",
-			imagelist.size(), stacklength, (imagelist.size() % stacklength)
+			imagelist.size(), stacklength, remainder
 		) << '\n';
-		for (auto rem{(imagelist.size() % stacklength)}; rem > 0; --rem)
+		if (pad) {
+			const Magick::Geometry framesize{imagelist.front().columns(), imagelist.front().rows()};
+			for (auto missing{stacklength - remainder}; missing > 0; --missing)
+				imagelist.emplace_back(framesize, Magick::Color("none"));
+		}
+		else for (auto rem{remainder}; rem > 0; --rem)
 			imagelist.pop_back(); // resize until evenly divisible
 		std::cout << "new length: " << imagelist.size() << '\n';
 	}
 	
-	for(auto iter {imagelist.rbegin()}; iter < imagelist.rend();) {
+	for(auto iter {imagelist.begin()}; iter < imagelist.end();) {
 	/*	std::cout << "next stack: " << iter->fileName() << '\n'; */
 		Magick::Image& stacked{stacks.emplace_back()};
 		Magick::appendImages(&stacked, iter, iter+stacklength, vert); // vertical
@@ -80,10 +91,18 @@ void ImageGrid(std::vector<Magick::Image>& imagelist, int stacklength, bool vert
 	}
 	
 	Magick::Image framegrid{};
-	const auto stacksz_rows = (vert? stacklength : stacks.size());
-	const auto stacksz_cols = (vert? stacks.size() : stacklength);
 	Magick::appendImages(&framegrid, stacks.begin(), stacks.end(), !vert); // horizontal
 	framegrid.repage(); // updating pagesize to new image geometry; extremely important!
+	return framegrid;
+}
+
+void ImageGrid(std::vector<Magick::Image>& imagelist, int stacklength, bool vert, std::string pfixstr)
+{
+	Magick::Image framegrid{BuildGrid(imagelist, stacklength, vert, false)};
+	const std::size_t stacksize = stacklength;
+	const std::size_t stackcount = (imagelist.size() / stacksize);
+	const auto stacksz_rows = (vert? stacksize : stackcount);
+	const auto stacksz_cols = (vert? stackcount : stacksize);
 	
 	std::string filename = std::format("_{}{}_image_grid_[{}x{}].png",
 		(vert?'V':'H'), imagelist.size(), stacksz_cols, stacksz_rows);
@@ -96,6 +115,24 @@ void ImageGrid(std::vector<Magick::Image>& imagelist, int stacklength, bool vert
 }
 
 
+extern "C" { // libRGBmagick.so exports (SpriteSheet.py) //
+// row-major spritesheet: every frame in the directory, 'columns' per row; the last row is padded with transparent frames
+// returns the number of frames, or -1 on failure
+int SpriteSheet(const char directory[], int columns, const char outpath[]) {
+	try {
+		std::vector<Magick::Image> imagelist{LoadImageDirectory(directory, false)};
+		if (imagelist.empty() || (columns < 1)) return -1;
+		const int framecount = imagelist.size();
+		Magick::Image sheet{BuildGrid(imagelist, columns, false, true)};
+		sheet.write(outpath);
+		std::cout << std::format("spritesheet[{} frames]({}x{} pixels): {}\n", framecount, sheet.columns(), sheet.rows(), outpath);
+		return framecount;
+	} catch (Magick::Exception& error) { std::cout << "[ERROR] SpriteSheet: " << error.what() << '\n'; }
+	return -1;
+}
+}// extern "C"
+
+
 // stripped from library //
 #ifndef IS_LIBRARY_BUILD
 void PrintBuildInfo() {
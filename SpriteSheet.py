@@ -0,0 +1,74 @@
+import pathlib
+import subprocess
+import math
+import json
+import sys
+
+import Kernels
+
+# '--format SHEET': every frame tiled into one PNG (row-major), plus a json index ('<name>.sheet.json') describing the grid and timing;
+# clients step through the cells with CSS/WebGL instead of decoding an animated file. The sheet is built by libRGBmagick's 'SpriteSheet'
+# (the 'ImageGrid' code in 'RGBmagick/test.cpp', called through 'RGBmagick/FFI.py') when it has been built; otherwise by magick's 'montage'.
+# invoked from the rendering commands: 'SpriteSheet.py LIBRARY DELAY FRAMES OUTPUT'
+
+SHEET_SUFFIX = "sheet.png" # output-extension of the 'SHEET' format (see 'Task.FillExpectedOutputs')
+MAX_SHEET_DIMENSION = 16384 # pixels; common GPU texture-size limit. Larger sheets are still written, with a warning
+ASPECT_TOLERANCE = 2.0 # a grid without empty cells is preferred unless it's this much less square than the squarest grid
+FFI_LIBRARY = (pathlib.Path(__file__).parent / "RGBmagick" / "libRGBmagick.so")
+
+
+def GridShape(frame_count:int, width:int, height:int) -> tuple[int,int]:
+    """ :return: (columns, rows) of the squarest sheet (in pixels); grids that fit the frames exactly are preferred """
+    def Aspect(columns:int) -> float:
+        rows = math.ceil(frame_count / columns)
+        return max((columns * width) / (rows * height), (rows * height) / (columns * width))
+    squarest = min(range(1, frame_count + 1), key=Aspect)
+    exact = [C for C in range(1, frame_count + 1) if ((frame_count % C) == 0) and (Aspect(C) <= (Aspect(squarest) * ASPECT_TOLERANCE))]
+    columns = (min(exact, key=Aspect) if (len(exact) > 0) else squarest)
+    return (columns, math.ceil(frame_count / columns))
+
+
+def IndexPath(sheet_path:pathlib.Path) -> pathlib.Path: return sheet_path.with_suffix(".json"); # 'name.sheet.png' -> 'name.sheet.json'
+
+
+def BuildSheet(library:str, frame_format:str, frames:list[pathlib.Path], columns:int, rows:int, output_path:pathlib.Path):
+    # libRGBmagick is ImageMagick; it can't read GraphicsMagick's MPC pixel-cache. it also loads the whole directory, so that must be only frames
+    only_frames = ({F for F in frames[0].parent.iterdir() if (F.suffix != ".cache")} == set(frames))
+    if (FFI_LIBRARY.exists() and only_frames and ((library == "IM") or (frame_format != "MPC"))):
+        from RGBmagick import FFI
+        if (FFI.SpriteSheet(frames[0].parent, columns, f"PNG:{output_path}") == len(frames)): return;
+        print("[WARNING] libRGBmagick failed to build the spritesheet; using montage")
+    frame_specs = [f"{frame_format}:{F}" for F in frames]
+    subprocess.run([*Kernels.MagickCommand(library, "montage"), *frame_specs, "-tile", f"{columns}x{rows}", "-geometry", "+0+0", "-background", "none", f"PNG:{output_path}"], check=True)
+    return
+
+
+def WriteSheet(library:str, delay:int, frames_spec:str, output_path:pathlib.Path):
+    """ :param delay: centiseconds per frame (same as the GIF '-delay') """
+    (frame_format, frame_glob) = Kernels.ParseSpec(frames_spec)
+    frames = sorted(frame_glob.parent.glob(frame_glob.name))
+    assert(len(frames) > 0), f"no frames matching '{frames_spec}'";
+    (width, height) = Kernels.Geometry(library, f"{frame_format}:{frames[0]}")
+    (columns, rows) = GridShape(len(frames), width, height)
+    if (max(columns * width, rows * height) > MAX_SHEET_DIMENSION):
+        print(f"[WARNING] spritesheet is {columns * width}x{rows * height}; larger than most GPUs accept ({MAX_SHEET_DIMENSION}px). try a smaller '--scale'")
+    BuildSheet(library, frame_format, frames, columns, rows, output_path)
+    index = {
+        "image": output_path.name, "frame_count": len(frames), "frame_width": width, "frame_height": height,
+        "columns": columns, "rows": rows, "duration_ms": (delay * 10), "loop": True,
+        "frames": [{"x": ((I % columns) * width), "y": ((I // columns) * height)} for I in range(len(frames))],
+    }
+    with IndexPath(output_path).open(mode='w', encoding='utf-8') as index_file: json.dump(index, index_file, indent=2);
+    print(f"[SpriteSheet] {len(frames)} frames in a {columns}x{rows} grid ({columns * width}x{rows * height}) -> {output_path.name}")
+    return
+
+
+def SheetCommand(library:str, delay:int, frames_spec:str, output_path:pathlib.Path) -> str:
+    return f"'{sys.executable}' '{pathlib.Path(__file__).absolute()}' {library} {delay} {frames_spec} '{output_path}'"
+
+
+if __name__ == "__main__":
+    # usage: SpriteSheet.py {IM,GM} DELAY FRAMES OUTPUT
+    (library, delay, frames_spec, output_path) = sys.argv[1:5]
+    assert(library in ("IM", "GM")), f"invalid library: {library}";
+    WriteSheet(library, int(delay), frames_spec, pathlib.Path(output_path))
@@ -0,0 +1,472 @@
+import pathlib
+import re
+import shutil
+import atexit
+import subprocess
+import fcntl
+import time
+import zlib
+import json
+import os
+
+import Globals
+import Task
+import Kernels
+
+
+# rough on-disk size per pixel of each intermediate format (RGBA)
+BYTES_PER_PIXEL = {
+    "MPC": 8,  # raw Q16 pixel-cache; uncompressed
+    "MIFF": 8, # uncompressed unless told otherwise
+    "PNG": 3,  # compressed; RGBA frames rarely exceed this
+    "RGBA": 4, # raw frame-store (FrameStore.py); 8-bit RGBA
+}
+
+# fraction of free space the plan may consume; the rest is left for magick's own temp-files and pixel-cache
+CAPACITY_HEADROOM = 0.85
+
+# '--tempcompress': zlib-compressed MIFF frame-sets (see 'Task.COMPRESSED_MIFF_OPTS')
+COMPRESSION_RATIO = 0.45 # typical compressed/raw size of modulated frames at zlib level 1 (flat regions compress extremely well); used unless measured
+THROUGHPUT_SAMPLE = (64 * 1024 * 1024) # bytes written when measuring disk throughput
+THROUGHPUT_CACHE_PATH = Globals.PROGRAM_DIR / "throughput_cache.json" # filesystem -> measured throughput; the probe runs once per disk
+THROUGHPUT_CACHE_AGE = (7 * 86400) # seconds; older measurements are repeated
+COMPRESSION_SAMPLE = 1024 # pixels; side of the square cropped from the source-image for the zlib benchmark (4MB of RGBA)
+
+
+def HumanBytes(N:int|float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if (abs(N) < 1024): return f"{N:.1f}{unit}";
+        N /= 1024
+    return f"{N:.1f}TB"
+
+
+def FindMount(path:pathlib.Path) -> tuple[str,str]|None:
+    """ :return: (mountpoint, fstype) of the filesystem containing path (from '/proc/mounts') """
+    path = path.resolve(); best = None
+    try:
+        with open("/proc/mounts", mode='r', encoding='utf-8') as mounts:
+            for line in mounts:
+                (_, mountpoint, fstype, *_) = line.split()
+                mountpoint = mountpoint.replace("\\040", " ") # spaces are octal-escaped
+                if path.is_relative_to(mountpoint) and ((best is None) or (len(mountpoint) > len(best[0]))):
+                    best = (mountpoint, fstype)
+    except OSError: return None;
+    return best
+
+
+def IsTmpfs(path:pathlib.Path) -> bool:
+    return ((mount := FindMount(path)) is not None) and (mount[1] == "tmpfs")
+
+
+def FreeSpace(path:pathlib.Path) -> int:
+    """ bytes available to unprivileged users (for tmpfs, this is the remaining 'size=' limit) """
+    stats = os.statvfs(path)
+    return (stats.f_bavail * stats.f_frsize)
+
+
+def MeasureDiskThroughput(directory:pathlib.Path, sample_size:int=THROUGHPUT_SAMPLE) -> float:
+    """ :return: sustained write+read throughput of directory's filesystem in bytes/sec (fsync'd; page-cache dropped for the read) """
+    block = os.urandom(1024 * 1024) # incompressible; filesystems with transparent compression would inflate the result otherwise
+    probe = directory / ".throughput_probe"
+    try:
+        start = time.perf_counter()
+        with probe.open(mode='wb') as probe_file:
+            for _ in range(sample_size // len(block)): probe_file.write(block);
+            probe_file.flush(); os.fsync(probe_file.fileno())
+            os.posix_fadvise(probe_file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        with probe.open(mode='rb') as probe_file:
+            while probe_file.read(len(block)): pass;
+        elapsed = (time.perf_counter() - start)
+    finally: probe.unlink(missing_ok=True);
+    return ((2 * sample_size) / elapsed)
+
+
+def FilesystemKey(path:pathlib.Path) -> str:
+    """ identifies the filesystem containing path: device-number, mountpoint and type (device-numbers alone are reused across mounts) """
+    (mountpoint, fstype) = (FindMount(path) or ("?", "?"))
+    return f"{os.stat(path).st_dev}:{mountpoint}:{fstype}"
+
+
+def CachedDiskThroughput(directory:pathlib.Path, cache_path:pathlib.Path=THROUGHPUT_CACHE_PATH) -> float:
+    """ 'MeasureDiskThroughput', reusing an earlier measurement of the same filesystem (see 'Checksum.CachedDigest') """
+    key = FilesystemKey(directory)
+    try:
+        with cache_path.open(mode='r', encoding='utf-8') as cache_file: cache = json.load(cache_file);
+    except FileNotFoundError: cache = {};
+    except (json.JSONDecodeError, OSError) as E: print(f"[WARNING] discarding unreadable throughput-cache ({E})"); cache = {};
+    if ((entry := cache.get(key)) is not None) and ((time.time() - entry["measured"]) < THROUGHPUT_CACHE_AGE): return entry["rate"];
+    rate = MeasureDiskThroughput(directory)
+    cache[key] = {"rate": rate, "measured": time.time()}
+    temp_path = cache_path.with_name(f"{cache_path.name}.tmp")
+    with temp_path.open(mode='w', encoding='utf-8') as cache_file: json.dump(cache, cache_file, indent=1);
+    temp_path.replace(cache_path) # atomic; concurrent runs never see a partially written cache
+    return rate
+
+
+def MeasureCompression(sample_spec:str, library:str) -> tuple[float,float]:
+    """ zlib level-1 over real pixels: raw 8-bit RGBA of a square cropped from the center of sample_spec (format-prefixed image)
+    :return: throughput of a single core in bytes/sec, compressed/raw size-ratio """
+    crop = f"{COMPRESSION_SAMPLE}x{COMPRESSION_SAMPLE}+0+0"
+    decoded = subprocess.run([*Kernels.MagickCommand(library, "convert"), sample_spec, "-gravity", "Center", "-crop", crop, "+repage", "-depth", "8", "RGBA:-"], check=True, capture_output=True)
+    sample = decoded.stdout
+    start = time.perf_counter()
+    compressed = zlib.compress(sample, level=1)
+    return ((len(sample) / (time.perf_counter() - start)), (len(compressed) / len(sample)))
+
+
+def ChooseTempCompression(workdir:pathlib.Path, mode:str, sample_spec:str, library:str) -> tuple[bool,float|None]:
+    """ decides whether primary-format frame-sets are written as zlib-compressed MIFF ('--tempcompress')
+    'auto' compares the time to write+read raw frames against compressing on the idle cores and moving the smaller result.
+    tmpfs is never compressed; memory bandwidth always wins there.
+    :param mode: 'on', 'off', or 'auto'
+    :param sample_spec: format-prefixed source-image; the zlib benchmark runs on its pixels
+    :return: whether to compress, and the measured compressed/raw size-ratio (None unless 'auto' measured it; see 'EstimateFootprint') """
+    if (mode != "auto"): return ((mode == "on"), None);
+    if IsTmpfs(workdir): print("[TEMPCOMPRESS] workdir is tmpfs; frame-sets stay uncompressed"); return (False, None);
+    try: (zlib_rate, ratio) = MeasureCompression(sample_spec, library);
+    except (subprocess.CalledProcessError, OSError) as E: print(f"[TEMPCOMPRESS] can't sample '{sample_spec}' ({E}); frame-sets stay uncompressed"); return (False, None);
+    disk_rate = CachedDiskThroughput(workdir)
+    idle_cores = max(1.0, (os.cpu_count() or 1) - os.getloadavg()[0])
+    zlib_rate *= idle_cores
+    # seconds per byte of raw frame-data; compression overlaps with magick's own work, so only the slower of the two counts
+    raw_cost = (1 / disk_rate)
+    compressed_cost = max((1 / zlib_rate), (ratio / disk_rate))
+    use_compression = (compressed_cost < raw_cost)
+    print(f"[TEMPCOMPRESS] disk: {HumanBytes(disk_rate)}/s | zlib: {HumanBytes(zlib_rate)}/s ({idle_cores:.1f} idle cores, ratio {ratio:.2f})"
+          f" -> {'compressed' if use_compression else 'uncompressed'} intermediates")
+    return (use_compression, ratio)
+
+
+def EstimateFootprint(task:Task.TaskT) -> dict[str,int]:
+    """ estimates size of each intermediate created by 'ImagePreprocess' (must be called after it)
+    :return: intermediate-name -> estimated bytes """
+    (width, height) = getattr(task.image_source, "dimensions", (1920, 1080)) # 'dimensions' is set by MakeImageSources
+    estimates = {}
+    for (name, sink) in task.intermediates.items():
+        pixels = (width * height) * ((sink.scale / 100) ** 2)
+        bpp = BYTES_PER_PIXEL.get(sink.image_format.upper(), 8)
+        if (task.compress_frames and sink.multisource and (sink.image_format == "MIFF")): bpp *= (task.compression_ratio or COMPRESSION_RATIO);
+        frames = (sink.frame_count if (sink.image_format == "RGBA") else len(sink.UniqueFrames())) # frame-stores are a single file
+        estimates[name] = int(pixels * bpp * frames)
+    return estimates
+
+
+def SpillDirectory(configured:str|None, workdir:pathlib.Path) -> pathlib.Path:
+    """ disk-backed location for intermediates that don't fit on tmpfs; 'spill_dir' in MAIN_OPTIONS """
+    spill_root = (pathlib.Path(configured).expanduser() if configured else (Globals.PROGRAM_DIR / f"{Globals.TOPLEVEL_NAME}_SPILL"))
+    return (spill_root / workdir.name)
+
+
+def PlanStorage(task:Task.TaskT, spill_config:str|None, autodelete:bool) -> list[pathlib.Path]:
+    """ compares estimated footprint against free space on the workdir's filesystem.
+    If it won't fit, the largest multisource intermediates (frame directories and frame-stores) are moved to a disk-backed spill-directory,
+    replaced with symlinks so that every generated command keeps working unmodified. Small files (single images) stay in RAM.
+    Must be called after 'ImagePreprocess' and before any of its commands execute.
+    :return: list of relocated directories """
+    workdir = task.working_path
+    estimates = EstimateFootprint(task)
+    total = sum(estimates.values())
+    available = int(FreeSpace(workdir) * CAPACITY_HEADROOM)
+    on_tmpfs = IsTmpfs(workdir)
+    
+    print(f"\n{'_'*120}\n")
+    print(f"[STORAGE] estimated intermediate footprint: {HumanBytes(total)} | usable: {HumanBytes(available)} [{'tmpfs' if on_tmpfs else 'disk'}]")
+    for (name, size) in sorted(estimates.items(), key=lambda pair: pair[1], reverse=True)[:8]:
+        print(f"  {HumanBytes(size):>9}  {name}")
+    
+    relocated = []
+    if (total <= available): print(f"[STORAGE] plan fits in workdir\n{'_'*120}\n"); return relocated;
+    if not on_tmpfs:
+        print(f"[WARNING] estimated footprint exceeds free space on '{workdir}' (not tmpfs; nowhere to spill)\n{'_'*120}\n")
+        return relocated
+    
+    spill_dir = SpillDirectory(spill_config, workdir)
+    spill_dir.mkdir(parents=True, exist_ok=True)
+    if IsTmpfs(spill_dir): print(f"[WARNING] spill-directory is also tmpfs: '{spill_dir}'");
+    if autodelete: atexit.register(DiscardDirectory, spill_dir);
+    
+    candidates = sorted(
+        [(size, sink) for (name, size) in estimates.items() if ((sink := task.intermediates[name]).multisource or (sink.image_format == "RGBA"))],
+        key=lambda pair: pair[0], reverse=True
+    )
+    for (size, sink) in candidates:
+        if (total <= available): break;
+        framedir = sink.srcpath
+        if framedir.is_symlink(): continue; # already relocated
+        if (not sink.multisource): # frame-store; the symlink dangles until magick creates the file through it
+            if framedir.exists(): print(f"  [WARNING] not spilling existing frame-store: '{framedir.name}'"); continue;
+            framedir.symlink_to(destination := spill_dir / framedir.name)
+        else:
+            if framedir.exists() and any(framedir.iterdir()):
+                print(f"  [WARNING] not spilling non-empty directory: '{framedir.name}'"); continue;
+            if framedir.exists(): framedir.rmdir();
+            (destination := spill_dir / framedir.name).mkdir(exist_ok=True)
+            framedir.symlink_to(destination, target_is_directory=True)
+        print(f"  spilling: {framedir.name} -> {destination} ({HumanBytes(size)})")
+        relocated.append(framedir); total -= size
+    
+    status = ("fits after spilling" if (total <= available) else "STILL EXCEEDS free space")
+    print(f"[STORAGE] {len(relocated)} intermediates spilled to disk; remaining in RAM: {HumanBytes(total)} ({status})\n{'_'*120}\n")
+    return relocated
+
+
+class IntermediateRefsT():
+    """ reference-counts every intermediate in 'task.intermediates' against the commands still waiting to read it.
+    Once the last consuming command has finished, the intermediate is deleted (frees tmpfs while the job is still running).
+    Commands are matched by path: intermediates are always quoted ('FMT:path'), frame-directories are read as 'dir/frame...'.
+    'gm batch' commands are expanded into the contents of their batchfile. """
+    BATCH_PATTERN = re.compile(r"^gm batch .*'([^']+)'$")
+    
+    def __init__(self, task:Task.TaskT, enabled:bool=True):
+        self.enabled = enabled
+        self.intermediates = dict(task.intermediates)
+        self.refcounts : dict[str,int] = {}
+        self.removed : dict[str,int] = {} # name -> freed bytes
+        return
+    
+    @staticmethod
+    def ExpandBatch(command:str) -> list[str]:
+        if (match := IntermediateRefsT.BATCH_PATTERN.match(command)) is None: return [command];
+        with open(match.group(1), mode='r', encoding='utf-8') as batchfile: return [L for L in batchfile.read().splitlines() if L.strip()];
+    
+    def References(self, command:str) -> list[str]:
+        return [name for (name, sink) in self.intermediates.items()
+                if ((f"{sink.srcpath}/" if sink.multisource else f"{sink.srcpath}'") in command)]
+    
+    def Plan(self, command_stages:list[list[str]]):
+        """ counts references over every command that will execute, in any stage. Must be called before the first one runs """
+        if not self.enabled: return;
+        for stage in command_stages:
+            for command in [C for batch_cmd in stage for C in self.ExpandBatch(batch_cmd)]:
+                for name in self.References(command): self.refcounts[name] = 1 + self.refcounts.get(name, 0);
+        unreferenced = [name for name in self.intermediates if (name not in self.refcounts)]
+        if unreferenced: print(f"[CLEANUP] never consumed: {', '.join(unreferenced)}");
+        return
+    
+    def Consumed(self, command:str):
+        """ decrements references held by a finished command (or batch); removes intermediates that dropped to zero """
+        if not self.enabled: return;
+        for expanded in self.ExpandBatch(command):
+            for name in self.References(expanded):
+                if (name not in self.refcounts): continue; # already removed
+                self.refcounts[name] -= 1
+                if (self.refcounts[name] == 0): del self.refcounts[name]; self.Remove(name);
+        return
+    
+    def Remove(self, name:str):
+        path = self.intermediates[name].srcpath
+        companions = [path.with_suffix('.cache')] if (path.suffix == '.mpc') else [path.with_name(f"{path.name}.json")] # MPC pixel-cache / frame-store sidecar
+        freed = 0
+        for target in [path, *companions]:
+            if not (target.exists() or target.is_symlink()): continue;
+            real_target = target.resolve() # spilled intermediates are symlinks into the spill-directory
+            freed += DiskUsage(real_target)
+            if real_target.is_dir(): shutil.rmtree(real_target, ignore_errors=True);
+            else: real_target.unlink(missing_ok=True);
+            if target.is_symlink(): target.unlink();
+        self.removed[name] = freed
+        print(f"[CLEANUP] removed consumed intermediate: {name} ({HumanBytes(freed)})")
+        return
+    
+    def Report(self):
+        if not self.enabled: print("[CLEANUP] disabled (--noclean); intermediates preserved"); return;
+        print(f"[CLEANUP] {len(self.removed)} intermediates removed during run; {HumanBytes(sum(self.removed.values()))} freed early")
+        return
+
+
+FICLONE = 0x40049409 # ioctl request: reflink (copy-on-write clone) on btrfs/xfs; linux/fs.h
+
+def NumberedBackup(destination:pathlib.Path) -> pathlib.Path|None:
+    """ moves an existing destination aside, named like 'cp --backup=numbered' ('file.~1~') """
+    if not destination.exists(): return None;
+    number = 1
+    while (backup := destination.with_name(f"{destination.name}.~{number}~")).exists(): number += 1;
+    destination.rename(backup)
+    print(f"  backup: '{destination.name}' -> '{backup.name}'")
+    return backup
+
+
+def TryReflink(source:pathlib.Path, destination:pathlib.Path) -> bool:
+    try:
+        with source.open(mode='rb') as src, destination.open(mode='xb') as dst: fcntl.ioctl(dst.fileno(), FICLONE, src.fileno());
+        return True
+    except OSError: destination.unlink(missing_ok=True); return False;
+
+
+def PublishOutput(work_file:pathlib.Path, final_dest:pathlib.Path, keep_workfile:bool) -> str:
+    """ moves an output to its destination without rewriting it whenever possible:
+      same device: atomic rename (or a reflink/hardlink when the workdir is preserved)
+      other device: streamed copy (copy_file_range/sendfile) to a temporary name, then renamed into place
+    :param keep_workfile: workdir is not autodeleted (it may be reused); the work_file must stay intact
+    :return: method used """
+    NumberedBackup(final_dest) # FillExpectedOutputs already avoids collisions; this covers files created since
+    same_device = (work_file.stat().st_dev == final_dest.parent.stat().st_dev)
+    if same_device and not keep_workfile: work_file.rename(final_dest); method = "rename";
+    elif same_device and TryReflink(work_file, final_dest): method = "reflink";
+    elif same_device: os.link(work_file, final_dest); method = "hardlink";
+    else:
+        partial = final_dest.with_name(f".{final_dest.name}.partial")
+        shutil.copyfile(work_file, partial) # uses in-kernel copy on linux
+        shutil.copystat(work_file, partial)
+        partial.rename(final_dest); method = "copy";
+        if not keep_workfile: work_file.unlink();
+    print(f"  [{method}] '{work_file.name}' -> '{final_dest}'")
+    return method
+
+
+
+LOCKFILE_NAME = ".rgb_lock" # held (shared flock) by the job using a workdir; the GC never evicts a locked workdir
+DEFAULT_GC_BUDGET = "32GB"
+DEFAULT_GC_MAX_AGE = 7 # days
+
+def ParseBytes(size:str|int|None) -> int|None:
+    """ '64GB' -> bytes (same notation as the magick resource-limits in 'SetupENV') """
+    if (size is None) or isinstance(size, int): return size;
+    size = size.strip().upper().removesuffix('B')
+    multipliers = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+    if (size[-1:] in multipliers): return int(float(size[:-1]) * multipliers[size[-1]]);
+    return int(size)
+
+
+def LockWorkdir(workdir:pathlib.Path):
+    """ marks workdir as in-use (and most-recently-used) for the lifetime of this process """
+    lockfile = (workdir / LOCKFILE_NAME).open(mode='a')
+    fcntl.flock(lockfile.fileno(), fcntl.LOCK_SH)
+    os.utime(lockfile.fileno())
+    Globals.WORKDIR_LOCK = lockfile # keeps the descriptor (and therefore the lock) alive
+    return lockfile
+
+
+def IsLocked(workdir:pathlib.Path) -> bool:
+    if not (lockpath := workdir / LOCKFILE_NAME).exists(): return False;
+    with lockpath.open(mode='a') as lockfile:
+        try: fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB);
+        except BlockingIOError: return True;
+        fcntl.flock(lockfile.fileno(), fcntl.LOCK_UN)
+    return False
+
+
+def DiscardWorkdir(workdir:pathlib.Path):
+    """ exit-time 'DiscardDirectory' for this process's workdir; releases its lock first, and leaves the workdir in place
+    if another process (which reused it) still holds a lock """
+    if ((lockfile := Globals.WORKDIR_LOCK) is not None): lockfile.close(); Globals.WORKDIR_LOCK = None;
+    if IsLocked(workdir): print(f"[WARNING] not discarding '{workdir.name}'; in use by another process"); return;
+    DiscardDirectory(workdir)
+    return
+
+
+def LastUsed(workdir:pathlib.Path) -> float:
+    lockpath = workdir / LOCKFILE_NAME
+    return (lockpath if lockpath.exists() else workdir).stat().st_mtime
+
+
+def DiskUsage(path:pathlib.Path) -> int:
+    """ bytes under path (symlinks are not followed; spilled directories are accounted separately) """
+    if not path.is_dir(): return path.lstat().st_size;
+    total = 0
+    for (root, dirs, files) in os.walk(path):
+        for name in files:
+            try: total += os.lstat(os.path.join(root, name)).st_blocks * 512;
+            except FileNotFoundError: continue;
+    return total
+
+
+def FindWorkdirs(toplevel:pathlib.Path) -> list[pathlib.Path]:
+    return [D for D in toplevel.iterdir() if D.is_dir() and (not D.is_symlink())
+            and D.name.endswith(("_GM", "_IM")) and (not D.name.startswith("TEMP_"))]
+
+
+def EvictWorkdir(workdir:pathlib.Path, spill_root:pathlib.Path):
+    shutil.rmtree(workdir, ignore_errors=True)
+    if (spilled := spill_root / workdir.name).exists(): shutil.rmtree(spilled, ignore_errors=True);
+    return
+
+
+def CollectGarbage(toplevel:pathlib.Path, budget:str|int|None=DEFAULT_GC_BUDGET, max_age_days:float|None=DEFAULT_GC_MAX_AGE, spill_config:str|None=None) -> int:
+    """ evicts least-recently-used workdirs (and their spill-directories) under toplevel until
+    total usage fits the byte-budget, and any workdir older than max_age regardless of budget.
+    Workdirs locked by a running job are never touched. Stale magick temp-files are removed as well.
+    :return: bytes freed """
+    assert(toplevel.name == Globals.TOPLEVEL_NAME), f"expected '{Globals.TOPLEVEL_NAME}', got '{toplevel}'";
+    budget = ParseBytes(budget); now = time.time()
+    max_age = ((max_age_days * 86400) if (max_age_days is not None) else None)
+    spill_root = SpillDirectory(spill_config, toplevel).parent # 'SpillDirectory' appends the workdir-name
+    
+    workdirs = [(LastUsed(D), DiskUsage(D), D) for D in FindWorkdirs(toplevel)]
+    total = sum(size for (_, size, _) in workdirs)
+    print(f"[GC] {toplevel}: {len(workdirs)} workdirs, {HumanBytes(total)} [budget: {HumanBytes(budget) if budget else 'none'} | max-age: {max_age_days} days]")
+    
+    freed = 0; running = 0
+    for (last_used, size, workdir) in sorted(workdirs, key=lambda entry: entry[0]): # oldest first
+        expired = ((max_age is not None) and ((now - last_used) > max_age))
+        over_budget = ((budget is not None) and (total > budget))
+        if not (expired or over_budget): continue;
+        if IsLocked(workdir): running += 1; continue;
+        print(f"  evicting: {workdir.name} ({HumanBytes(size)}, last used {(now - last_used) / 3600:.1f}h ago){' [expired]' if expired else ''}")
+        EvictWorkdir(workdir, spill_root)
+        total -= size; freed += size
+    
+    # spill-directories whose workdir no longer exists (tmpfs was unmounted, or workdir was autodeleted during a crash)
+    if spill_root.is_dir():
+        for orphan in [D for D in spill_root.iterdir() if D.is_dir() and (D.name != TRASH_NAME) and not (toplevel / D.name).exists()]:
+            size = DiskUsage(orphan); freed += size
+            print(f"  removing orphaned spill-directory: {orphan.name} ({HumanBytes(size)})")
+            shutil.rmtree(orphan, ignore_errors=True)
+    
+    # pixel-cache and temp-files left behind by killed magick processes; only safe to clear outright when no job is running
+    jobs_running = any(IsLocked(D) for D in FindWorkdirs(toplevel))
+    for magick_tmp in [toplevel / f"TEMP_{MK}" for MK in ("IM", "GM")]:
+        if not magick_tmp.is_dir(): continue;
+        for tempfile in magick_tmp.iterdir():
+            if jobs_running and ((max_age is None) or ((now - tempfile.lstat().st_mtime) <= max_age)): continue;
+            freed += DiskUsage(tempfile)
+            if tempfile.is_dir() and not tempfile.is_symlink(): shutil.rmtree(tempfile, ignore_errors=True);
+            else: tempfile.unlink(missing_ok=True);
+    
+    for trash_root in (toplevel, spill_root): SweepTrash(trash_root); # finishes cleanups interrupted by shutdown/crash
+    print(f"[GC] freed {HumanBytes(freed)}{f' ({running} over-budget workdirs are in use)' if running else ''}\n")
+    return freed
+
+
+TRASH_NAME = ".trash" # discarded directories are renamed here (same filesystem), then deleted in the background
+
+def DetachedDelete(path:pathlib.Path):
+    """ deletes path in a background process that outlives this one (own session; no inherited stdio) """
+    subprocess.Popen(["nice", "-n", "19", "rm", "-rf", "--", str(path)], start_new_session=True,
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return
+
+
+def DiscardDirectory(path:pathlib.Path):
+    """ instant alternative to 'shutil.rmtree' at exit: the directory is renamed into the trash-area (atomic, O(1)),
+    and the actual unlinking happens detached. Anything left over by an interrupted delete is swept by 'SweepTrash'. """
+    if not path.exists(): return;
+    trash = path.parent / TRASH_NAME
+    trash.mkdir(exist_ok=True)
+    try: path.rename(destination := trash / f"{path.name}.{os.getpid()}");
+    except OSError as E: print(f"[WARNING] could not move '{path.name}' to trash ({E}); deleting in place"); destination = path;
+    DetachedDelete(destination)
+    print(f"discarded: '{path.name}' (deleting in background)")
+    return
+
+
+def SweepTrash(parent:pathlib.Path) -> int:
+    """ restarts deletion of anything still in the trash-area (a background delete may still be running; 'rm' tolerates that)
+    :return: number of entries found """
+    if not (trash := parent / TRASH_NAME).is_dir(): return 0;
+    leftovers = [*trash.iterdir()]
+    for entry in leftovers: DetachedDelete(entry);
+    if leftovers: print(f"  sweeping trash: {len(leftovers)} entries under '{trash}'");
+    return len(leftovers)
+
+
+if __name__ == "__main__":
+    # standalone garbage-collection; usage: Storage.py [budget] [max-age-days]
+    import sys
+    import Config
+    (_, _, main_options) = Config.Init()
+    gc_budget = (sys.argv[1] if (len(sys.argv) > 1) else main_options["gc_budget"])
+    gc_max_age = (float(sys.argv[2]) if (len(sys.argv) > 2) else main_options["gc_max_age_days"])
+    for toplevel in (Globals.PROGRAM_DIR / Globals.TOPLEVEL_NAME, pathlib.Path(f"/tmp/{Globals.TOPLEVEL_NAME}")):
+        if toplevel.is_dir(): CollectGarbage(toplevel, gc_budget, gc_max_age, main_options["spill_dir"]);
+    print("done")
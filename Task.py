@@ -1,5 +1,22 @@
 import pathlib
 import RGB
+import FrameStore
+import Kernels
+import NodeCache
+import Palette
+import GifWriter
+import WebpWriter
+import Presets
+import SpriteSheet
+
+# '--tempcompress': lossless zlib for MIFF frame-sets; MIFF maps '-quality' to zlib-level (quality/10), so level 1 (fastest)
+COMPRESSED_MIFF_OPTS = "-compress Zip -quality 10"
+
+# relative per-pixel costs for 'PlanFrameScales'; reading or writing a pixel costs 1
+MODULATE_COST = 4 # HSL round-trip ('-modulate', or the layer-kernel's hue-rotation)
+COMPOSITE_COST = 2 # reading a stacked layer and blending it
+DOWNSCALE_COST = 1 # box-filter ('-scale'), per source-pixel
+RENDER_COSTS = {"GIF": 3, "WEBP": 8, "APNG": 5, "MP4": 4, "SHEET": 2} # encoding an output-format, per frame-pixel; the same for generated and derived frames
 
 
 class ColorRemapT():
@@ -42,8 +59,15 @@ class ImageSourceT():
         self.multisource = False
         self.frame_count = 0
         self.indexlength = 0 # digits in frame_count
+        self.duplicate_frames:dict[int,int] = {} # frame-index -> index of an identical earlier frame
+        self.scale = 100 # percent; relative to the original dimensions
         return
     
+    def UniqueFrames(self) -> list[pathlib.Path]:
+        """paths actually written to disk (duplicate frames alias an earlier path)"""
+        if not self.multisource: return [self.srcpath];
+        return [F for (I,F) in enumerate(self.source_frames) if (I not in self.duplicate_frames)]
+    
     def GetNames(self):
         contents = (self.source_frames if self.multisource else [self.srcpath])
         return [F.name.removesuffix(''.join(F.suffixes)) for F in contents]
@@ -52,6 +76,11 @@ class ImageSourceT():
         contents = (self.source_frames if self.multisource else [self.srcpath for _ in range(length)])
         return [f"'{self.image_format}:{F}'" for F in contents]
     
+    def QuoteAll(self) -> str:
+        """single quoted spec covering every frame (a frame-glob for multisource); for commands that process whole sinks"""
+        if not self.multisource: return self.QuoteSource()[0];
+        return f"'{self.image_format}:{self.srcpath}/frame*.{self.image_format.lower()}'"
+
 
 
 class TextOverlayT(ImageSourceT):
@@ -91,7 +120,7 @@ class TaskT():
     self.output_fileformats = output_fileformats
     self.rendertext_sources = rendertext_sources
     
-    self.crop = BuildCropCommand(crop, grav)
+    self.crop = BuildCropCommand(ScaleCrop(crop, img_src.scale), grav) # pixel-values refer to the original; video may be decoded smaller
     self.rescales = (rescales if(rescales is not None) else ['100%'])
     
     (
@@ -104,18 +133,33 @@ class TaskT():
     
     self.stepsize_deltas = {} # edge, text, white, black
     self.delay = 5 # set GIF framerate (see RGB.argstr_GIF)
+    self.gif_colors = Palette.MAX_COLORS # palette-size of GIF outputs (reduced by '--preview')
+    self.gif_writer = False # palette-mapped GIF frames are encoded by GifWriter.py ('--gif-writer'); otherwise magick assembles them
+    self.preview_cycle = None # full rotation-cycle length when the frames are an evenly spaced sample of it ('--preview'; see 'Rotations')
     # if unspecified both magick-libraries use a value of 5
     # must be positive; zero is (equivalent to) delay of 10
     # ImageMagick requires the -delay option BEFORE input!!
     # GIFs using lower delay values consume an unreasonable amount of CPU during playback!
     
     self.frame_formats = [ primary_format, ]
-    if (('APNG' in output_fileformats) or ('MP4' in output_fileformats)): self.frame_formats.append('PNG');
+    if (('APNG' in output_fileformats) or ('MP4' in output_fileformats)): self.frame_formats.append('RGBA');
+    # 'RGBA' is a single raw frame-store file per scale (see FrameStore.py), not a directory of frames
     
     self.baseimgformat_override = "MPC" # override format of the first conversion to MPC for better performance
     if ((self.image_source.frame_count > 2000) and (self.primary_format != "MPC")): self.baseimgformat_override = primary_format;
     # except gigantic tasks must prioritize avoiding OOM instead - unless MPC is specified, cancel the override
     
+    self.use_kernels = Kernels.AVAILABLE # replace magick-command chains with numpy kernels where possible (Kernels.py)
+    self.compress_frames = False # write multisource MIFF intermediates with 'COMPRESSED_MIFF_OPTS' (see 'Storage.ChooseTempCompression')
+    self.compression_ratio = None # compressed/raw size measured by 'Storage.ChooseTempCompression' (None: not measured; 'Storage.COMPRESSION_RATIO')
+    self.node_cache = None # 'NodeCache.NodeCacheT'; restores unchanged preprocessing-sinks from earlier runs (None: disabled)
+    self.preprocess_scale = 100 # percent; resolution of everything between the crop and the final rescales (see 'PreprocessScale')
+    self.derived_scales : dict[int,int] = {} # scales whose frames are downscaled from a larger scale's frames (see 'PlanFrameScales')
+    self.late_scale = False # '--late-scale': preprocess at full-size and generate every scale's frames directly (bit-exact with earlier versions)
+    self.tile_size = None # kernels process huge images in tiles of this size, in parallel (see 'Kernels.TileSize'); None: whole images
+    self.render_preset = Presets.RENDER_PRESETS[Presets.DEFAULT_PRESET] # encoder-settings of every output-format ('--render-preset')
+    self.webp_method = None # overrides the preset's libwebp-method ('--webp-effort')
+    
     self.did_preprocess_img = False
     self.image_preprocessed = None # list of ImageSourceT converted to .miff - color-swapped, scaled and/or cropped
     self.preprocessing_cmds = []
@@ -124,6 +168,8 @@ class TaskT():
     self.frame_directories = {
         # miff_frames_scale50: (ImageSourceT, ImageSourceT) (source, dest)
     }
+    self.layer_stacks : dict[str,list[tuple]] = {} # frame-source magic -> [(layer, compose, stepsize-key|None)] above it; frames are composited per frame (single-pass)
+    self.intermediates : dict[str,ImageSourceT] = {} # every sink created by ImagePreprocess; keyed by name
     
     assert(primary_format in ('MPC','MIFF'))
     assert(output_filename.endswith('_RGB'))
@@ -131,6 +177,15 @@ class TaskT():
     return
   
   def GetRemapWB(self): return zip(self.whiteBlack, self.wb_fuzzing, self.thresholds, ('white','black'));
+  
+  def Rotations(self, stepsize:float) -> list[tuple[str,str]]:
+      """ 'RGB.EnumRotations' for every frame; previews sample the full cycle, so each frame keeps the rotation it has in the full render """
+      if (self.preview_cycle is None): return RGB.EnumRotations(stepsize, self.image_source.frame_count);
+      return RGB.SampleRotations(RGB.EnumRotations(stepsize, self.preview_cycle), self.image_source.frame_count)
+  
+  def PinnedSinks(self) -> list[ImageSourceT]:
+      """ outputs of the preprocessing-graph read by frame-generation; frame-sources and the layers stacked on them """
+      return [*self.image_preprocessed, *[layer for stack in self.layer_stacks.values() for (layer, _, _) in stack]]
 
 
 def BuildCropCommand(crop:tuple[int|str,int|str,int,int]|None, gravity:str="Center") -> str:
@@ -151,6 +206,19 @@ def BuildCropCommand(crop:tuple[int|str,int|str,int,int]|None, gravity:str="Cent
     # '+repage' output to remove virtual-canvas (crop doesn't actually resize the canvas)
 
 
+def ScaleCrop(crop:tuple[int|str,int|str,int,int]|None, percent:int) -> tuple|None:
+    """ pixel-values of a crop (percentages are unaffected) at a source scaled to 'percent' of its original size """
+    if (crop is None) or (percent == 100): return crop;
+    return tuple((V if (isinstance(V, str) or (V == 0)) else (max(1, round(abs(V) * percent / 100)) * (-1 if (V < 0) else 1))) for V in crop)
+
+
+def ScaleOffset(offset:tuple[tuple[int,int],str]|None, percent:int) -> tuple|None:
+    """ text-offset (see 'ParserTypes.ParsedOffset') for text composited onto a source scaled to 'percent' """
+    if (offset is None) or (percent == 100): return offset;
+    XY = tuple(round(V * percent / 100) for V in offset[0])
+    return (XY, "{:+d}{:+d}".format(*XY))
+
+
 def ParseScales(rescales:list[str]) -> list[tuple[int,str]]:
     results = []
     for scale in rescales:
@@ -173,6 +241,46 @@ def ParseScales(rescales:list[str]) -> list[tuple[int,str]]:
     return results
 
 
+def PreprocessScale(rescales:list[str]) -> int:
+    """ the largest output-scale, when every output is smaller than the original; otherwise 100.
+    preprocessing at that size instead of full-size only changes how the remaps/edges are resampled (disable with '--late-scale') """
+    values = [value for (value, _) in ParseScales(rescales)]
+    return (max(values) if ((len(values) > 0) and (max(values) < 100)) else 100)
+
+
+def RescaleOption(target:int, current:int) -> str:
+    """ '-scale' taking an image at 'current' percent of the original size to 'target' percent; '' if they match """
+    if (target == current): return '';
+    return "-scale '{}%'".format(f"{(target * 100 / current):.4f}".rstrip('0').rstrip('.'))
+
+
+def ScaleRadius(radius:int, percent:int) -> int: return max(1, round(radius * percent / 100));
+
+
+def PlanFrameScales(scales:list[tuple[int,str]], base_scale:int, dimensions:tuple[int,int], frame_count:int, source_frames:int, layer_count:int,
+                    output_formats:dict[int,list[str]]) -> dict[int,int]:
+    """ per output-scale: generate its frames (a rescaled srcimg, modulated frame-by-frame) or derive them by downscaling the largest scale's frames.
+    estimates the pixel-work of both from the source's dimensions; derived frames are hue-rotated before averaging, so they differ slightly ('--late-scale' disables deriving).
+    :param base_scale: scale of the preprocessed image every srcimg is rescaled from (see 'PreprocessScale')
+    :param layer_count: layers composited onto every frame (see 'TaskT.layer_stacks')
+    :param output_formats: per scale, the formats rendered from its frames (see 'RENDER_COSTS')
+    :return: derived scale -> scale its frames are downscaled from """
+    if (len(scales) < 2): return {};
+    pixels = (dimensions[0] * dimensions[1] / 10000) # per percent-squared
+    top = max(value for (value, _) in scales)
+    derived = {}
+    for (value, _) in sorted(scales):
+        if (value == top): continue;
+        rescale = ((source_frames + layer_count) * (base_scale**2 + value**2)) # srcimg and layers at this scale
+        render = (frame_count * value**2 * sum([RENDER_COSTS.get(F, 0) for F in output_formats.get(value, [])]))
+        generate = (rescale + render + frame_count * value**2 * (2 + MODULATE_COST + (layer_count * COMPOSITE_COST))) * pixels
+        derive = (render + frame_count * ((top**2 * (1 + DOWNSCALE_COST)) + value**2)) * pixels
+        choice = ("derive" if (derive < generate) else "generate")
+        print(f"[FRAME-SCALES] {value}%: generate ~{generate / 1e6:.0f}M pixel-ops, derive from {top}% ~{derive / 1e6:.0f}M -> {choice}")
+        if (choice == "derive"): derived[value] = top;
+    return derived
+
+
 def FillExpectedOutputs(task:TaskT) -> list[str]:
     rescales = task.rescales
     filename = task.output_filename
@@ -182,7 +290,7 @@ def FillExpectedOutputs(task:TaskT) -> list[str]:
     task.expected_outputs.clear()
     for (scaleval, scalestr) in ParseScales(rescales):
         for FMT in output_fileformats:
-            new_name = f"{filename}{scalestr}.{(fmt := FMT.lower())}"
+            new_name = f"{filename}{scalestr}.{(fmt := (SpriteSheet.SHEET_SUFFIX if (FMT == 'SHEET') else FMT.lower()))}"
             final_destination = output_directory/new_name
             
             renamelimit = 100; renamecount=1
@@ -206,17 +314,82 @@ def FillExpectedOutputs(task:TaskT) -> list[str]:
 
 def CheckExpectedOutputs(task:TaskT) -> list[tuple[pathlib.Path,pathlib.Path]]:
     results = []
-    for (_, _, final_dest) in task.expected_outputs:
+    for (outfmt, _, final_dest) in task.expected_outputs:
         work_file = task.working_path / final_dest.name
         print(f"checking: {work_file}")
         if work_file.exists(): results.append((work_file, final_dest));
-        else: print(f"[WARNING] expected output does not exist! ({work_file})");
+        else: print(f"[WARNING] expected output does not exist! ({work_file})"); continue;
+        if ((outfmt == "SHEET") and (index_file := SpriteSheet.IndexPath(work_file)).exists()): results.append((index_file, SpriteSheet.IndexPath(final_dest)));
     return results
 
 
+# no-op convert options; a transform consisting only of these just copies its source
+# '-modulate 100' is the GM+MPC workaround in ImagePreprocess (GM deletes the source of an effectively no-op MPC copy)
+IDENTITY_OPTIONS = ('', '-modulate 100', "-scale '100%'")
+# settings persist to every later operator in the same command; a convert using one can't have another convert's operators appended
+PERSISTENT_SETTINGS = ('-fuzz', '-fill', '-channel', '-compose', '-gravity', '-geometry', '-background', '-define', '-quality', '-compress')
+
+def OptimizeQueue(task:TaskT, transform_queue:list[tuple], magic_map:dict, sink_count:dict, transform_hooks:dict, parent_map:dict, expanded_commands:dict) -> dict[str,int]:
+    """ rewrites transform_queue (in-place) before it's resolved into commands:
+      identity: 'convert A' (no-op options) into sink B -> A's producer writes B's path directly; B aliases A
+      merged:   'convert A ops1' into B, then 'convert B ops2' into C, with B used nowhere else -> 'convert A ops1 ops2' into C
+    only sinks fully described by the queue are touched (no modulation-hooks, parent-sinks or pre-expanded commands)
+    :return: number of commands removed by each rule (frame-commands; multisource transforms count once per unique frame) """
+    stats = {"identity": 0, "merged": 0, "duplicate": 0}
+    def CommandCount(sink:ImageSourceT) -> int: return len(sink.UniqueFrames());
+    def Consumers(magic:str) -> list[tuple]: return [T for T in transform_queue if (magic in T[2])];
+    def Producers(magic:str) -> list[tuple]: return [T for T in transform_queue if (T[0] == magic)];
+    def IsPlain(magic:str) -> bool: # sink whose only commands come from the queue
+        return ((magic not in transform_hooks) and (magic not in transform_hooks.values()) and (magic not in parent_map)
+                and (magic not in parent_map.values()) and (magic not in expanded_commands) and (len(Producers(magic)) > 0))
+    def SingleConvert(T:tuple) -> str|None: # options of a plain single-source convert, or None
+        (_, command, source_magics, whole_sink) = T
+        if (whole_sink or (len(source_magics) != 1) or not command.startswith(f"convert {source_magics[0]}")): return None;
+        return command.removeprefix(f"convert {source_magics[0]}").strip()
+    def SameFrames(A:ImageSourceT, B:ImageSourceT) -> bool:
+        return ((A.multisource == B.multisource) and (A.frame_count == B.frame_count) and (A.duplicate_frames == B.duplicate_frames))
+    def Discard(sink:ImageSourceT): # intermediate will never be written
+        task.intermediates.pop(sink.safe_filename, None)
+        if sink.multisource and sink.srcpath.is_dir() and not any(sink.srcpath.iterdir()): sink.srcpath.rmdir();
+    
+    pinned = {S.magic for S in task.PinnedSinks()} # outputs of the graph; must stay materialized
+    for T in [*transform_queue]: # identities first; the copy is removed entirely rather than merged into its producer
+        (sink_magic, command, source_magics, _) = T
+        if ((options := SingleConvert(T)) not in IDENTITY_OPTIONS): continue;
+        (source, sink) = (magic_map[source_magics[0]], magic_map[sink_magic])
+        if not (SameFrames(source, sink) and IsPlain(sink_magic) and IsPlain(source.magic) and (sink_count[sink_magic] == 1)): continue;
+        if ((source.image_format != sink.image_format) and (len(Consumers(source.magic)) > 1)): continue; # format-conversion serving other consumers
+        Discard(source)
+        (source.srcpath, source.image_format, source.source_frames) = (sink.srcpath, sink.image_format, sink.source_frames)
+        transform_queue.remove(T); sink_count[sink_magic] -= 1
+        if (sink_magic in pinned): pinned.add(source.magic);
+        stats["identity"] += CommandCount(sink)
+    
+    changed = True
+    while changed: # merging single-consumer sinks into their consumer
+        changed = False
+        for T in transform_queue:
+            (sink_magic, command, source_magics, _) = T
+            if ((options := SingleConvert(T)) is None) or (sink_magic in pinned): continue;
+            (source, sink) = (magic_map[source_magics[0]], magic_map[sink_magic])
+            if not (SameFrames(source, sink) and IsPlain(sink_magic) and (sink_count[sink_magic] == 1)): continue;
+            if any([(O in options) for O in PERSISTENT_SETTINGS]) or (len(consumers := Consumers(sink_magic)) != 1): continue;
+            consumer = consumers[0]
+            if (((consumer_options := SingleConvert(consumer)) is None) or not SameFrames(sink, magic_map[consumer[0]])): continue;
+            if (consumer_options in IDENTITY_OPTIONS): consumer_options = ''; # the merged command is no longer a no-op copy
+            merged = (consumer[0], f"convert {source.magic} {options} {consumer_options}".strip(), [source.magic], False)
+            transform_queue[transform_queue.index(consumer)] = merged
+            transform_queue.remove(T); sink_count.pop(sink_magic)
+            Discard(sink)
+            stats["merged"] += CommandCount(sink); changed = True; break;
+    return stats
+
+
 def ImagePreprocess(task:TaskT, intermediate_format=None):
     task.image_preprocessed = []
     task.preprocessing_cmds.clear()
+    task.intermediates.clear()
+    task.layer_stacks.clear()
     scales = ParseScales(task.rescales)
     
     current_img = task.image_source
@@ -243,7 +416,15 @@ def ImagePreprocess(task:TaskT, intermediate_format=None):
     parent_map : dict[str,str] = {} # associates one sink with another - expanded commands will also be added to parent
     
     if intermediate_format is None: intermediate_format = task.primary_format;
-    def CreateSink(new_name:str, new_fmt:str=intermediate_format, force_multisource=False, sources:list[ImageSourceT]=None, parent:ImageSourceT=None):
+    def SharedDuplicates(sources:list[ImageSourceT]) -> dict[int,int]:
+        """duplicate-frames common to every multisource input (a sink's frame is only redundant if all of its inputs are)"""
+        multisources = [S for S in sources if S.multisource]
+        if (len(multisources) == 0): return {};
+        shared = dict(multisources[0].duplicate_frames)
+        for S in multisources[1:]: shared = {I:D for (I,D) in shared.items() if (S.duplicate_frames.get(I) == D)};
+        return shared
+    
+    def CreateSink(new_name:str, new_fmt:str=intermediate_format, force_multisource=False, sources:list[ImageSourceT]=None, parent:ImageSourceT=None, keep_duplicates=True):
         if sources is None: sources = [current_img];
         is_multisource = (force_multisource or any([source_img.multisource for source_img in sources]))
         output_path = task.working_path / (new_name if is_multisource else f"{new_name}.{new_fmt.lower()}")
@@ -252,6 +433,7 @@ def ImagePreprocess(task:TaskT, intermediate_format=None):
         sink.frame_count = max([source_img.frame_count for source_img in sources])
         sink.indexlength = max([source_img.indexlength for source_img in sources])
         sink.image_format = new_fmt
+        sink.scale = max([source_img.scale for source_img in sources])
         
         if sink.multisource:
             output_path.mkdir(exist_ok=True)
@@ -259,25 +441,53 @@ def ImagePreprocess(task:TaskT, intermediate_format=None):
                 output_path / f"frame{str(C).zfill(sink.indexlength)}.{new_fmt.lower()}"
                 for C in range(sink.frame_count)
             ]
+            # duplicate frames are never written; their paths alias the output of the identical earlier frame
+            if keep_duplicates: sink.duplicate_frames = SharedDuplicates(sources);
+            for (I, D) in sink.duplicate_frames.items(): sink.source_frames[I] = sink.source_frames[D];
         
         nonlocal newest_sink; newest_sink = sink
         if (parent is not None): parent_map[sink.magic] = parent.magic;
         magic_map[sink.magic] = sink
+        task.intermediates[new_name] = sink
         return sink
     
-    def QueueTransform(command:str, sources:list[ImageSourceT]=None, sink:ImageSourceT=None):
+    def QueueTransform(command:str, sources:list[ImageSourceT]=None, sink:ImageSourceT=None, whole_sink=False):
+        """ :param whole_sink: command handles every frame itself (resolved once, with frame-globs) instead of once per frame """
         if sources is None: sources = [current_img];
         if sink is None: sink = newest_sink;
         sink_count[sink.magic] = 1 + sink_count.get(sink.magic, 0)
         transform_queue.append((sink.magic,
             command.replace('  ','').strip(),
-            [S.magic for S in sources]))
+            [S.magic for S in sources], whole_sink))
         return
     
+    # single-pass: layers with their own stepsize stay static images; 'Kernels.LayerCommand' rotates and composites them while generating each frame
+    # (instead of writing a '_modulation' frame-set per layer). Every layer above the first one with an alternate stepsize is stacked as well.
+    # video inputs keep the modulation frame-sets; their layers are already per-frame, so there's nothing to save
+    single_pass = (task.use_kernels and (len(task.stepsize_deltas) > 0) and not task.image_source.multisource)
+    stack_base = None # image beneath the first stacked layer
+    stack_layers : list[tuple[ImageSourceT,str,str|None]] = [] # (layer, compose-method, stepsize-key)
+    
+    def StackLayer(layer:ImageSourceT, method:str, key:str) -> bool:
+        """ :return: True if layer was stacked (single-pass); the caller must not composite it """
+        nonlocal stack_base
+        if not (single_pass and ((key in task.stepsize_deltas) or (len(stack_layers) > 0))): return False;
+        if (stack_base is None): stack_base = current_img;
+        stack_layers.append((layer, method, (key if (key in task.stepsize_deltas) else None)))
+        return True
+    
+    def FlattenStack(name:str) -> ImageSourceT:
+        """ static (unrotated) composite of the stack so far; for steps that must read the combined image """
+        flattened = CreateSink(name, sources=[stack_base])
+        for (index, (layer, method, _)) in enumerate(stack_layers):
+            below = (stack_base if (index == 0) else flattened)
+            QueueTransform(f"composite {layer.magic} {below.magic} -compose {method}", sources=[layer, below], sink=flattened)
+        return flattened
+    
     def ApplyModulation(key, source:ImageSourceT):
         assert(key in ('edge','text','white','black')), f"invalid stepsize-lookup: {key}";
-        if (key not in task.stepsize_deltas): return source;
-        modulations = RGB.EnumRotations(task.stepsize_deltas[key], task.image_source.frame_count)
+        if ((key not in task.stepsize_deltas) or single_pass): return source;
+        modulations = task.Rotations(task.stepsize_deltas[key])
         new_filename = f"{source.safe_filename}_modulation"
         output_path = task.working_path / new_filename
         output_path.mkdir(exist_ok=True)
@@ -285,6 +495,7 @@ def ImagePreprocess(task:TaskT, intermediate_format=None):
         modsink = ImageSourceT(output_path, new_filename)
         modsink.multisource = True
         modsink.image_format = source.image_format
+        modsink.scale = source.scale
         modsink.frame_count = len(modulations)
         modsink.indexlength = len(modulations[0][0]) # index string
         modsink.source_frames = [output_path/f"frame{M[0]}.{source.image_format.lower()}" for M in modulations]
@@ -302,16 +513,29 @@ def ImagePreprocess(task:TaskT, intermediate_format=None):
         
         nonlocal newest_sink; newest_sink = modsink;
         magic_map[modsink.magic] = modsink
+        task.intermediates[new_filename] = modsink
         expanded_commands[modsink.magic] = modulate_commands
         transform_hooks[source.magic] = modsink.magic
         return modsink
     
     
+    folded_commands = 0 # transforms that were never queued because another command already covers them
     baseimg = CreateSink("baseimg_primary_format", task.baseimgformat_override)
-    QueueTransform(f"convert {current_img.magic} -matte {task.crop}")
+    QueueTransform(' '.join(["convert", current_img.magic, "-matte", *[O for O in (task.crop, RescaleOption(task.preprocess_scale, current_img.scale)) if O]]))
+    baseimg.scale = task.preprocess_scale # everything below runs at the largest output-scale (see 'PreprocessScale'); cropped first, since crop-offsets are exact
     current_img = baseimg
     
-    if task.whiteBlack is not None:
+    # the whole remap-chain below computed in a single numpy pass; modulated recolors still need their separate layers
+    use_remap_kernel = (task.use_kernels and not any([(K in task.stepsize_deltas) for K in ('white','black')]))
+    if ((task.whiteBlack is not None) and use_remap_kernel):
+        remaps = [(colorname, new_color, fuzzpcent, thold) for (new_color, fuzzpcent, thold, colorname) in task.GetRemapWB() if (new_color is not None)]
+        composite = CreateSink("recolor_composite", sources=[baseimg])
+        # without text/edge, the final 'Atop' composite against baseimg would be next; the kernel clips to baseimg's alpha itself instead
+        fold_atop = ((task.edge_color is None) and (len(task.rendertext_sources) == 0))
+        QueueTransform(Kernels.RemapCommand(baseimg.magic, remaps, task.working_path.name[-2:], atop=fold_atop, tile_size=task.tile_size), sources=[baseimg], whole_sink=True)
+        if fold_atop: baseimg = composite; folded_commands += len(composite.UniqueFrames());
+        current_img = composite
+    elif task.whiteBlack is not None:
         for (new_color, fuzzpcent, thold, colorname) in task.GetRemapWB():
             if (new_color is None):  continue;
             if not thold: color_threshold=' ';
@@ -339,6 +563,7 @@ def ImagePreprocess(task:TaskT, intermediate_format=None):
             QueueTransform(f"composite {recolor.magic} {recolor_mask.magic} -compose In", sources=[recolor, recolor_mask], sink=recolor)
             
             recolor = ApplyModulation(colorname, recolor)
+            if StackLayer(recolor, "Over", colorname): continue;
             composite = CreateSink("recolor_composite", sources=[current_img, recolor])
             composite_cmd = f"composite {recolor.magic} {current_img.magic} -compose Over"
             QueueTransform(composite_cmd, sources=[recolor, current_img])
@@ -351,6 +576,14 @@ def ImagePreprocess(task:TaskT, intermediate_format=None):
         expanded_commands[renderedText.magic]=list() # this also needs to be added manually
         compose_string = renderedText.ComposeString("Over")
         renderedText = ApplyModulation('text',renderedText)
+        if (TEXT_LAYERED_ABOVE and single_pass and (('text' in task.stepsize_deltas) or (len(stack_layers) > 0))):
+            text_layer = CreateSink("text_layer", sources=[current_img]) # text placed on a transparent canvas of the image's geometry
+            if task.working_path.name.endswith('GM'): QueueTransform(f"convert {current_img.magic} -operator Opacity Set '100%'");
+            else: QueueTransform(f"convert {current_img.magic} -alpha transparent");
+            QueueTransform(f"composite {renderedText.magic} {text_layer.magic} {compose_string}", sources=[renderedText, text_layer], sink=text_layer)
+            StackLayer(text_layer, "Over", 'text')
+            if (task.edge_color is not None): baseimg = FlattenStack("text_overlay"); # edges are detected on the text-overlay
+            continue
         text_overlay = CreateSink("text_overlay", sources=[renderedText, current_img])
         
         if TEXT_LAYERED_ABOVE:
@@ -361,35 +594,66 @@ def ImagePreprocess(task:TaskT, intermediate_format=None):
         baseimg = text_overlay; current_img = baseimg;
     
     #TODO: steptext
-    #TODO: still not avoiding a redundant composite when edge-detection is disabled
     
     if task.edge_color is not None:
         edge_image = CreateSink("srcimg_edge", sources=[baseimg])
-        recolor_cmd = RGB.EdgeHighlightCMD(task.edge_color, task.edgeRadius)
-        QueueTransform(recolor_cmd.format(baseimg.magic), sources=[baseimg]) # edge-detect baseimg, NOT current
+        edge_radius = ScaleRadius(task.edgeRadius, baseimg.scale) # same width (relative to the image) as a full-size edge scaled down afterwards
+        if task.use_kernels: # convolution in numpy (Kernels.EdgeKernel); whole frame-sets per command
+            QueueTransform(Kernels.EdgeCommand(baseimg.magic, task.edge_color, edge_radius, task.working_path.name[-2:], task.tile_size), sources=[baseimg], whole_sink=True)
+        else:
+            recolor_cmd = RGB.EdgeHighlightCMD(task.edge_color, edge_radius)
+            QueueTransform(recolor_cmd.format(baseimg.magic), sources=[baseimg]) # edge-detect baseimg, NOT current
         edge_image = ApplyModulation('edge', edge_image)
-        baseimg = current_img; current_img = edge_image
-        # ^ preserving 'recolor_black.png' in baseimg for final composite
+        if not StackLayer(edge_image, "Atop", 'edge'):
+            baseimg = current_img; current_img = edge_image
+            # ^ preserving 'recolor_black.png' in baseimg for final composite
     
-    if (current_img.magic != baseimg.magic): # final composite and updating task.image_preprocessed
+    if ((current_img.magic != baseimg.magic) and (len(stack_layers) == 0)): # final composite and updating task.image_preprocessed
         final_output = CreateSink("srcimg_preprocessed",sources=[current_img,baseimg])
         compositecmd = f"composite {current_img.magic} {baseimg.magic} -compose Atop"
         QueueTransform(compositecmd, sources=[current_img, baseimg])
         current_img = final_output
     
+    task.derived_scales = {}
+    # huge stills are only ever processed in tiles; whole-frame downscaling would defeat that. '--late-scale' generates every scale (bit-exact)
+    if ((task.tile_size is None) and not task.late_scale):
+        rescaled_frames = (current_img.frame_count if current_img.multisource else 1) # frames of every srcimg (video, or per-frame modulated layers)
+        output_formats = {}
+        for (outfmt, (scaleval, _), _) in task.expected_outputs: output_formats.setdefault(scaleval, []).append(outfmt);
+        task.derived_scales = PlanFrameScales(scales, current_img.scale, task.image_source.dimensions, task.image_source.frame_count, rescaled_frames, len(stack_layers), output_formats)
+    
     for (scale_value, scale_suffix) in scales:
-        scale_text = ('' if (scale_value == 100) else f"-scale '{scale_value}%'")
+        if (scale_value in task.derived_scales): continue; # no srcimg; frames are derived after frame-generation
+        scale_text = RescaleOption(scale_value, current_img.scale) # relative to the preprocessing-scale
         scaled_img = CreateSink(f"srcimg{scale_suffix}", task.primary_format)
+        scaled_img.scale = scale_value
         # for unknown reasons, GraphicsMagick deletes original files after any command that is effectively no-op
         # '-modulate' seems to be one of the few options that forces an 'unoptimized clone'; preventing deletion
-        if ((intermediate_format == 'MPC') and (scale_value == 100) and (task.working_path.name.endswith('GM'))):
+        if ((intermediate_format == 'MPC') and (scale_text == '') and (task.working_path.name.endswith('GM'))):
             scale_text = "-modulate 100"; # ImageMagick does not have any issue; only with GraphicsMagick ^ (and only with MPC, no issues using MIFF)
         # '-scale' also prevents this (obviously), but the fullsize sink can't use it because of another bug: '-scale 100%' writes corrupt image data
         # another workaround is '-write'-ing to the real destination, using the source as input and output (difficult to implement here)
+        # ^ 'OptimizeQueue' does the equivalent: the identity-copy is dropped, and the source's producer writes this sink directly
         QueueTransform(f"convert {current_img.magic} {scale_text}")
         task.image_preprocessed.append(scaled_img)
-    
-    for (sink_magic, command, source_magics) in transform_queue:
+        if (len(stack_layers) > 0): # 'current_img' is the stack's base; layers are scaled separately (reused as-is at the preprocessing-scale)
+            scaled_layers = []
+            for (layer, method, key) in stack_layers:
+                if (layer_scale_text := RescaleOption(scale_value, layer.scale)):
+                    source_layer = layer; layer = CreateSink(f"{layer.safe_filename}{scale_suffix}", sources=[source_layer])
+                    QueueTransform(f"convert {source_layer.magic} {layer_scale_text}", sources=[source_layer])
+                    layer.scale = scale_value
+                scaled_layers.append((layer, method, key))
+            task.layer_stacks[scaled_img.magic] = scaled_layers
+    
+    optimizer_stats = OptimizeQueue(task, transform_queue, magic_map, sink_count, transform_hooks, parent_map, expanded_commands)
+    optimizer_stats["folded"] = folded_commands
+    memo_stores = {} # queue-index -> commands storing the sink finished by that transform
+    if (task.node_cache is not None): memo_stores = NodeCache.PlanMemoization(task, task.node_cache, transform_queue, magic_map, sink_count, transform_hooks, parent_map, expanded_commands);
+    
+    skipped_duplicates = 0
+    seen_commands = set() # identical commands always produce identical outputs; only the first is kept
+    for (queue_index, (sink_magic, command, source_magics, whole_sink)) in enumerate(transform_queue):
         print(f"resolving command: '{command}' -> {sink_magic}")
         command_list = expanded_commands.get(sink_magic, list())
         sink = magic_map[sink_magic]; new_command_list = []
@@ -398,12 +662,19 @@ def ImagePreprocess(task:TaskT, intermediate_format=None):
             magic_map[magic_str].QuoteSource((sink.frame_count if sink.multisource else 1))
             for magic_str in source_magics
         ])]
+        output_paths = sink.QuoteSource()
+        if whole_sink: (resolved_sources, output_paths) = ([tuple([magic_map[magic_str].QuoteAll() for magic_str in source_magics])], [sink.QuoteAll()]);
         
-        for (output_path, input_path_tuple) in zip(sink.QuoteSource(), resolved_sources, strict=True):
+        compression = ''
+        if (task.compress_frames and sink.multisource and (sink.image_format == 'MIFF')): # whole-sink kernels encode every frame themselves
+            compression = (Kernels.WriteArg(COMPRESSED_MIFF_OPTS.split()) if whole_sink else f" {COMPRESSED_MIFF_OPTS}")
+        for (index, (output_path, input_path_tuple)) in enumerate(zip(output_paths, resolved_sources, strict=True)):
+            if (index in sink.duplicate_frames): skipped_duplicates += 1; continue; # reusing the earlier frame's result
             new_command = command # python is dumb - reassigning 'command' doesn't work and 'nonlocal' isn't allowed
             for (input_magic, input_path) in zip(source_magics, input_path_tuple, strict=True):
                 new_command = new_command.replace(input_magic, input_path, 1)
-            new_command_list.append(f"{new_command} {output_path}")
+            new_command_list.append(f"{new_command}{compression} {output_path}")
+        new_command_list.extend(memo_stores.get(queue_index, []))
         
         sink_count[sink.magic] = current_count = sink_count[sink.magic] - 1
         if (current_count == 0):
@@ -415,20 +686,43 @@ def ImagePreprocess(task:TaskT, intermediate_format=None):
         
         command_list.extend(new_command_list)
         expanded_commands[sink_magic] = command_list
-        task.preprocessing_cmds.extend(new_command_list)
+        for new_command in new_command_list:
+            if (new_command in seen_commands): optimizer_stats["duplicate"] += 1; continue;
+            seen_commands.add(new_command); task.preprocessing_cmds.append(new_command)
     
-    # creating ./miff_frames_scale50/, ./png_frames/... etc
-    for frame_source in task.image_preprocessed:
-        print(f"\nFRAME SOURCE: {frame_source.safe_filename}")
-        current_source = frame_source
+    if ((removed := sum(optimizer_stats.values())) > 0):
+        print(f"\n[OPTIMIZER] removed {removed} preprocessing commands ({' | '.join([f'{K}: {V}' for (K,V) in optimizer_stats.items() if V])})")
+    
+    if (len(duplicates := task.image_source.duplicate_frames) > 0):
+        print(f"\ndeduplicated frames: {len(duplicates)}/{task.image_source.frame_count} [{skipped_duplicates} preprocessing commands skipped]")
+    
+    # creating ./miff_frames_scale50/, ./rgba_frames.rgba ... etc
+    def CreateFrameSets(current_source:ImageSourceT, scale_suffix:str, scale:int):
         for frameformat in task.frame_formats:
             print(f"CURRENT_SOURCE: {current_source.safe_filename} | FRAME_FORMAT: {frameformat}",end='')
-            framedir_name = frame_source.safe_filename.replace('srcimg', f'{frameformat.lower()}_frames')
-            framedir_dest = CreateSink(framedir_name, frameformat, True, sources=[current_source])
+            framedir_name = f"{frameformat.lower()}_frames{scale_suffix}"
+            if (frameformat == 'RGBA'): # raw frame-store: one file holding every frame ('rgba_frames_scale50.rgba')
+                framedir_dest = ImageSourceT(task.working_path / f"{framedir_name}.rgba", framedir_name)
+                framedir_dest.image_format = frameformat
+                framedir_dest.frame_count = current_source.frame_count
+                task.intermediates[framedir_name] = framedir_dest
+            else: framedir_dest = CreateSink(framedir_name, frameformat, True, sources=[current_source], keep_duplicates=False) # every frame gets its own modulation
+            framedir_dest.scale = scale
             print(f" | SINK_NAME: {framedir_name}")
             task.frame_directories[framedir_name] = (current_source, framedir_dest)
             if(frameformat == task.primary_format): current_source = framedir_dest;
-            # frame_source is updated so that non-primary frame-formats (PNG) can just copy from the primary one
+            # frame_source is updated so that non-primary frame-formats (RGBA) can just copy from the primary one
+        return
+    
+    for frame_source in task.image_preprocessed:
+        print(f"\nFRAME SOURCE: {frame_source.safe_filename}")
+        CreateFrameSets(frame_source, frame_source.safe_filename.removeprefix('srcimg'), frame_source.scale)
+    
+    scale_suffixes = dict(scales)
+    for (scale_value, base_value) in task.derived_scales.items(): # downscaled from the base scale's (primary-format) frames
+        base_frames = task.frame_directories[f"{task.primary_format.lower()}_frames{scale_suffixes[base_value]}"][1]
+        print(f"\nFRAME SOURCE: {base_frames.safe_filename} (derived: {scale_value}%)")
+        CreateFrameSets(base_frames, scale_suffixes[scale_value], scale_value)
     
     task.did_preprocess_img = True
     return expanded_commands # still None unless edge/WB-recoloring was performed
@@ -440,11 +734,9 @@ def GenerateFrames(task:TaskT, enumRotations:list[tuple[str,str]]) -> tuple[list
     assert(len(task.frame_formats) > 0)
     
     if (task.ffprobe_info is None):
-        index_len = task.image_source.indexlength # number of digits to use in printf sequence
         framerate = 60
         audio_src = None
     else:
-        index_len = task.ffprobe_info['index_length']
         framerate = task.ffprobe_info['framerate']
         audio_src = task.ffprobe_info["extracted_audio_path"]
     
@@ -458,64 +750,98 @@ def GenerateFrames(task:TaskT, enumRotations:list[tuple[str,str]]) -> tuple[list
         preprocess_commands.extend(task.preprocessing_cmds)
     
     framegen_commands = []
-    frame_conversions = [] # commands filling derivative directories (png_frames)
+    frame_conversions = [] # commands filling derivative frame-stores (rgba_frames)
     ZL = task.image_source.frame_count
+    layer_schedule = task.working_path / "layer_schedule.json"
+    tiled_frames = ((task.tile_size is not None) and not task.image_source.multisource) # huge stills are modulated by the (tiled) layer-kernel, even without layers
+    if ((len(task.layer_stacks) > 0) or tiled_frames): # per-layer rotations, relative to the main stepsize (same as the '_modulation' frame-sets would have used)
+        layer_rotations = {key: [R for (_, R) in task.Rotations(delta)] for (key, delta) in task.stepsize_deltas.items()}
+        frame_names = [F.name for F in [*task.frame_directories.values()][0][1].source_frames]
+        write_options = (COMPRESSED_MIFF_OPTS.split() if (task.compress_frames and (task.primary_format == 'MIFF')) else [])
+        Kernels.WriteLayerSchedule(layer_schedule, frame_names, enumRotations, layer_rotations, write_options)
+    
+    derived_commands = [] # frame-sets downscaled from a larger scale's frames (see 'PlanFrameScales'); after every modulation
     for (dest_name, (frame_source, frame_output)) in task.frame_directories.items():
+        if (((dest_fmt := frame_output.image_format) == task.primary_format) and (frame_output.scale in task.derived_scales)):
+            (src_frames, dest_frames) = (frame_source.QuoteSource(ZL), frame_output.QuoteSource(ZL))
+            compression = (f" {COMPRESSED_MIFF_OPTS}" if (task.compress_frames and (dest_fmt == 'MIFF')) else '')
+            derived_commands.extend([f"convert {src_frame} {RescaleOption(frame_output.scale, frame_source.scale)}{compression} {dest_frame}" for (src_frame, dest_frame) in zip(src_frames, dest_frames, strict=True)])
+            continue
+        
         # generating frames (performing modulation) in primary-format (MPC/MIFF)
-        if ((dest_fmt := frame_output.image_format) == task.primary_format):
+        if (dest_fmt == task.primary_format):
+            if ((layer_stack := task.layer_stacks.get(frame_source.magic, ([] if tiled_frames else None))) is not None): # single-pass; every frame rendered from static layers
+                layers = [(compose, (key or '-'), layer.QuoteAll()) for (layer, compose, key) in layer_stack]
+                framegen_commands.append(Kernels.LayerCommand(layer_schedule, frame_source.QuoteAll(), layers, frame_output.QuoteAll(), task.working_path.name[-2:], task.tile_size))
+                continue
             (src_frames, dest_frames) = (frame_source.QuoteSource(ZL), frame_output.QuoteSource(ZL))
+            compression = (f" {COMPRESSED_MIFF_OPTS}" if (task.compress_frames and (dest_fmt == 'MIFF')) else '')
             framegen_commands.extend([
-                f"convert {src_frame} -scene {index} -modulate 100,100,{rotation} {dest_frame}"
+                f"convert {src_frame} -scene {index} -modulate 100,100,{rotation}{compression} {dest_frame}"
                 for (src_frame, dest_frame, (index, rotation)) in zip(src_frames, dest_frames, enumRotations, strict=True)
             ])
             continue
         
-        # derivative frame directory (png_frames); just converting miff_frames to PNG (avoiding duplicate modulation)
+        # derivative frame-store (rgba_frames.rgba); just converting miff_frames to raw RGBA (avoiding duplicate modulation)
         from_glob = f"'{task.primary_format}:{frame_source.srcpath}/frame*.{task.primary_format.lower()}'"
-        dest_glob = f"'{dest_fmt}:{frame_output.srcpath}/frame%0{index_len}d.{dest_fmt.lower()}'"
-        frame_conversions.append(f"convert {from_glob} +adjoin {dest_glob}")
-        
-        # additional 'apng_frames' created with matte (alpha) disabled
-        if ('APNG' in task.output_fileformats) and (dest_fmt == 'PNG'):
-            framedir = frame_output.srcpath
-            mirror = framedir.with_name(f"a{framedir.name}"); # apng_frames
-            mirror.mkdir(exist_ok=True) # not created yet if input is video
-            dest_glob = f"'{dest_fmt}:{mirror}/frame%0{index_len}d.{dest_fmt.lower()}'"
-            frame_conversions.append(f"convert {from_glob} +matte +adjoin {dest_glob}")
+        frame_conversions.append(FrameStore.WriteCommand(from_glob, frame_output.srcpath))
     
+    framegen_commands.extend(derived_commands)
     framegen_commands.extend(frame_conversions)
     
     
     render_commands = []
     webp_rendercmds = []
     ffmpeg_commands = []
-    ffmpeg_begin = f"ffmpeg -hide_banner -nostdin -y -thread_queue_size 1024 -f image2 -framerate {framerate} -pattern_type sequence -i"
-    webp_options = "-quality 100 -define webp:thread-level=1 -define webp:lossless=true -define webp:method=6 -define webp:use-sharp-yuv=true"
+    library = task.working_path.name[-2:]
+    gif_scales = [(scaleval, scalestr) for (outfmt, (scaleval, scalestr), _) in task.expected_outputs if (outfmt == "GIF")]
+    gif_palette = None
+    if (Palette.AVAILABLE and (len(gif_scales) > 0)): # one global palette shared by every GIF; sampled from the smallest frame-set (see 'Palette.py')
+        gif_palette = task.working_path / f"gif_palette{task.gif_colors}.png"
+        sample_dir = task.working_path / f"{task.primary_format.lower()}_frames{min(gif_scales)[1]}"
+        sample_glob = f"'{task.primary_format}:{sample_dir}/frame*.{task.primary_format.lower()}'"
+        render_commands.append(Palette.PaletteCommand([sample_glob], gif_palette, task.gif_colors, (task.working_path.parent / Palette.CACHE_DIRNAME), library))
     # with multiple input-sources, ffmpeg will complain: 'Thread message queue blocking; consider raising the thread_queue_size option'
     # until you raise it to at least 1024 (default is 8); "-thread_queue_size 1024"
     
     for (outfmt, (scaleval, scalestr), final_destination) in task.expected_outputs:
-        srcfmt = ("PNG" if (use_ffmpeg := (outfmt in ('APNG','MP4'))) else task.primary_format)
+        srcfmt = ("RGBA" if (use_ffmpeg := (outfmt in ('APNG','MP4'))) else task.primary_format)
         framedir = task.working_path / f"{srcfmt.lower()}_frames{scalestr}"
         work_file = task.working_path / final_destination.name
+        work_file.unlink(missing_ok=True) # stale output in a reused workdir may be hardlinked to a published file; never write through it
         
         if use_ffmpeg:
-            if (outfmt == 'APNG'): framedir = framedir.with_name(f"a{framedir.name}"); # apng_frames
-            apng_opts = f"-ignore_loop false -plays 0 -default_fps {framerate}"  # '-plays 0' enables animation looping
-            audio_arg = (f"-i '{audio_src}' -shortest -af apad" if (audio_src is not None) else '') # if video is shorter than audio, audio is truncated to video length
-            argstring = (apng_opts if(outfmt == 'APNG') else audio_arg if(outfmt == 'MP4') else '')
-            ffmpeg_commands.append(f"{ffmpeg_begin} '{framedir}/frame%0{index_len}d.{srcfmt.lower()}' {argstring} '{work_file}'")
+            # frames are piped from the raw store as rawvideo (FrameStore.py) instead of being read from 'png_frames'
+            (frame_source, frame_store) = task.frame_directories[framedir.name]
+            # '-plays 0' enables animation looping. 'rgb24' drops the alpha-channel (equivalent to '+matte')
+            apng_opts = f"-plays 0 -pix_fmt rgb24 {task.render_preset.APNGArgs()}"
+            audio_arg = (f"-thread_queue_size 1024 -i '{audio_src}' -shortest -af apad" if (audio_src is not None) else '') # if video is shorter than audio, audio is truncated to video length
+            argstring = (apng_opts if(outfmt == 'APNG') else f"{audio_arg} {task.render_preset.MP4Args()}" if(outfmt == 'MP4') else '')
+            ffmpeg_commands.append(FrameStore.EncodeCommand(library, frame_store.srcpath, frame_source.QuoteSource()[0], framerate, f"{argstring} '{work_file}'"))
             continue
         
-        # webp output is ImageMagick-only; no animation in GraphicsMagick
-        (magick_convert, opts) = (("convert-im6.q16", webp_options) if (isWEBP := (outfmt == "WEBP")) else 
-                                  ("convert", RGB.argstr_GIF(task.delay) if (outfmt=="GIF") else ""))
+        if (outfmt == "SHEET"): # every frame tiled into one PNG, with a json index (see 'SpriteSheet.py')
+            render_commands.append(SpriteSheet.SheetCommand(library, task.delay, f"'{srcfmt}:{framedir}/frame*.{srcfmt.lower()}'", work_file))
+            SpriteSheet.IndexPath(work_file).unlink(missing_ok=True)
+            continue
+        if (outfmt == "WEBP"): # frames encoded in parallel, then muxed into the animated container (see 'WebpWriter.py')
+            webp_method = (task.render_preset.webp_method if (task.webp_method is None) else task.webp_method)
+            webp_rendercmds.append(WebpWriter.EncodeCommand(webp_method, task.render_preset.webp_lossless, task.delay, f"'{srcfmt}:{framedir}/frame*.{srcfmt.lower()}'", work_file))
+            continue
+        (magick_convert, opts) = ("convert", (RGB.argstr_GIF(task.delay, task.gif_colors) if (outfmt=="GIF") else ""))
+        if ((outfmt == "GIF") and (gif_palette is not None)): # frames are mapped to the palette in parallel; magick only assembles them
+            gif_frames = ImageSourceT(task.working_path / f"gif_frames{scalestr}", f"gif_frames{scalestr}")
+            (gif_frames.multisource, gif_frames.image_format, gif_frames.scale, gif_frames.frame_count) = (True, 'MIFF', scaleval, ZL)
+            gif_frames.srcpath.mkdir(exist_ok=True)
+            task.intermediates[gif_frames.safe_filename] = gif_frames # removed once the GIF is written (see 'Storage.IntermediateRefsT')
+            mapped_frames = f"'MIFF:{gif_frames.srcpath}/frame*.miff'"
+            render_commands.append(Palette.MapCommand(gif_palette, f"'{srcfmt}:{framedir}/frame*.{srcfmt.lower()}'", mapped_frames, library))
+            if task.gif_writer: render_commands.append(GifWriter.EncodeCommand(library, gif_palette, task.delay, mapped_frames, work_file)); continue; # encoded in parallel chunks
+            (srcfmt, framedir, opts) = ('MIFF', gif_frames.srcpath, RGB.argstr_GIF(task.delay, task.gif_colors, gif_palette))
         if (outfmt == "GIF"):
             if (opts[0] is None): opts = opts[1];
             else: render_commands.append(f"{magick_convert} {opts[0]} '{srcfmt}:{framedir}/frame*.{srcfmt.lower()}' {opts[1]} -adjoin '{outfmt}:{work_file}'"); continue;
-        cmd = f"{magick_convert} '{srcfmt}:{framedir}/frame*.{srcfmt.lower()}' {opts} -adjoin '{outfmt}:{work_file}'"
-        if isWEBP: webp_rendercmds.append(cmd);
-        else: render_commands.append(cmd);
+        render_commands.append(f"{magick_convert} '{srcfmt}:{framedir}/frame*.{srcfmt.lower()}' {opts} -adjoin '{outfmt}:{work_file}'")
     
     return (preprocess_commands, framegen_commands, render_commands, webp_rendercmds, ffmpeg_commands)
 
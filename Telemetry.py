@@ -0,0 +1,162 @@
+import pathlib
+import subprocess
+import resource
+import time
+import json
+import os
+from contextlib import contextmanager
+
+import Storage
+import Task
+
+# per-command and per-stage measurements of a run, written to 'RGB_TOPLEVEL/reports/' (see 'RunReportT.Write');
+# not the workdir, which is usually deleted at exit ('--autodelete')
+# every command run by 'main.SubCommand' is reaped with 'os.wait4', which returns its resource-usage: CPU-times and peak RSS.
+# those include every descendant the command waited for (the shell of 'shell=True', worker-processes of GifWriter/WebpWriter)
+# stages are timed around their commands (and the python-side planning); their CPU-times also cover this process ('RUSAGE_SELF')
+
+REPORT_DIRECTORY = "reports" # under the toplevel (see 'Globals.TOPLEVEL_NAME')
+REPORT_LIMIT = 20 # older reports are deleted
+
+
+class CommandRecordT():
+    def __init__(self, command:str, returncode:int, wall:float, usage:resource.struct_rusage):
+        self.command = command
+        self.returncode = returncode
+        self.wall = wall # seconds
+        self.user = usage.ru_utime # seconds
+        self.system = usage.ru_stime # seconds
+        self.peak_rss = (usage.ru_maxrss * 1024) # bytes; linux reports kilobytes
+        self.stage = None
+        self.scale : int|None = None # percent; None: several (or no) scales
+        self.format : str|None = None # output-format; None: not (exclusively) rendering one output
+        return
+    
+    def Summary(self) -> dict:
+        return {"commands": 1, "wall_s": self.wall, "user_s": self.user, "sys_s": self.system, "peak_rss_bytes": self.peak_rss}
+    
+    def Entry(self) -> dict:
+        return {"stage": self.stage, "scale": self.scale, "format": self.format, "returncode": self.returncode, **self.Summary(), "command": self.command}
+
+
+def RunCommand(cmd:str|list[str], use_shell:bool, stderr_dest) -> CommandRecordT:
+    """ 'subprocess.run' (stdout printed, stderr to stderr_dest), reaped by 'os.wait4' for its resource-usage. Does not check the exit-status """
+    started = time.perf_counter()
+    with subprocess.Popen(cmd, stdout=None, stderr=stderr_dest, encoding="utf-8", shell=use_shell) as process:
+        (_, status, usage) = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status) # already reaped; Popen must not wait for it again
+    return CommandRecordT((cmd if isinstance(cmd, str) else ' '.join(cmd)), process.returncode, (time.perf_counter() - started), usage)
+
+
+def Combine(summaries:list[dict]) -> dict:
+    """ sums counts and times; peak RSS is the largest single peak (the commands ran one after another) """
+    combined = {"commands": 0, "wall_s": 0.0, "user_s": 0.0, "sys_s": 0.0, "peak_rss_bytes": 0}
+    for summary in summaries:
+        for key in ("commands", "wall_s", "user_s", "sys_s"): combined[key] += summary[key];
+        combined["peak_rss_bytes"] = max(combined["peak_rss_bytes"], summary["peak_rss_bytes"])
+    return combined
+
+
+def CPUTimes() -> tuple[float,float]:
+    """ user/sys seconds of this process and every reaped child """
+    (own, children) = (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN))
+    return ((own.ru_utime + children.ru_utime), (own.ru_stime + children.ru_stime))
+
+
+class RunReportT():
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.commands : list[CommandRecordT] = []
+        self.stages : dict[str,dict] = {} # name -> wall/CPU-times of every span spent in it
+        self.frame_directories : dict[str,dict] = {}
+        self.task : Task.TaskT|None = None
+        return
+    
+    @contextmanager
+    def Stage(self, name:str):
+        """ times the enclosed block; repeated stages accumulate """
+        (started, (user, system)) = (time.perf_counter(), CPUTimes())
+        try: yield;
+        finally:
+            (end_user, end_system) = CPUTimes()
+            stage = self.stages.setdefault(name, {"wall_s": 0.0, "user_s": 0.0, "sys_s": 0.0})
+            stage["wall_s"] += (time.perf_counter() - started); stage["user_s"] += (end_user - user); stage["sys_s"] += (end_system - system)
+    
+    def Attach(self, task:Task.TaskT):
+        """ commands recorded from now on are attributed to the scales and output-formats of task """
+        self.task = task
+        return
+    
+    def Attribute(self, record:CommandRecordT):
+        """ matches the command ('gm batch': each of its lines) by path against the task's intermediates and outputs;
+        the path written last on the commandline is the command's output, and decides its scale (and format, for output-files) """
+        if (self.task is None): return;
+        (scales, formats) = (set(), set())
+        for command in Storage.IntermediateRefsT.ExpandBatch(record.command):
+            matches = [(command.rfind(path), scale, None) for (path, scale) in [
+                ((f"{S.srcpath}/" if S.multisource else f"{S.srcpath}'"), S.scale) for S in self.task.intermediates.values()] if (path in command)]
+            matches += [(command.rfind(path), scaleval, outfmt) for (path, scaleval, outfmt) in [
+                (f"{self.task.working_path / final_dest.name}'", scaleval, outfmt) for (outfmt, (scaleval, _), final_dest) in self.task.expected_outputs] if (path in command)]
+            if (len(matches) == 0): continue;
+            (_, scale, outfmt) = max(matches, key=lambda M: M[0])
+            scales.add(scale); formats.add(outfmt)
+        if (len(scales) == 1): record.scale = scales.pop();
+        if (len(formats) == 1): record.format = formats.pop();
+        return
+    
+    def Record(self, stage:str, record:CommandRecordT):
+        record.stage = stage
+        self.Attribute(record)
+        self.commands.append(record)
+        return
+    
+    def MeasureFrameDirectories(self, cleanup:Storage.IntermediateRefsT|None = None):
+        """ bytes written to every frame-set (directory, or raw frame-store); those already deleted by cleanup were measured when they were removed """
+        if (self.task is None): return;
+        removed = (cleanup.removed if (cleanup is not None) else {})
+        for (name, sink) in self.task.intermediates.items():
+            if not (sink.multisource or (sink.image_format == 'RGBA')): continue;
+            if (name in removed): written = removed[name];
+            elif (sink.srcpath.exists()): written = Storage.DiskUsage(sink.srcpath.resolve());
+            else: continue;
+            self.frame_directories[name] = {"bytes": written, "scale": sink.scale, "frames": sink.frame_count}
+        return
+    
+    def GroupBy(self, key:str) -> dict[str,dict]:
+        groups : dict[str,list[dict]] = {}
+        for record in self.commands: groups.setdefault(str(getattr(record, key)), []).append(record.Summary());
+        return {K: Combine(V) for (K,V) in groups.items()}
+    
+    def Totals(self) -> dict:
+        return {
+            **Combine([R.Summary() for R in self.commands]), "run_wall_s": (time.perf_counter() - self.started),
+            "frame_directory_bytes": sum([D["bytes"] for D in self.frame_directories.values()]),
+        }
+    
+    def Write(self, toplevel:pathlib.Path, workdir_name:str) -> pathlib.Path:
+        """ 'reports/<workdir>_<date>.json': totals, then the breakdown per stage (timed spans and their commands), scale and format, then every command """
+        stage_commands = self.GroupBy("stage")
+        report = {
+            "totals": self.Totals(),
+            "stages": {name: {**times, "commands": stage_commands.get(name, Combine([]))} for (name, times) in self.stages.items()},
+            "scales": self.GroupBy("scale"), # 'None': commands spanning several scales (or none)
+            "formats": self.GroupBy("format"), # 'None': everything except the output-encoding
+            "frame_directories": self.frame_directories,
+            "commands": [R.Entry() for R in self.commands],
+        }
+        report_dir = (toplevel / REPORT_DIRECTORY); report_dir.mkdir(exist_ok=True)
+        report_path = (report_dir / f"{workdir_name}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with report_path.open(mode='w', encoding='utf-8') as report_file: json.dump(report, report_file, indent=2);
+        for stale in sorted(report_dir.glob("*.json"), key=lambda F: F.stat().st_mtime)[:-REPORT_LIMIT]: stale.unlink(missing_ok=True);
+        return report_path
+    
+    def PrintSummary(self):
+        totals = self.Totals()
+        print(f"[REPORT] {totals['commands']} commands in {totals['run_wall_s']:.2f}s "
+            + f"(commands: {totals['wall_s']:.2f}s wall, {totals['user_s']:.2f}s user, {totals['sys_s']:.2f}s sys; peak RSS {Storage.HumanBytes(totals['peak_rss_bytes'])})")
+        for (name, stage) in self.stages.items():
+            print(f"  {name}: {stage['wall_s']:.2f}s wall, {stage['user_s']:.2f}s user, {stage['sys_s']:.2f}s sys")
+        for (fmt, summary) in self.GroupBy("format").items():
+            if (fmt != "None"): print(f"  {fmt}: {summary['commands']} commands, {summary['wall_s']:.2f}s wall");
+        print(f"  frame-directories: {len(self.frame_directories)} ({Storage.HumanBytes(totals['frame_directory_bytes'])} written)")
+        return
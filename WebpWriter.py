@@ -0,0 +1,118 @@
+import pathlib
+import subprocess
+import shutil
+import struct
+import time
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import Kernels
+
+# animated-WebP writer: every frame is encoded to a still WebP by its own 'convert-im6.q16' process (in parallel),
+# then the encoded bitstreams are muxed into one animated container (RIFF 'VP8X' + 'ANIM' + an 'ANMF' chunk per frame) without re-encoding.
+# a single 'convert ... -adjoin WEBP:out' encodes frames one after another on one core; libwebp's 'thread-level' barely helps lossless.
+# invoked from the rendering commands: 'WebpWriter.py METHOD {lossless,lossy} DELAY FRAMES OUTPUT' (see 'Presets.RenderPresetT')
+
+MAGICK_CONVERT = "convert-im6.q16" # webp output is ImageMagick-only; no animation in GraphicsMagick
+LOSSY_QUALITY = 90 # lossless output is identical at every 'method', only the size differs
+FRAME_CHUNKS = (b"ALPH", b"VP8 ", b"VP8L") # the only chunks an 'ANMF' frame carries (metadata is dropped)
+LOOP_FOREVER = 0
+BACKGROUND = 0x00000000 # BGRA; transparent (players may ignore it)
+NO_BLEND = 0x02 # 'ANMF' flags: every frame is a complete image that replaces the canvas (no dispose)
+
+
+def Chunk(fourcc:bytes, payload:bytes) -> bytes:
+    """ RIFF chunk; odd-sized payloads are padded """
+    return fourcc + struct.pack("<I", len(payload)) + payload + (b'\x00' * (len(payload) & 1))
+
+
+def UInt24(value:int) -> bytes: return struct.pack("<I", value)[:3];
+
+
+class FrameT():
+    def __init__(self, path:pathlib.Path):
+        """ parses a still WebP: its bitstream-chunks and dimensions """
+        data = path.read_bytes()
+        assert((data[:4] == b"RIFF") and (data[8:12] == b"WEBP")), f"not a WebP file: '{path}'";
+        self.chunks = []; self.has_alpha = False
+        (self.width, self.height) = (None, None)
+        offset = 12
+        while ((offset + 8) <= len(data)):
+            (fourcc, size) = (data[offset:offset+4], struct.unpack("<I", data[offset+4:offset+8])[0])
+            payload = data[offset+8:offset+8+size]
+            offset += (8 + size + (size & 1))
+            if (fourcc == b"VP8X"):
+                self.has_alpha |= bool(payload[0] & 0x10)
+                (self.width, self.height) = ((int.from_bytes(payload[4:7], 'little') + 1), (int.from_bytes(payload[7:10], 'little') + 1))
+            if (fourcc not in FRAME_CHUNKS): continue;
+            self.chunks.append(Chunk(fourcc, payload))
+            if (fourcc == b"ALPH"): self.has_alpha = True;
+            elif (fourcc == b"VP8L"): # 14-bit (width-1), 14-bit (height-1), alpha-hint bit; after the signature-byte
+                bits = int.from_bytes(payload[1:5], 'little')
+                (self.width, self.height) = (((bits & 0x3FFF) + 1), (((bits >> 14) & 0x3FFF) + 1))
+                self.has_alpha |= bool((bits >> 28) & 1)
+            elif (fourcc == b"VP8 "): # 3-byte frame-tag, 3-byte start-code, then 14-bit dimensions (+ 2-bit scaling)
+                (self.width, self.height) = [(D & 0x3FFF) for D in struct.unpack("<HH", payload[6:10])]
+        assert(any([C[:4] in (b"VP8 ", b"VP8L") for C in self.chunks])), f"no image-data in '{path}'";
+        return
+    
+    def Block(self, duration:int) -> bytes:
+        """ 'ANMF' chunk at the canvas origin """
+        header = UInt24(0) + UInt24(0) + UInt24(self.width - 1) + UInt24(self.height - 1) + UInt24(duration) + bytes([NO_BLEND])
+        return Chunk(b"ANMF", header + b''.join(self.chunks))
+
+
+def Mux(frames:list[FrameT], duration:int, output_path:pathlib.Path):
+    """ :param duration: milliseconds per frame """
+    (width, height) = (max(F.width for F in frames), max(F.height for F in frames))
+    flags = (0x02 | (0x10 if any([F.has_alpha for F in frames]) else 0)) # animation, alpha
+    body = Chunk(b"VP8X", struct.pack("<I", flags) + UInt24(width - 1) + UInt24(height - 1))
+    body += Chunk(b"ANIM", struct.pack("<IH", BACKGROUND, LOOP_FOREVER))
+    body += b''.join([F.Block(duration) for F in frames])
+    temp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}")
+    temp_path.write_bytes(b"RIFF" + struct.pack("<I", (4 + len(body))) + b"WEBP" + body)
+    temp_path.replace(output_path)
+    return
+
+
+def FrameOptions(method:int, lossless:bool) -> list[str]:
+    """ :param method: libwebp 'method' (0-6); effort spent on compression """
+    quality = (["-quality", "100", "-define", "webp:lossless=true"] if lossless else ["-quality", str(LOSSY_QUALITY)]) # lossy is the 'fast' preset; no (slower) sharp-yuv conversion
+    return [*quality, "-define", "webp:thread-level=1", "-define", f"webp:method={method}"]
+
+
+def EncodeFrame(source:str, destination:pathlib.Path, options:list[str]) -> FrameT:
+    """ worker: one single-threaded magick-process per frame """
+    environment = {**os.environ, "MAGICK_THREAD_LIMIT": "1", "OMP_NUM_THREADS": "1"} # parallelism comes from the pool
+    subprocess.run([MAGICK_CONVERT, source, *options, f"WEBP:{destination}"], check=True, env=environment)
+    return FrameT(destination)
+
+
+def WriteWebP(method:int, lossless:bool, delay:int, frames_spec:str, output_path:pathlib.Path):
+    """ :param delay: centiseconds per frame (same as the GIF '-delay') """
+    (frame_format, frame_glob) = Kernels.ParseSpec(frames_spec)
+    frames = sorted(frame_glob.parent.glob(frame_glob.name))
+    assert(len(frames) > 0), f"no frames matching '{frames_spec}'";
+    started = time.perf_counter()
+    encoded_dir = output_path.with_name(f".{output_path.name}.frames")
+    encoded_dir.mkdir(exist_ok=True)
+    try:
+        with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1)) as pool:
+            encoded = [*pool.map(EncodeFrame, [f"{frame_format}:{F}" for F in frames], [(encoded_dir / f"{F.stem}.webp") for F in frames], [FrameOptions(method, lossless)] * len(frames))]
+        Mux(encoded, (delay * 10), output_path)
+    finally: shutil.rmtree(encoded_dir, ignore_errors=True);
+    print(f"[WebpWriter] {len(frames)} frames (method {method}, {'lossless' if lossless else 'lossy'}) in {time.perf_counter() - started:.2f}s -> {output_path.name}")
+    return
+
+
+def EncodeCommand(method:int, lossless:bool, delay:int, frames_spec:str, output_path:pathlib.Path) -> str:
+    return f"'{sys.executable}' '{pathlib.Path(__file__).absolute()}' {method} {'lossless' if lossless else 'lossy'} {delay} {frames_spec} '{output_path}'"
+
+
+if __name__ == "__main__":
+    # usage: WebpWriter.py METHOD {lossless,lossy} DELAY FRAMES OUTPUT
+    (method, quality, delay, frames_spec, output_path) = sys.argv[1:6]
+    assert(0 <= int(method) <= 6), f"invalid webp-method: {method}";
+    assert(quality in ("lossless", "lossy")), f"invalid webp-quality: {quality}";
+    WriteWebP(int(method), (quality == "lossless"), int(delay), frames_spec, pathlib.Path(output_path))
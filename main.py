@@ -1,17 +1,28 @@
 import pathlib
 import tempfile
 import subprocess
+import atexit
 import os
 import json
+import hashlib
 
 from collections import Counter, defaultdict
+from itertools import groupby
 from datetime import datetime
+from contextlib import nullcontext
 
 from CLI import (FilterText, PrintDict, ParseCmdline, ResolveOutputPath)
 from CLI import CalcDeltas as CalcStepDeltas
 import Globals
 import Config
+import Checksum
+import Storage
+import NodeCache
 import Task
+import Kernels
+import Palette
+import Presets
+import Telemetry
 import RGB
 import RenderText
 
@@ -129,9 +140,10 @@ def SetupENV(alt_defaults:dict) -> dict:
 
 
 
-def CreateTempdir(checksum:str, autodelete=True, use_tmpfs=False) -> tuple[pathlib.Path|None,bool]:
+def CreateTempdir(checksum:str, autodelete=True, use_tmpfs=False, preview=False) -> tuple[pathlib.Path|None,bool]:
     """ 
     :param checksum: hash of input file; used as prefix for temporary subdirectory
+    :param preview: separate '_preview' workdir; a preview never shares (or discards) the workdir of a full render of the same input
     :param autodelete: the new temporary-directory will be deleted when program exits (has no effect if pre-existing temporary is reused)
     :param use_tmpfs: toplevel is located on tmpfs instead of under program-directory (attempts to mount tmpfs if mountpoint doesn't exist)
     :return: new temp directory and flag indicating that a pre-existing directory was found. (path is 'None' if tmpfs-mount failed)
@@ -152,12 +164,16 @@ def CreateTempdir(checksum:str, autodelete=True, use_tmpfs=False) -> tuple[pathl
             tempdir_toplevel.rmdir() # removing to ensure 'isNewlyCreated' will be 'True' again on next run
             return (None, False)
         print("mounted tmpfs!")
-        # TODO: should verify that new or pre-existing tempdir_toplevel is actually tmpfs
+    
+    if use_tmpfs: # new or pre-existing mount
+        if Storage.IsTmpfs(tempdir_toplevel): print(f"tmpfs: {Storage.HumanBytes(Storage.FreeSpace(tempdir_toplevel))} free");
+        else: print(f"[WARNING] '{tempdir_toplevel}' is not a tmpfs mount! (intermediates will be written to disk)");
     
     tmpdir_prefix=f"{checksum}_"
-    tmpdir_suffix=f"_{Globals.MAGICKLIBRARY}"
+    tmpdir_suffix=f"{'_preview' if preview else ''}_{Globals.MAGICKLIBRARY}" # library stays the last two characters
     
-    matching_dirs = [*tempdir_toplevel.glob(f"{tmpdir_prefix}*{tmpdir_suffix}/")]
+    matching_dirs = [D for D in tempdir_toplevel.glob(f"{tmpdir_prefix}*{tmpdir_suffix}/")
+                     if (preview or not D.name.endswith(f"_preview{tmpdir_suffix}"))]
     assert(len(matching_dirs) <= 1), "[ERROR]: multiple pre-existing subdirectory matches!!! (this is a bug)"
     
     # see 'temporary-path' in 'policy.xml' and "${MAGICK_TMPDIR}"
@@ -210,8 +226,10 @@ def CreateTempdir(checksum:str, autodelete=True, use_tmpfs=False) -> tuple[pathl
     # per-process tempdir - optionally autodeleted when the program exits
     tempdir = Globals.TEMPDIR_REF = tempfile.TemporaryDirectory(
         prefix=tmpdir_prefix, suffix=tmpdir_suffix, dir=tempdir_toplevel,
-        delete=autodelete, ignore_cleanup_errors=False
+        delete=False, ignore_cleanup_errors=False
     )
+    # autodelete doesn't use 'TemporaryDirectory' cleanup; deleting thousands of frames synchronously stalls exit after outputs are published
+    if autodelete: atexit.register(Storage.DiscardWorkdir, pathlib.Path(tempdir.name));
     print(f"created temp directory: '{tempdir.name}' [{'AUTO-DELETE' if autodelete else 'PRESERVE'}]")
     # must construct and return a 'pathlib.Path' because the behavior of '.name' is incompatible between the two classes
     # 'tempfile.TemporaryDirectory' returns the whole path, whereas 'pathlib.Path' would only return the last segment.
@@ -288,11 +306,26 @@ def QueryImageSize(source: pathlib.Path) -> tuple[int, int]:
     return (imagesize[0], imagesize[1])
 
 
-def MakeImageSources(workdir:pathlib.Path, input_file:pathlib.Path, max_frames:int|None=None) -> tuple[Task.ImageSourceT, pathlib.Path, dict|None]:
+def FindDuplicateFrames(framelist:list[pathlib.Path]) -> dict[int,int]:
+    """ hashes each extracted frame; identical frames are mapped to their first occurrence.
+    ffmpeg writes decoded frames deterministically, so byte-identical files mean identical pixels.
+    :return: frame-index -> index of earlier identical frame (only duplicates are included) """
+    first_seen:dict[bytes,int] = {}; duplicates:dict[int,int] = {}
+    for (index, frame) in enumerate(framelist):
+        digest = hashlib.blake2b(frame.read_bytes(), digest_size=16).digest()
+        if (digest in first_seen): duplicates[index] = first_seen[digest];
+        else: first_seen[digest] = index;
+    return duplicates
+
+
+def MakeImageSources(workdir:pathlib.Path, input_file:pathlib.Path, max_frames:int|None=None, decode_scale:int=100, render_preset:Presets.RenderPresetT|None=None, max_dimension:int|None=None) -> tuple[Task.ImageSourceT, pathlib.Path, dict|None]:
     """
     :param workdir: temp subdirectory for image-processing
     :param input_file: image being RGBified; copied to workdir
     :param max_frames: limit number of frames extracted from video source
+    :param decode_scale: percent; video frames are extracted at this size (still images are scaled by ImagePreprocess, after cropping)
+    :param render_preset: zlib-level of the PNG intermediates (decoded video frames, converted stills); default: 'Presets.DEFAULT_PRESET'
+    :param max_dimension: video frames are decoded small enough to fit (see 'Presets.PreviewScale'); stills are unaffected
     :return: ImageSource, baseimage-path, stream_info (for video sources)
     """
     assert(workdir.exists() and workdir.is_dir())
@@ -306,6 +339,8 @@ def MakeImageSources(workdir:pathlib.Path, input_file:pathlib.Path, max_frames:i
     # TODO: actually verify the filetype/encoding of baseimg
     if (len(input_file.suffixes) == 0): print("[WARNING] no suffix on input-file - assuming PNG");
     og_suffix = (input_file.suffixes[-1].removeprefix('.') if (len(input_file.suffixes) > 0) else 'PNG').lower()
+    preset = (render_preset or Presets.RENDER_PRESETS[Presets.DEFAULT_PRESET])
+    (png_opts_ffmpeg, png_opts_magick) = (preset.FFmpegPNGArgs(), preset.MagickPNGArgs())
     animatedFormats = ('mp4','gif','mkv','mov','avi') # TODO: figure out how to test gif/webp for animation
     stream_info = None
     
@@ -346,6 +381,7 @@ def MakeImageSources(workdir:pathlib.Path, input_file:pathlib.Path, max_frames:i
         # this calculation: ^ assumes incremental numbering starting at ZERO! (indexing from 1 would not subtract)
         
         dimensions = [video_stream[D] for D in ('width', 'height')] # integers
+        if (max_dimension is not None): decode_scale = min(decode_scale, Presets.PreviewScale(dimensions, max_dimension));
         framerates = [video_stream[R] for R in ("r_frame_rate", "avg_frame_rate")] # "60/1"
         if (framerates[0] != framerates[1]): print("[WARNING] r/avg framerates mismatch!");
         (N,D) = [int(I) for I in framerates[0].split('/',maxsplit=1)]; framerate = int(N/D)
@@ -394,7 +430,10 @@ def MakeImageSources(workdir:pathlib.Path, input_file:pathlib.Path, max_frames:i
         # TODO: AAC audio should use '.m4a' extension? # https://trac.ffmpeg.org/wiki/Encode/AAC
         # using '.aac' causes ffmpeg to complain when recombining the audio/video - "[aac] Estimating duration from bitrate, this may be inaccurate"
         
-        prefix = 'frame'; suffix = '.png'
+        prefix = 'frame'; suffix = '.png'; scale_filter = ''
+        if (decode_scale != 100): # downscaled while decoding; full-size frames are never written
+            src_path = src_path.with_name(f"{src_path.name}_scale{decode_scale}"); source.srcpath = src_path; source.scale = decode_scale
+            scale_filter = f"-vf 'scale=trunc(iw*{decode_scale}/100):trunc(ih*{decode_scale}/100):flags=area'"
         if src_path.exists(): print(f"skipping srcimg frame-extraction (already exists)");
         else:
             print("extracting frames from baseimg...")
@@ -402,7 +441,7 @@ def MakeImageSources(workdir:pathlib.Path, input_file:pathlib.Path, max_frames:i
             
             frame_path = src_path / f"{prefix}%0{index_length}d{suffix}"
             # "-start_number 0": ffmpeg numbers the extracted frames from index '1' by default, not '0'
-            status = os.system(f"ffmpeg -hide_banner -loglevel warning -nostdin -n -an -i '{baseimg_path}' -f image2 -start_number 0 '{frame_path}'")
+            status = os.system(f"ffmpeg -hide_banner -loglevel warning -nostdin -n -an -i '{baseimg_path}' {scale_filter} {png_opts_ffmpeg} -f image2 -start_number 0 '{frame_path}'")
             if (status != 0): print(f"ffmpeg frame-extraction exited with nonzero status: {status}; exiting..."); exit(4);
         
         framelist = sorted([*src_path.glob(f"{prefix}{'[0-9]'*index_length}{suffix}")]) # 'frame[0-9][0-9][0-9].png'
@@ -411,12 +450,17 @@ def MakeImageSources(workdir:pathlib.Path, input_file:pathlib.Path, max_frames:i
         source.source_frames = framelist[:FC]
         source.indexlength = index_length
         task_info['frames_max'] = FC
+        
+        print("checking for duplicate frames...")
+        source.duplicate_frames = FindDuplicateFrames(source.source_frames)
+        task_info['duplicate_frames'] = len(source.duplicate_frames)
+        print(f"duplicate frames: {len(source.duplicate_frames)}/{FC} (preprocessing will be reused)")
     else:
         source.__setattr__("dimensions", QueryImageSize(baseimg_path))
         if (og_suffix.lower() != 'png'): # non-PNG images must be converted to PNG
             basepng_path = baseimg_path.with_suffix(".png")
             ft_prefix = ('JPEG' if (og_suffix.lower() == 'jpg') else og_suffix.upper())
-            os.system(f"gm convert '{ft_prefix}:{baseimg_path}' 'PNG:{basepng_path}'")
+            os.system(f"gm convert '{ft_prefix}:{baseimg_path}' {png_opts_magick} 'PNG:{basepng_path}'")
             baseimg_path = basepng_path
         
         os.system(f"cp --verbose '{baseimg_path}' '{src_path}'")
@@ -426,11 +470,25 @@ def MakeImageSources(workdir:pathlib.Path, input_file:pathlib.Path, max_frames:i
     return (source, baseimg_path, stream_info)
 
 
-def SubCommand(cmdline:list[str]|str, logname:str|None = "main", isCmdSequence:bool = False):
+def CreateImageSources(args, workdir:pathlib.Path, frames_max:int|None, preprocess_scale:int, render_preset:Presets.RenderPresetT) -> tuple[Task.ImageSourceT, pathlib.Path, dict|None, int]:
+    """ 'MakeImageSources' for the parsed args; '--preview' replaces 'args.scales' with the single preview-scale
+    :return: ImageSource, baseimage-path, stream_info, preprocess_scale """
+    if not args.preview: return (*MakeImageSources(workdir, args.image_path, frames_max, preprocess_scale, render_preset), preprocess_scale);
+    # everything runs at the preview-scale; video is decoded at that size, and only its first frames
+    preview_frames = min((frames_max or Presets.PREVIEW_FRAMES), Presets.PREVIEW_FRAMES)
+    (source, baseimg, stream_info) = MakeImageSources(workdir, args.image_path, preview_frames, preprocess_scale, render_preset, Presets.PREVIEW_MAX_DIMENSION)
+    preprocess_scale = min(preprocess_scale, Presets.PreviewScale(source.dimensions)); args.scales = [f"{preprocess_scale}%"]
+    print(f"[PREVIEW] {source.dimensions[0]}x{source.dimensions[1]} at {preprocess_scale}%")
+    return (source, baseimg, stream_info, preprocess_scale)
+
+
+def SubCommand(cmdline:list[str]|str, logname:str|None = "main", isCmdSequence:bool = False, on_complete=None, report:Telemetry.RunReportT|None = None):
     """ Run a command in subprocess and log output. Logs are appended to or created automatically.
     :param cmdline: string or args-list (including command itself)
     :param logname: identifier used in filename. Skip logging if None.
     :param isCmdSequence: 'cmdline' is a list of commands to execute (rather than a single cmdline split by word)
+    :param on_complete: called with each command after it exits successfully (see 'Storage.IntermediateRefsT')
+    :param report: records the time and resource-usage of each command, under the stage 'logname' (see 'Telemetry.py')
     """
     if (len(cmdline) == 0): print(f"[WARNING] skipping subcommand: empty cmdline! (logname: {logname})"); return;
     
@@ -471,21 +529,43 @@ def SubCommand(cmdline:list[str]|str, logname:str|None = "main", isCmdSequence:b
     # 'capturing' either stream means it won't get printed; set them to 'None' if you want them printed.
     
     # mode='a' - append to existing file, or create new
-    with (log_filepath.open(mode='a', encoding="utf-8") as logfile):
+    with (log_filepath.open(mode='a', encoding="utf-8") as logfile, (report.Stage(logname or "main") if (report is not None) else nullcontext())):
         cmdline_str = (cmd_seq[0] if isinstance(cmdline,str) 
                        else ("\n" if isCmdSequence else " ").join(cmd_seq))
         logfile.write(cmdline_str); logfile.write("\n\n"); logfile.flush()
         stderr_dest = (logfile if not skiplog else None)
         use_shell = (isinstance(cmd_seq[0],str))
         for cmd in cmd_seq: # prints stdout, logs stderr
-            completed = subprocess.run(cmd, check=True, stdout=None, stderr=stderr_dest, encoding="utf-8", shell=use_shell)
-            if (completed.returncode != 0): print(f"[ERROR] nonzero exit-status: {completed.returncode}\n"); break;
+            completed = Telemetry.RunCommand(cmd, use_shell, stderr_dest)
+            if (report is not None): report.Record((logname or "main"), completed);
+            if (completed.returncode != 0): print(f"[ERROR] nonzero exit-status: {completed.returncode}\n"); raise subprocess.CalledProcessError(completed.returncode, cmd);
+            if (on_complete is not None): on_complete(cmd);
         logfile.write('_'*120); logfile.write("\n\n")
     
     print("\n")
     return
 
 
+def IsMagickCommand(cmd:str) -> bool: return cmd.startswith(('convert','composite','mogrify'));
+
+
+def WriteBatchSegments(workdir:pathlib.Path, title:str, commandlist:list[str]) -> list[str]:
+    """ 'gm batch' only runs magick-commands; anything else (Kernels.py, NodeCache.py) is executed directly, splitting the batchfile around it
+    :return: commands executing commandlist in order (batch-commands for each magick-segment) """
+    batchdir = workdir/"batchfile"
+    batchdir.mkdir(exist_ok=True)
+    segments = [(is_magick, [*group]) for (is_magick, group) in groupby(commandlist, key=IsMagickCommand)]
+    commands = []
+    for (segment_index, (is_magick, segment)) in enumerate(segments):
+        if not is_magick: commands.extend(segment); continue;
+        filepath = batchdir/(title if (segment_index == 0) else f"{title}_{segment_index}")
+        print(f"writing commands to: batchfile/{filepath.name}")
+        with filepath.open(mode='w', encoding='utf-8') as newfile:
+            newfile.write('\n'.join(segment)); newfile.write('\n');
+        commands.append(f"gm batch -echo on -stop-on-error on '{filepath}'")
+    return commands
+
+
 def SavePreprocessingCommands(workdir:pathlib.Path, expanded_commands:dict):
     print(f"expanded_command_keys: {expanded_commands.keys()}")
     preprocessing_pipeline = defaultdict(list)
@@ -495,6 +575,7 @@ def SavePreprocessingCommands(workdir:pathlib.Path, expanded_commands:dict):
         "recolor_black",
         "recolor_composite",
         "renderedtext",
+        "text_layer",
         "text_overlay",
         "edge",
         "preprocessed",
@@ -504,6 +585,7 @@ def SavePreprocessingCommands(workdir:pathlib.Path, expanded_commands:dict):
     for (magic, expanded_cmd) in expanded_commands.items():
         magic = ("final" if (magic=="$$srcimg$$") else magic.strip('$$'));
         magic = magic.removeprefix('srcimg_').removesuffix("_modulation");
+        if magic.startswith("scale"): magic = "final"; # 'srcimg_scale50'; rescaled layers ('edge_scale50') fall under their layer's step
         if (magic == "opacity_mask"): continue; # transform_hooks got this
         if (magic not in preprocessing_steps): # no exact matches
             for step in preprocessing_steps: # fallback to prefix
@@ -516,39 +598,47 @@ def SavePreprocessingCommands(workdir:pathlib.Path, expanded_commands:dict):
         else: assert(False),f"[EXPANDED_TYPE_UNKNOWN] {expanded_cmd}:{expanded_cmd.__class__()}";
     # PrintDict(preprocessing_pipeline, "[PREPROCESSING_PIPELINE]") # unreasonable amount of spam
     
-    batch_files = []
-    batchdir = workdir/"batchfile"
-    batchdir.mkdir(exist_ok=True)
+    # child-sinks' commands are listed under their parent as well as their own key (see 'parent_map' in ImagePreprocess)
+    # which maps both into the same step; identical commands produce identical outputs, so only the first is kept
+    (seen_commands, duplicate_count) = (set(), 0)
     for (title, commandlist) in preprocessing_pipeline.items():
-        if (len(commandlist) == 0): continue;
-        filepath = batchdir/title
-        print(f"writing commands to: batchfile/{filepath.name}")
-        with filepath.open(mode='w', encoding='utf-8') as newfile:
-            newfile.write('\n'.join(commandlist)); newfile.write('\n');
-        if not (filepath in batch_files): batch_files.append(filepath);
+        unique_commands = [C for C in commandlist if not ((C in seen_commands) or seen_commands.add(C))]
+        duplicate_count += (len(commandlist) - len(unique_commands)); preprocessing_pipeline[title] = unique_commands;
+    if (duplicate_count > 0): print(f"[OPTIMIZER] removed {duplicate_count} duplicate batch-commands");
+    
+    batch_commands = []
+    for (title, commandlist) in preprocessing_pipeline.items():
+        for batch_cmd in WriteBatchSegments(workdir, title, commandlist):
+            if not (batch_cmd in batch_commands): batch_commands.append(batch_cmd);
     print(f"finished writing all batchfiles!\n")
-    batch_commands = [f"gm batch -echo on -stop-on-error on '{batchfile}'" for batchfile in batch_files]
     print('\n'.join(batch_commands)); print('\n');
     return batch_commands
 
 
 def Main(identify_srcimg=False):
+    run_report = Telemetry.RunReportT() # written to the workdir at exit (see 'Telemetry.py')
     (conf_env_defaults, conf_cmdline_args, main_config) = Config.Init()
     args = ParseCmdline(conf_cmdline_args); Globals.Break("PARSE_ONLY")
     if args is None: exit(0); # debug mode or arglist contained '--help'
     
     # RenderText being used as input-image - which doesn't actually exist yet
     if (hasattr(args, "RenderTextInput")): # hash the filepath itself instead
-        image_md5sum = subprocess.check_output(["md5sum", '-'], input=bytes(args.image_path))
-    else: image_md5sum = subprocess.check_output(["md5sum", str(args.image_path)]);
-    checksum = str(image_md5sum, encoding="utf-8").split()[0]
-    assert(len(checksum) == 32), "MD5-hash did not match expected length"
-    checksum = checksum[:8] # truncate for better readablity
+        input_digest = Checksum.HashBytes(bytes(args.image_path))
+    else: input_digest = Checksum.CachedDigest(args.image_path);
+    Globals.INPUT_DIGEST = input_digest # full-width; used for cache keys
+    checksum = input_digest[:Checksum.WORKDIR_PREFIX_LENGTH] # truncated for better readablity
     
-    (workdir, wasNewlyCreated) = CreateTempdir(checksum, autodelete=args.autodelete, use_tmpfs=args.use_tmpfs)
+    (workdir, wasNewlyCreated) = CreateTempdir(checksum, autodelete=args.autodelete, use_tmpfs=args.use_tmpfs, preview=args.preview)
     if (workdir is None): print(f"no workdir. exiting"); exit(2); # tmpfs mount attempted and failed
     assert(Globals.TEMPDIR_REF is not None); assert(workdir.exists());
     
+    Storage.LockWorkdir(workdir) # before GC; the current workdir must never be evicted
+    if not args.preview: Storage.CollectGarbage(workdir.parent, main_config["gc_budget"], main_config["gc_max_age_days"], main_config["spill_dir"]); # previews stay low-latency
+    node_cache = None
+    if args.node_cache: # reused across workdirs; keyed from 'Globals.INPUT_DIGEST'
+        node_cache = NodeCache.NodeCacheT(NodeCache.CacheDirectory(main_config["node_cache_dir"]), Storage.ParseBytes(main_config["node_cache_budget"]))
+        node_cache.Prune(main_config["gc_max_age_days"])
+    
     output_directory = ResolveOutputPath(args, workdir.parent)
     print(f"output_directory resolved to: {output_directory}")
     Globals.Break("PARSE_ONLY") # select with '--parse-only 2'
@@ -564,7 +654,10 @@ def Main(identify_srcimg=False):
         args.rendertext = None # avoiding another 'rendertext' subcommand later
     
     frames_max = (args.duration if (isD := (args.duration is not None)) else args.framecap)
-    (source, baseimg, stream_info) = MakeImageSources(workdir, args.image_path, frames_max)
+    preprocess_scale = (100 if args.late_scale else Task.PreprocessScale(args.scales))
+    if (preprocess_scale != 100): print(f"[SCALE] every output is downscaled; preprocessing at {preprocess_scale}% ('--late-scale' to preprocess at full-size)");
+    render_preset = Presets.RENDER_PRESETS[("fast" if args.preview else args.render_preset)]
+    with run_report.Stage("image_sources"): (source, baseimg, stream_info, preprocess_scale) = CreateImageSources(args, workdir, frames_max, preprocess_scale, render_preset);
     srcimg = source.srcpath
     
     if (stream_info is not None):
@@ -582,6 +675,11 @@ def Main(identify_srcimg=False):
         source.frame_count  = framecount
         source.indexlength = index_length
     if (frames_max is None): frames_max = 0;
+    preview_cycle = None # full cycle-length; the preview renders an evenly spaced sample of its rotations
+    if (args.preview and (stream_info is None) and (source.frame_count > Presets.PREVIEW_FRAMES)):
+        preview_cycle = source.frame_count
+        source.frame_count = Presets.PREVIEW_FRAMES; source.indexlength = 1+int(RGB.log10(Presets.PREVIEW_FRAMES-1))
+        print(f"[PREVIEW] {Presets.PREVIEW_FRAMES}/{preview_cycle} rotations")
     
     log_directory = RotateMagickLogs(workdir.parent, main_config["log_limit"])
     Globals.UpdateGlobals(workdir, srcimg, log_directory) # dbgprint=True
@@ -602,37 +700,44 @@ def Main(identify_srcimg=False):
         print(f"\n{'_'*120}\n{' '*50}TEXT RENDERING\n{'_'*120}")
         (renderTextCmd, rtoutput) = RenderText.BuildCommandline(args.rendertext, workdir)
         rendertext_relocation_path = workdir/'renderedtext.png'
-        SubCommand(renderTextCmd, "text_rendering")
+        SubCommand(renderTextCmd, "text_rendering", report=run_report)
         rtoutput.rename(rendertext_relocation_path)
         mpc_text = rendertext_relocation_path.with_suffix('.mpc')
         conversion_command = f"{('gm ' if (Globals.MAGICKLIBRARY=="GM") else '')}convert '{rendertext_relocation_path}' 'MPC:{mpc_text}'"
-        SubCommand(conversion_command, "text_rendering")
+        SubCommand(conversion_command, "text_rendering", report=run_report)
         text_source = Task.TextOverlayT(mpc_text, 'renderedtext')
         text_source.image_format = 'MPC'
         
-        # rescaling text to fit width
+        # rescaling text to fit width (and to the preprocessing-scale)
         autosz = args.rendertext.autosize
         dimensions = QueryImageSize(rendertext_relocation_path)
-        if (autosz and (dimensions[0] != source.dimensions[0])):
+        width_ratio = ((source.dimensions[0] / dimensions[0]) if (autosz and (dimensions[0] != source.dimensions[0])) else 1)
+        width_ratio *= (preprocess_scale / 100)
+        if (width_ratio != 1):
             # 'dimensions' attr is added by MakeImageSources
-            width_ratio = source.dimensions[0] / dimensions[0]
             rendertext_rescaled_path = mpc_text.with_name('renderedtext_rescaled')
             rescale_cmd = f"{('gm ' if (Globals.MAGICKLIBRARY=="GM") else '')}convert '{mpc_text}' -scale '{int(width_ratio*100)}%' '{rendertext_rescaled_path}'"
             text_source = Task.TextOverlayT(rendertext_rescaled_path, 'renderedtext_rescaled'); text_source.image_format = 'MPC'
-            SubCommand(rescale_cmd, logname="text_rendering")
+            SubCommand(rescale_cmd, logname="text_rendering", report=run_report)
         
-        text_source.offset = args.text_offset
+        text_source.scale = preprocess_scale
+        text_source.offset = Task.ScaleOffset(args.text_offset, preprocess_scale)
         text_source.gravity = args.text_gravity
         rendertext_sources.append(text_source)
     
     
-    output_filename = f"{source.safe_filename}_RGB"
+    output_filename = f"{source.safe_filename}{'_preview' if args.preview else ''}_RGB"
     print(f"output_filename: {output_filename}")
     print(f"original location: {args.image_path.parent.absolute()}")
     print(f"final: {(output_directory/output_filename).absolute()}")
     
     primary_format = (args.tempformat if (args.tempformat is not None)
                       else ('MPC' if(stream_info is None) else 'MIFF')) # usually OOM with video inputs
+    (compress_frames, compression_ratio) = (False, None)
+    if (args.tempformat == 'MPC'): # MPC is a raw pixel-cache; no need to benchmark
+        if (args.tempcompress == "on"): print("[WARNING] '--tempformat MPC' can't be compressed; ignoring '--tempcompress'");
+    else: (compress_frames, compression_ratio) = Storage.ChooseTempCompression(workdir, args.tempcompress, source.QuoteSource()[0].strip("'"), Globals.MAGICKLIBRARY);
+    if compress_frames: primary_format = 'MIFF';
     
     color_opts = Task.ColorRemapT(
         (args.white, args.black) if args.remap else None,
@@ -654,10 +759,34 @@ def Main(identify_srcimg=False):
         rendertext_sources,
     )
     
+    task.compress_frames = compress_frames
+    task.compression_ratio = compression_ratio
+    task.preprocess_scale = preprocess_scale
+    task.late_scale = args.late_scale
+    task.use_kernels = (task.use_kernels and args.kernels)
+    preprocess_pixels = int(source.dimensions[0] * source.dimensions[1] * (preprocess_scale / 100)**2)
+    if task.use_kernels: task.tile_size = Kernels.TileSize(preprocess_pixels, args.tile_size);
+    elif args.tile_size: print("[WARNING] '--tile-size' requires the numpy kernels (see 'Kernels.py'); processing whole images");
+    if (task.tile_size is not None): print(f"[TILES] {preprocess_pixels} pixels; kernels use {task.tile_size}px tiles");
+    if ((task.tile_size is not None) and Storage.IsTmpfs(workdir)): # the raw scratch-images (and magick's pixel-cache) would be RAM
+        scratch_dir = Storage.SpillDirectory(main_config["spill_dir"], workdir); scratch_dir.mkdir(parents=True, exist_ok=True)
+        if args.autodelete: atexit.register(Storage.DiscardDirectory, scratch_dir);
+        os.environ[Kernels.SCRATCH_VARIABLE] = str(scratch_dir)
+        print(f"  scratch-images on disk: '{scratch_dir}'")
+    task.render_preset = render_preset
+    task.webp_method = args.webp_effort
+    task.gif_writer = args.gif_writer
+    if (args.gif_writer and not Palette.AVAILABLE): print("[WARNING] '--gif-writer' requires numpy (see 'GifWriter.py'); GIFs are rendered by magick");
+    task.node_cache = node_cache
+    if args.preview:
+        task.gif_colors = Presets.PREVIEW_COLORS
+        task.preview_cycle = preview_cycle
+        if (preview_cycle is not None): task.delay = round(task.delay * preview_cycle / task.image_source.frame_count); # same cycle-duration as the full render
     expected_outputs = Task.FillExpectedOutputs(task)
     print('\n'); assert(len(expected_outputs) > 0), "no expected outputs"
+    run_report.Attach(task)
     
-    enumrotations = RGB.EnumRotations(args.stepsize, frames_max)
+    enumrotations = (RGB.EnumRotations(args.stepsize, frames_max) if (preview_cycle is None) else task.Rotations(args.stepsize))
     if (args.stepwhite or args.stepblack or args.stepedge or args.steptext):
         stepsize_deltas = CalcStepDeltas(args)
         task.stepsize_deltas = stepsize_deltas
@@ -667,43 +796,64 @@ def Main(identify_srcimg=False):
     # not necessary, but it's nice to seperate each preprocessing step
     if (Globals.MAGICKLIBRARY == "GM"):
         print("INITIAL PREPROCESSING")
-        expanded_commands = Task.ImagePreprocess(task)
-        preprocess_batch_commands = SavePreprocessingCommands(workdir, expanded_commands); Globals.Break("PRINT_ONLY");
-        SubCommand(preprocess_batch_commands, "manual_preprocessing", isCmdSequence=True); print(f"{'_'*120}\n");
+        with run_report.Stage("planning"):
+            expanded_commands = Task.ImagePreprocess(task)
+            Storage.PlanStorage(task, main_config["spill_dir"], args.autodelete)
+            preprocess_batch_commands = SavePreprocessingCommands(workdir, expanded_commands)
+        Globals.Break("PRINT_ONLY")
     
     print("PREPARING FRAME GENERATION")
     # command_names = ("preprocessing", "frame_generation", "rendering")
-    commands = Task.GenerateFrames(task, enumrotations)
-    (webp_rendercmds, ffmpeg_commands) = commands[-2:]; commands = commands[:3]
+    with run_report.Stage("planning"):
+        commands = Task.GenerateFrames(task, enumrotations)
+        (webp_rendercmds, ffmpeg_commands) = commands[-2:]; commands = commands[:3]
+        if (Globals.MAGICKLIBRARY == "IM"): Storage.PlanStorage(task, main_config["spill_dir"], args.autodelete); # GM planned before preprocessing
     
     cmd_names = ("preprocessing", "frame_generation", "rendering", "rendering_webp", "rendering_ffmpeg")
-    batch_files = [RGB.SaveCommand(name, cmd) for (name, cmd) in zip(cmd_names[:3], commands[:3])][0::1]
-    batch_commands = [f"gm batch -echo on -stop-on-error on '{batchfile}'" for batchfile in batch_files]
+    if (Globals.MAGICKLIBRARY == "GM"): # each stage runs as batchfiles; commands 'gm batch' can't run (Kernels.py) are split out
+        stage_commands = [WriteBatchSegments(workdir, name, cmd) for (name, cmd) in zip(cmd_names[:3], commands[:3])]
+    else:
+        stage_commands = commands # executed directly; the saved batchfiles are only a record
+        for (name, cmd) in zip(cmd_names[:3], commands[:3]):
+            if (len(cmd) > 0): RGB.SaveCommand(name, cmd);
+    
+    # intermediates are deleted as soon as their last consumer finishes, rather than all at exit
+    cleanup = Storage.IntermediateRefsT(task, enabled=(args.autodelete and not args.nowrite))
+    cleanup.Plan([
+        *([preprocess_batch_commands] if (Globals.MAGICKLIBRARY == "GM") else []),
+        *stage_commands, webp_rendercmds, ffmpeg_commands,
+    ])
     
     if Globals.DEBUG_PRINT_CMDS:
         print(f"\n{'_'*120}\n\nDEBUG_PRINT_CMDS!\n{'_'*120}")
         all_command_lists=[*commands,webp_rendercmds,ffmpeg_commands]
         for (cmd_name, cmdlist) in zip(cmd_names, all_command_lists):
             print(f"\n{cmd_name}:\n  {'\n  '.join(cmdlist)}")
-        print(f"\nbatch_commands:\n  {'\n  '.join(batch_commands)}")
+        if (Globals.MAGICKLIBRARY == "GM"): print(f"\nbatch_commands:\n  {'\n  '.join([C for stage in stage_commands for C in stage])}");
         print(f"\n{'_'*120}\n")
     Globals.Break("PRINT_ONLY")
     
-    if (use_IM := (Globals.MAGICKLIBRARY == "IM")): batch_commands = []; # prevents GM-only cmds
-    batch_zip = zip(cmd_names, (batch_commands if (Globals.MAGICKLIBRARY == "GM") else commands))
-    for (cmds_name, commands) in batch_zip: SubCommand(commands, cmds_name, isCmdSequence=use_IM)
-    if  (len(webp_rendercmds) > 0): SubCommand(webp_rendercmds, cmd_names[3], isCmdSequence=True)
-    if  (len(ffmpeg_commands) > 0): SubCommand(ffmpeg_commands, cmd_names[4], isCmdSequence=True)
-    print(f"{'_'*120}\n")
-    
-    if args.nowrite: print('skipping final writes!!'); return;
-    print(f"moving outputs to final destinations...")
-    checked_outputs = Task.CheckExpectedOutputs(task)
-    move_output_cmd = [
-        f"cp --verbose --backup=numbered '{work_file}' '{final_dest}'"
-        for (work_file, final_dest) in checked_outputs
-    ]
-    SubCommand(move_output_cmd, logname=None, isCmdSequence=True)
+    try: # the report is written even if a command fails
+        if (Globals.MAGICKLIBRARY == "GM"):
+            SubCommand(preprocess_batch_commands, "manual_preprocessing", isCmdSequence=True, on_complete=cleanup.Consumed, report=run_report); print(f"{'_'*120}\n");
+        
+        for (cmds_name, stage) in zip(cmd_names, stage_commands):
+            if (len(stage) > 0): SubCommand(stage, cmds_name, isCmdSequence=True, on_complete=cleanup.Consumed, report=run_report);
+        if  (len(webp_rendercmds) > 0): SubCommand(webp_rendercmds, cmd_names[3], isCmdSequence=True, on_complete=cleanup.Consumed, report=run_report)
+        if  (len(ffmpeg_commands) > 0): SubCommand(ffmpeg_commands, cmd_names[4], isCmdSequence=True, on_complete=cleanup.Consumed, report=run_report)
+        cleanup.Report()
+        print(f"{'_'*120}\n")
+        
+        if args.nowrite: print('skipping final writes!!'); return;
+        print(f"moving outputs to final destinations...")
+        with run_report.Stage("publish"):
+            checked_outputs = Task.CheckExpectedOutputs(task)
+            for (work_file, final_dest) in checked_outputs:
+                Storage.PublishOutput(work_file, final_dest, keep_workfile=(not args.autodelete))
+    finally:
+        run_report.MeasureFrameDirectories(cleanup)
+        print(f"\nrun report: '{run_report.Write(workdir.parent, workdir.name)}'")
+        run_report.PrintSummary()
     
     return
 
@@ -0,0 +1,23 @@
+import sys
+
+import CLI
+
+
+def Parse(monkeypatch, tmp_path, *options:str):
+    image = (tmp_path / "input.png"); image.write_bytes(b'')
+    monkeypatch.setattr(sys, "argv", ["RGBifier", str(image), *options])
+    return CLI.ParseCmdline([])
+
+
+def test_preview_skips_probe_and_node_cache(monkeypatch, tmp_path):
+    args = Parse(monkeypatch, tmp_path, "--preview", "--format", "mp4", "sheet")
+    assert (args.tempcompress == "off")
+    assert (args.node_cache is False)
+    assert (args.output_formats == ["SHEET"]) # MP4 is dropped
+
+
+def test_full_render_keeps_defaults(monkeypatch, tmp_path):
+    args = Parse(monkeypatch, tmp_path, "--format", "mp4")
+    assert (args.tempcompress == "auto")
+    assert (args.node_cache is True)
+    assert ("MP4" in args.output_formats)
@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+import GifWriter
+
+# Pillow's GIF encoder stands in for the magick chunks; Pillow also decodes the spliced result
+
+
+def Frames(colors:int, count:int, size:int, seed:int):
+    rng = numpy.random.default_rng(seed)
+    palette = rng.integers(0, 256, (colors, 3), dtype=numpy.uint8)
+    return (palette, [rng.integers(0, colors, (size, size), dtype=numpy.uint8) for _ in range(count)])
+
+
+def EncodeChunk(palette, frames, transparent:int|None) -> bytes:
+    images = []
+    for indices in frames:
+        image = Image.fromarray(indices, mode='P'); image.putpalette(palette.tobytes())
+        images.append(image)
+    options = ({"transparency": transparent} if (transparent is not None) else {})
+    encoded = io.BytesIO()
+    images[0].save(encoded, format="GIF", save_all=True, append_images=images[1:], optimize=False, disposal=1, **options)
+    return encoded.getvalue()
+
+
+def Composite(palette, frames, transparent:int|None):
+    """ expected RGBA of every frame; '-dispose None' keeps the previous frame under transparent pixels """
+    canvas = numpy.zeros((*frames[0].shape, 4), dtype=numpy.uint8); expected = []
+    for indices in frames:
+        opaque = ((indices != transparent) if (transparent is not None) else numpy.ones(indices.shape, dtype=bool))
+        canvas[opaque, :3] = palette[indices[opaque]]; canvas[opaque, 3] = 255
+        expected.append(canvas.copy())
+    return expected
+
+
+@pytest.mark.parametrize("colors", [2, 3, 16, 200, 256])
+@pytest.mark.parametrize("transparent", [None, 1])
+def test_spliced_chunks_decode(tmp_path, colors:int, transparent:int|None):
+    (palette, frames) = Frames(colors, 7, 96, colors) # random pixels; the LZW tables fill up and reset
+    chunks = [EncodeChunk(palette, frames[start:stop], transparent) for (start, stop) in ((0, 3), (3, 4), (4, 7))]
+    output = (tmp_path / "out.gif")
+    assert (GifWriter.Assemble(chunks, 7, output) == len(frames))
+    
+    with Image.open(output) as decoded:
+        assert (decoded.n_frames == len(frames))
+        assert (decoded.info["loop"] == GifWriter.LOOP_FOREVER)
+        for (number, expected) in enumerate(Composite(palette, frames, transparent)):
+            decoded.seek(number)
+            assert (decoded.info["duration"] == 70)
+            pixels = numpy.asarray(decoded.convert("RGBA"))
+            numpy.testing.assert_array_equal((pixels[..., 3] > 0), (expected[..., 3] > 0))
+            numpy.testing.assert_array_equal(pixels[expected[..., 3] > 0], expected[expected[..., 3] > 0])
+
+
+def test_chunks_are_contiguous():
+    frames = list(range(10))
+    assert (GifWriter.Chunks(frames, 4) == [[0, 1], [2, 3, 4], [5, 6], [7, 8, 9]])
+    assert (GifWriter.Chunks(frames[:2], 8) == [[0], [1]])
@@ -0,0 +1,40 @@
+import argparse
+import pathlib
+
+import main
+import Presets
+import Task
+
+
+def FakeSources(dimensions:tuple[int,int]):
+    """ stands in for 'main.MakeImageSources'; records the frame-limit and max_dimension it was called with """
+    calls = []
+    def MakeImageSources(workdir, input_file, max_frames=None, decode_scale=100, render_preset=None, max_dimension=None):
+        calls.append((max_frames, decode_scale, max_dimension))
+        source = Task.ImageSourceT(workdir/"srcimg.png", "srcimg"); source.dimensions = dimensions
+        return (source, input_file, None)
+    return (MakeImageSources, calls)
+
+
+def Args(preview:bool, scales:list[str]) -> argparse.Namespace:
+    return argparse.Namespace(preview=preview, scales=[*scales], image_path=pathlib.Path("input.png"))
+
+
+def test_full_render_keeps_scales(monkeypatch, tmp_path):
+    (fake, calls) = FakeSources((1920, 1080))
+    monkeypatch.setattr(main, "MakeImageSources", fake)
+    args = Args(False, ["100%", "50%"])
+    (_, _, _, preprocess_scale) = main.CreateImageSources(args, tmp_path, None, 100, Presets.RENDER_PRESETS["balanced"])
+    assert (args.scales == ["100%", "50%"])
+    assert (preprocess_scale == 100)
+    assert (calls == [(None, 100, None)])
+
+
+def test_preview_replaces_scales(monkeypatch, tmp_path):
+    (fake, calls) = FakeSources((1920, 1080))
+    monkeypatch.setattr(main, "MakeImageSources", fake)
+    args = Args(True, ["100%", "50%"])
+    (_, _, _, preprocess_scale) = main.CreateImageSources(args, tmp_path, None, 100, Presets.RENDER_PRESETS["fast"])
+    assert (preprocess_scale == Presets.PreviewScale((1920, 1080)))
+    assert (args.scales == [f"{preprocess_scale}%"])
+    assert (calls == [(Presets.PREVIEW_FRAMES, 100, Presets.PREVIEW_MAX_DIMENSION)])
@@ -0,0 +1,72 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+import Kernels
+
+WHITE = numpy.array([1, 1, 1, 1], dtype=numpy.float32)
+
+
+def Pixels(*rgba:tuple[float,float,float,float]):
+    return numpy.array([rgba], dtype=numpy.float32)
+
+
+def test_im_fuzz_scales_rgb_distance():
+    # opaque pixels: IM6 compares 3x fuzz squared, so '-fuzz 10%' reaches an RGB-distance of ~0.173
+    near = Pixels((0.85, 1, 1, 1), (0.82, 1, 1, 1))
+    assert (Kernels.ColorMatch(near, WHITE, 0.10, "IM").tolist() == [[True, False]])
+    assert (Kernels.ColorMatch(near, WHITE, 0.10, "GM").tolist() == [[False, False]]) # GM: RGB-distance against fuzz
+
+
+def test_im_fuzz_rejects_alpha_difference():
+    pixels = Pixels((1, 1, 1, 0.95), (1, 1, 1, 0.85), (0, 0, 0, 0))
+    assert (Kernels.ColorMatch(pixels, WHITE, 0.10, "IM").tolist() == [[True, False, False]])
+    assert (Kernels.ColorMatch(pixels, WHITE, 0.99, "IM").tolist() == [[True, True, False]])
+    assert (Kernels.ColorMatch(pixels, WHITE, 1.00, "IM").tolist() == [[True, True, True]]) # fully transparent: alpha alone decides
+    assert (Kernels.ColorMatch(pixels, WHITE, 0.10, "GM").tolist() == [[True, True, False]]) # GM ignores alpha
+
+
+def test_im_zero_fuzz_is_half_a_quantum():
+    step = (1 / Kernels.QUANTUM)
+    pixels = Pixels((1, 1, 1, 1), (1 - step, 1, 1, 1), (1 - 2 * step, 1, 1, 1))
+    assert (Kernels.ColorMatch(pixels, WHITE, 0, "IM").tolist() == [[True, True, False]])
+    assert (Kernels.ColorMatch(pixels, WHITE, 0, "GM").tolist() == [[True, False, False]])
+
+
+def test_remap_kernel_recolors_within_fuzz():
+    base = Pixels((0.92, 0.92, 0.92, 1), (0.5, 0.5, 0.5, 1), (0.80, 0.80, 0.80, 1))
+    result = Kernels.RemapKernel(base, [("white", "0xFF0000FF", 0.10, None)], "IM")
+    numpy.testing.assert_allclose(result[0, 0], [1, 0, 0, 1])
+    numpy.testing.assert_allclose(result[0, 1:], base[0, 1:]) # outside fuzz: untouched
+
+
+def test_box_sum_matches_replicated_neighborhood():
+    plane = numpy.random.default_rng(3).random((9, 13))
+    padded = numpy.pad(plane, 2, mode='edge')
+    expected = numpy.array([[padded[Y:Y+5, X:X+5].sum() for X in range(13)] for Y in range(9)])
+    numpy.testing.assert_allclose(Kernels.BoxSum(plane, 2), expected)
+    numpy.testing.assert_allclose(Kernels.BoxSum(numpy.stack([plane, plane]), 2), numpy.stack([expected, expected])) # stacked frames
+
+
+def test_tile_grid_writes_every_pixel_once():
+    (width, height) = (70, 45)
+    coverage = numpy.zeros((height, width), dtype=int)
+    for ((rows, columns), (tile_rows, tile_columns)) in Kernels.TileGrid(width, height, 16, 3):
+        coverage[tile_rows, tile_columns] += 1
+        assert ((rows.start == max(0, tile_rows.start - 3)) and (rows.stop == min(height, tile_rows.stop + 3)))
+        assert ((columns.start == max(0, tile_columns.start - 3)) and (columns.stop == min(width, tile_columns.stop + 3)))
+    assert (coverage == 1).all()
+
+
+@pytest.mark.parametrize("library", ["IM", "GM"])
+def test_tiles_match_whole_image(tmp_path, library:str):
+    rng = numpy.random.default_rng(11)
+    image = rng.random((50, 70, 4)).astype(numpy.float32); image[..., 3] = (rng.random((50, 70)) > 0.2)
+    source = Kernels.RasterT((tmp_path / "source.rgba"), 70, 50, mode='w+'); source.pixels[:] = Kernels.Quantize(image)
+    remaps = [("white", "0xFF0000FF", 0.2, 0.9), ("black", "0x0000FFFF", 0.1, None)]
+    kernels = [((lambda pixels: Kernels.EdgeKernel(pixels, "0x00FF00FF", 2, library)), 2), ((lambda pixels: Kernels.RemapKernel(pixels, remaps, library, atop=True)), 0)]
+    with Kernels.ThreadPoolExecutor(max_workers=4) as pool:
+        for (index, (kernel, overlap)) in enumerate(kernels):
+            whole = Kernels.Quantize(kernel(source.Read(slice(None), slice(None))))
+            tiled = Kernels.RasterT((tmp_path / f"tiled{index}.rgba"), 70, 50, mode='w+')
+            Kernels.RenderTiles((lambda rows, columns: kernel(source.Read(rows, columns))), tiled, 16, overlap, pool)
+            numpy.testing.assert_array_equal(tiled.pixels, whole)
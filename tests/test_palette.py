@@ -0,0 +1,43 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+import Palette
+
+PRIMARIES = numpy.array([[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 1]], dtype=numpy.float32)
+
+
+def Samples(colors, repeats:list[int]):
+    return numpy.repeat(colors, repeats, axis=0)
+
+
+def test_median_cut_separates_distinct_colors():
+    palette = Palette.MedianCut(PRIMARIES, numpy.array([1, 2, 3, 4], dtype=numpy.float64), 4)
+    assert (sorted(map(tuple, palette.tolist())) == sorted(map(tuple, PRIMARIES.tolist())))
+
+
+def test_median_cut_stops_at_distinct_colors():
+    colors = numpy.array([[0.25, 0.5, 0.75]] * 3, dtype=numpy.float32)
+    palette = Palette.MedianCut(colors, numpy.ones(3), 8)
+    assert (len(palette) == 1)
+    numpy.testing.assert_allclose(palette[0], [0.25, 0.5, 0.75], atol=1e-6)
+
+
+def test_quantize_finds_bin_centers_of_few_colors():
+    palette = Palette.Quantize(Samples(PRIMARIES, [10, 20, 30, 40]), 16)
+    assert (len(palette) == len(PRIMARIES))
+    for color in PRIMARIES: assert (numpy.abs(palette - color).max(axis=-1).min() < (1 / (1 << Palette.BIN_BITS)));
+
+
+def test_quantize_is_deterministic():
+    samples = numpy.random.default_rng(7).random((5000, 3), dtype=numpy.float32)
+    numpy.testing.assert_array_equal(Palette.Quantize(samples, 32), Palette.Quantize(samples, 32))
+    assert (len(Palette.Quantize(samples, 32)) == 32)
+
+
+def test_map_uses_nearest_opaque_entry_and_transparent_index():
+    palette = Palette.PaletteT([[255, 0, 0], [0, 0, 255], [0, 0, 0]], transparent=2)
+    pixels = numpy.array([[[0.9, 0.1, 0.1, 1], [0.1, 0.1, 0.8, 1], [0.05, 0.05, 0.2, 1], [0.9, 0.1, 0.1, 0.2]]], dtype=numpy.float32)
+    assert (palette.Map(pixels, palette.Lookup()).tolist() == [[0, 1, 1, 2]]) # black is only the transparent entry; never used for opaque pixels
+    rgba = palette.RGBA()
+    assert (rgba.shape == (1, 3, 4))
+    assert (rgba[0, :, 3].tolist() == [1, 1, 0])
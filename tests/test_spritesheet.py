@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import SpriteSheet
+
+
+@pytest.mark.parametrize(("frame_count", "size", "grid"), [
+    (1, (64, 64), (1, 1)),
+    (12, (64, 64), (3, 4)),
+    (16, (64, 64), (4, 4)),
+    (6, (64, 64), (2, 3)),
+    (10, (64, 64), (2, 5)), # exact grid; less square than 3x4, but within 'ASPECT_TOLERANCE'
+    (7, (64, 64), (3, 3)), # prime; the exact grids (1x7, 7x1) are far from square, so two cells stay empty
+    (4, (200, 50), (1, 4)), # wide frames stack vertically
+    (4, (50, 200), (4, 1)),
+])
+def test_grid_shape(frame_count:int, size:tuple[int,int], grid:tuple[int,int]):
+    assert (SpriteSheet.GridShape(frame_count, *size) == grid)
+
+
+@pytest.mark.parametrize("frame_count", range(1, 50))
+def test_grid_fits_every_frame_without_empty_rows(frame_count:int):
+    (columns, rows) = SpriteSheet.GridShape(frame_count, 48, 32)
+    assert ((columns * rows) >= frame_count)
+    assert ((columns * (rows - 1)) < frame_count)
+    if (frame_count % columns) != 0: # empty cells only when no exact grid is close enough to square
+        squarest = max((columns * 48) / (rows * 32), (rows * 32) / (columns * 48))
+        for exact in [C for C in range(1, frame_count + 1) if (frame_count % C) == 0]:
+            (width, height) = ((exact * 48), ((frame_count // exact) * 32))
+            assert (max((width / height), (height / width)) > (squarest * SpriteSheet.ASPECT_TOLERANCE))
+
+
+def test_write_sheet_index(monkeypatch, tmp_path):
+    """ frames are tiled in name-order, row-major; the index matches the grid passed to 'BuildSheet' """
+    for number in (3, 0, 4, 1, 2, 6, 5): (tmp_path / f"frame{number:03}.miff").touch();
+    (tmp_path / "other.png").touch()
+    built = []
+    monkeypatch.setattr(SpriteSheet.Kernels, "Geometry", lambda library, spec: (30, 20))
+    monkeypatch.setattr(SpriteSheet, "BuildSheet", lambda *args: built.append(args))
+    output = (tmp_path / f"out.{SpriteSheet.SHEET_SUFFIX}")
+    SpriteSheet.WriteSheet("IM", 7, f"MIFF:{tmp_path / 'frame*.miff'}", output)
+    
+    [(library, frame_format, frames, columns, rows, output_path)] = built
+    assert ((library, frame_format, output_path) == ("IM", "MIFF", output))
+    assert ([F.name for F in frames] == [f"frame{N:03}.miff" for N in range(7)])
+    assert ((columns, rows) == SpriteSheet.GridShape(7, 30, 20) == (2, 4)) # 60x80 is squarer than 90x60
+    
+    index = json.loads(SpriteSheet.IndexPath(output).read_text())
+    assert (SpriteSheet.IndexPath(output).name == "out.sheet.json")
+    assert ((index["image"], index["frame_count"], index["frame_width"], index["frame_height"]) == ("out.sheet.png", 7, 30, 20))
+    assert ((index["columns"], index["rows"], index["duration_ms"], index["loop"]) == (2, 4, 70, True))
+    assert ([(F["x"], F["y"]) for F in index["frames"]] == [(0, 0), (30, 0), (0, 20), (30, 20), (0, 40), (30, 40), (0, 60)])
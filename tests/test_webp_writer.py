@@ -0,0 +1,63 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+features = pytest.importorskip("PIL.features")
+import WebpWriter
+
+# Pillow's WebP encoder stands in for the per-frame magick processes; Pillow also decodes the muxed animation
+pytestmark = pytest.mark.skipif(not features.check("webp"), reason="Pillow built without WebP")
+
+
+def Stills(tmp_path, count:int, size:tuple[int,int], alpha:bool, lossless:bool, seed:int):
+    """ :return: the encoded still-paths, and the RGBA of every frame """
+    rng = numpy.random.default_rng(seed); (paths, expected) = ([], [])
+    for number in range(count):
+        pixels = numpy.zeros((size[1], size[0], 4), dtype=numpy.uint8)
+        pixels[..., :3] = rng.integers(0, 256, 3, dtype=numpy.uint8) # flat color per frame; survives lossy encoding (nearly) unchanged
+        pixels[:, (size[0] // 2):, :3] = rng.integers(0, 256, 3, dtype=numpy.uint8)
+        pixels[..., 3] = 255
+        if alpha: pixels[:(size[1] // 2), :, 3] = 0;
+        image = Image.fromarray(pixels, mode="RGBA")
+        if not alpha: image = image.convert("RGB");
+        path = tmp_path / f"frame{number:02}.webp"
+        image.save(path, format="WEBP", lossless=lossless, quality=(100 if lossless else WebpWriter.LOSSY_QUALITY), exact=True)
+        paths.append(path); expected.append(pixels)
+    return (paths, expected)
+
+
+@pytest.mark.parametrize("lossless", [True, False])
+@pytest.mark.parametrize("alpha", [False, True])
+def test_muxed_stills_decode(tmp_path, lossless:bool, alpha:bool):
+    size = (34, 20) # even dimensions; lossy chroma is subsampled in 2x2 blocks
+    (paths, expected) = Stills(tmp_path, 4, size, alpha, lossless, seed=(2 * lossless + alpha))
+    frames = [WebpWriter.FrameT(P) for P in paths]
+    assert all([((F.width, F.height) == size) for F in frames])
+    assert all([(F.has_alpha == alpha) for F in frames])
+    
+    output = (tmp_path / "out.webp")
+    WebpWriter.Mux(frames, 70, output)
+    with Image.open(output) as decoded:
+        assert (decoded.size == size)
+        assert (decoded.n_frames == len(paths))
+        assert (decoded.info["loop"] == WebpWriter.LOOP_FOREVER)
+        for (number, pixels) in enumerate(expected):
+            decoded.seek(number)
+            rgba = numpy.asarray(decoded.convert("RGBA")).astype(int) # loads the frame; sets its 'duration'
+            assert (decoded.info["duration"] == 70)
+            numpy.testing.assert_array_equal(rgba[..., 3], pixels[..., 3])
+            opaque = (pixels[..., 3] > 0)
+            tolerance = (0 if lossless else 8) # lossy: block-edges between the two colors are slightly off
+            inner = opaque.copy(); inner[:, (size[0] // 2 - 4):(size[0] // 2 + 4)] = False
+            assert (numpy.abs(rgba[inner][:, :3] - pixels[inner][:, :3]).max() <= tolerance)
+
+
+def test_frames_replace_the_canvas(tmp_path):
+    """ 'NO_BLEND': a transparent pixel in a later frame is transparent; the previous frame doesn't show through """
+    (paths, expected) = Stills(tmp_path, 2, (16, 16), alpha=True, lossless=True, seed=5)
+    expected[0][..., 3] = 255; Image.fromarray(expected[0], mode="RGBA").save(paths[0], format="WEBP", lossless=True, exact=True)
+    output = (tmp_path / "out.webp")
+    WebpWriter.Mux([WebpWriter.FrameT(P) for P in paths], 40, output)
+    with Image.open(output) as decoded:
+        decoded.seek(1)
+        numpy.testing.assert_array_equal(numpy.asarray(decoded.convert("RGBA"))[..., 3], expected[1][..., 3])